@@ -0,0 +1,173 @@
+"""
+Chat archive benchmark: space saved and restore latency.
+
+Seeds idle chats of synthetic messages (with their search postings),
+archives them with ``ChatService.archive_chat`` and reports the size of the
+message and search tables before and after, the compressed archive size and
+the latency of restoring archived chats.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=benchmarks.settings BENCH_DB=/tmp/archive.sqlite3 \\
+        python -m benchmarks.archive --chats 500 --messages 200
+
+Archives are written to --storage-dir (a temporary directory by default)
+instead of the archive bucket, so MinIO is not needed. On MySQL, InnoDB only
+returns the freed pages after ``OPTIMIZE TABLE``.
+"""
+
+# Standard library
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+# Django / third-party
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.files.storage import FileSystemStorage  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+# Local app imports
+from chat import services  # noqa: E402
+from chat.archive import ChatArchive  # noqa: E402
+from chat.models import Chat, Message, SearchPosting  # noqa: E402
+
+from .search import percentiles, vocabulary  # noqa: E402
+
+TABLES = [Message._meta.db_table, SearchPosting._meta.db_table]
+
+
+# Archives in a local directory
+class LocalArchive(ChatArchive):
+    def open(self, key):
+        return self.storage.open(key, "rb")
+
+
+# Holds background indexing until run() (SQLite allows a single writer), so
+# it is timed apart from the restore
+class DeferredExecutor:
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        self.calls.append((fn, args))
+
+    def run(self):
+        calls, self.calls = self.calls, []
+        for fn, args in calls:
+            fn(*args)
+
+
+def table_bytes():
+    # Pages used by the message and search tables, indexes included
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                "(SELECT name FROM sqlite_master WHERE tbl_name IN (%s, %s))",
+                TABLES,
+            )
+        else:
+            cursor.execute(
+                "SELECT SUM(data_length + index_length) FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name IN (%s, %s)",
+                TABLES,
+            )
+        return cursor.fetchone()[0] or 0
+
+
+def seed(args, rng, words, index):
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    user, _ = get_user_model().objects.get_or_create(username="bench-archive")
+    Chat.objects.filter(user=user).delete()
+    chats = Chat.objects.bulk_create(
+        Chat(user=user, title=f"bench-archive {i}") for i in range(args.chats)
+    )
+    for chat in chats:
+        messages = Message.objects.bulk_create(
+            Message(
+                chat=chat,
+                role="user" if i % 2 == 0 else "assistant",
+                content=" ".join(rng.choices(words, cum_weights=weights, k=args.words)),
+            )
+            for i in range(args.messages)
+        )
+        SearchPosting.objects.bulk_create(
+            posting
+            for message in messages
+            for posting in index.postings(user.id, chat.id, message.id, message.content)
+        )
+    # Idle for a year
+    Chat.objects.filter(user=user).update(updated_at=timezone.now() - timedelta(days=365))
+    return list(Chat.objects.filter(user=user))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=200, help="Per chat.")
+    parser.add_argument("--words", type=int, default=40, help="Per message.")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--restores", type=int, default=50)
+    parser.add_argument("--storage-dir", default="")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    call_command("migrate", verbosity=0)
+    chat_service = services.ChatService()
+    services.archive_index_executor = executor = DeferredExecutor()
+    storage_dir = args.storage_dir or tempfile.mkdtemp(prefix="chat-archive-")
+    chat_service.archive = LocalArchive(FileSystemStorage(location=storage_dir))
+
+    started = time.perf_counter()
+    chats = seed(args, rng, vocabulary(args.vocabulary, rng), chat_service.search)
+    print(
+        f"seeded {len(chats)} chats x {args.messages} messages "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    before = table_bytes()
+
+    started = time.perf_counter()
+    raw = compressed = 0
+    for chat in chats:
+        stats = chat_service.archive_chat(chat, timezone.now() - timedelta(days=1))
+        raw += stats["raw_bytes"]
+        compressed += stats["compressed_bytes"]
+    elapsed = time.perf_counter() - started
+    after = table_bytes()
+    print(
+        f"archived in {elapsed:.1f}s ({elapsed / len(chats) * 1000:.1f}ms/chat): "
+        f"tables {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB, "
+        f"JSONL {raw / 2**20:.1f} MiB -> zstd {compressed / 2**20:.1f} MiB "
+        f"({raw / compressed:.1f}x)"
+    )
+
+    timings = []
+    index_timings = []
+    for chat in rng.sample(chats, min(args.restores, len(chats))):
+        start = time.perf_counter()
+        restored = chat_service.restore_chat(chat)
+        timings.append(time.perf_counter() - start)
+        assert restored == args.messages, restored
+        start = time.perf_counter()
+        executor.run()
+        index_timings.append(time.perf_counter() - start)
+    print(
+        f"{'restore':<8} chats={len(timings):<5} {percentiles(timings)} "
+        f"({args.messages} messages each)"
+    )
+    print(f"{'reindex':<8} chats={len(index_timings):<5} {percentiles(index_timings)}")
+
+
+if __name__ == "__main__":
+    main()
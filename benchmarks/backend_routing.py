@@ -0,0 +1,143 @@
+"""
+LLM backend routing check against local fake LLM servers.
+
+Starts a fast and a slow fake server and points one backend at a closed port,
+then measures time-to-first-token through LLMRouter for failover (dead
+backend first), hedging (slow backend first, duplicate after --hedge-after)
+and latency-aware ordering, for both the sync and the async path.
+
+Usage:
+    python -m benchmarks.backend_routing --requests 20 --hedge-after 0.2
+"""
+
+# Standard library
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+# Django / third-party
+import django
+
+django.setup()
+
+# Local imports
+from chat.backends import LLMRouter, build_backend  # noqa: E402
+from .fake_llm import start_in_thread  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def backends(fast, slow):
+    return [
+        build_backend({"name": "dead", "kind": "local", "base_url": f"http://127.0.0.1:{closed_port()}/v1"}),
+        build_backend({"name": "slow", "kind": "local", "base_url": f"{slow.base_url}/v1"}),
+        build_backend({"name": "fast", "kind": "openai", "base_url": f"{fast.base_url}/v1", "api_key": "fake"}),
+        build_backend({"name": "groq", "kind": "groq", "base_url": fast.base_url, "api_key": "fake"}),
+    ]
+
+
+def report(name, router, ttfts, servers):
+    served = " ".join(f"{label}={server.requests}" for label, server in servers.items())
+    print(
+        f"{name:<16} ttft_p50={statistics.median(ttfts) * 1000:7.1f}ms "
+        f"ttft_max={max(ttfts) * 1000:7.1f}ms requests: {served}"
+    )
+    for backend, health in router.stats().items():
+        if health["successes"] or health["failures"] or health["hedges"]:
+            print(f"    {backend:<6} {health}")
+
+
+def run_sync(name, route, servers, requests, hedge_after=0):
+    router = LLMRouter(
+        backends(servers["fast"], servers["slow"]),
+        routes={"fake": route},
+        hedge_after=hedge_after,
+    )
+    for server in servers.values():
+        server.requests = 0
+    ttfts = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        stream = router.stream(list(MESSAGES), "fake")
+        next(stream)
+        ttfts.append(time.perf_counter() - start)
+        for _content in stream:
+            pass
+    time.sleep(0.5)
+    report(name, router, ttfts, servers)
+
+
+async def run_async(name, route, servers, requests, hedge_after=0):
+    router = LLMRouter(
+        backends(servers["fast"], servers["slow"]),
+        routes={"fake": route},
+        hedge_after=hedge_after,
+    )
+    for server in servers.values():
+        server.requests = 0
+
+    async def one_stream():
+        start = time.perf_counter()
+        ttft = None
+        async for _content in router.astream(list(MESSAGES), "fake"):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+        return ttft
+
+    ttfts = await asyncio.gather(*(one_stream() for _ in range(requests)))
+    await asyncio.sleep(0.5)
+    report(name, router, ttfts, servers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--hedge-after", type=float, default=0.2)
+    parser.add_argument("--slow-ttft", type=float, default=1.0)
+    parser.add_argument("--fast-ttft", type=float, default=0.05)
+    args = parser.parse_args()
+
+    servers = {
+        "fast": start_in_thread(port=0, ttft=args.fast_ttft, tps=500, tokens=16),
+        "slow": start_in_thread(port=0, ttft=args.slow_ttft, tps=500, tokens=16),
+    }
+    ordered = {"strategy": "ordered"}
+    try:
+        run_sync("failover", {**ordered, "backends": ["dead", "fast"]}, servers, args.requests)
+        run_sync("failover-groq", {**ordered, "backends": ["dead", "groq"]}, servers, args.requests)
+        run_sync("no-hedge", {**ordered, "backends": ["slow", "fast"]}, servers, args.requests)
+        run_sync(
+            "hedged",
+            {**ordered, "backends": ["slow", "fast"]},
+            servers,
+            args.requests,
+            hedge_after=args.hedge_after,
+        )
+        run_sync("latency-aware", {"backends": ["slow", "fast"]}, servers, args.requests)
+        asyncio.run(
+            run_async(
+                "async-hedged",
+                {**ordered, "backends": ["dead", "slow", "fast"]},
+                servers,
+                args.requests,
+                hedge_after=args.hedge_after,
+            )
+        )
+    finally:
+        for server in servers.values():
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
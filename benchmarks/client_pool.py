@@ -0,0 +1,90 @@
+"""
+LLM client pooling check against the local fake LLM server.
+
+Runs the same burst of completions through a fresh Groq client per request
+(the old behaviour) and through AIModelManager's shared pooled client, and
+reports TCP connections opened, latency and the pool statistics.
+
+Usage:
+    python -m benchmarks.client_pool --requests 200 --concurrency 20
+"""
+
+# Standard library
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+# Django / third-party
+import django
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from groq import Groq  # noqa: E402
+
+# Local imports
+from chat import ai_models, backends  # noqa: E402
+from .fake_llm import start_in_thread  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+def burst(name, server, create, requests, concurrency):
+    before = server.connections
+    timings = []
+
+    def one_request(_):
+        start = time.perf_counter()
+        for _chunk in create():
+            pass
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(requests)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<8} requests={requests:<5} connections={server.connections - before:<5} "
+        f"wall={elapsed:6.2f}s p50={statistics.median(timings) * 1000:7.1f}ms "
+        f"p99={sorted(timings)[int(len(timings) * 0.99) - 1] * 1000:7.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    server = start_in_thread(port=0, ttft=0.01, tps=2000, tokens=16)
+    settings.LLM_BASE_URL = server.base_url
+
+    try:
+        burst(
+            "fresh",
+            server,
+            lambda: Groq(base_url=server.base_url, api_key="fake").chat.completions.create(
+                model="fake", messages=MESSAGES, stream=True
+            ),
+            args.requests,
+            args.concurrency,
+        )
+        manager = ai_models.AIModelManager()
+        burst(
+            "pooled",
+            server,
+            lambda: manager.stream_chat(list(MESSAGES)),
+            args.requests,
+            args.concurrency,
+        )
+        print("pool", backends.pool_stats())
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Chat export/import benchmark: NDJSON throughput and export memory.
+
+Seeds one user's chats, streams them through ``ChatExporter`` into a
+gzipped NDJSON file (reporting peak Python memory, which should not grow
+with the history) and imports the file into a second user with
+``manage.py import_chats``.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=benchmarks.settings BENCH_DB=/tmp/export.sqlite3 \\
+        python -m benchmarks.export_import --messages 1000000
+"""
+
+# Standard library
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+# Django / third-party
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+
+# Local app imports
+from chat.archive import ChatArchive  # noqa: E402
+from chat.exports import ChatExporter, gzip_stream  # noqa: E402
+from chat.models import Chat, Message  # noqa: E402
+
+from .search import vocabulary  # noqa: E402
+
+
+def seed(args, rng, words):
+    user, _ = get_user_model().objects.get_or_create(username="bench-export")
+    existing = Message.objects.filter(chat__user=user).count()
+    chats = Chat.objects.bulk_create(
+        Chat(user=user, title=" ".join(rng.choices(words, k=4)))
+        for _ in range(max(0, args.messages - existing) // args.chat_size)
+    )
+    batch = []
+    for i in range(len(chats) * args.chat_size):
+        batch.append(
+            Message(
+                chat=chats[i // args.chat_size],
+                role="user" if i % 2 == 0 else "assistant",
+                content=" ".join(rng.choices(words, k=args.words)),
+            )
+        )
+        if len(batch) == 5000:
+            Message.objects.bulk_create(batch)
+            batch = []
+    Message.objects.bulk_create(batch)
+    return user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--chat-size", type=int, default=50)
+    parser.add_argument("--words", type=int, default=30)
+    parser.add_argument("--output", default="")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    call_command("migrate", verbosity=0)
+    started = time.perf_counter()
+    user = seed(args, rng, vocabulary(5000, rng))
+    count = Message.objects.filter(chat__user=user).count()
+    print(f"seeded {count} messages in {time.perf_counter() - started:.1f}s")
+
+    output = args.output or os.path.join(tempfile.mkdtemp(), "chats.ndjson.gz")
+    started = time.perf_counter()
+    with open(output, "wb") as stream:
+        for chunk in gzip_stream(ChatExporter(ChatArchive()).lines(user.id)):
+            stream.write(chunk)
+    elapsed = time.perf_counter() - started
+    print(
+        f"export  {elapsed:7.1f}s {count / elapsed:9.0f} messages/s "
+        f"{os.path.getsize(output) / 2**20:.1f} MiB gzipped"
+    )
+    # Second pass for memory, as tracemalloc slows the export down
+    tracemalloc.start()
+    for _ in gzip_stream(ChatExporter(ChatArchive()).lines(user.id)):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"export  peak Python memory {peak / 2**20:.1f} MiB")
+
+    target, _ = get_user_model().objects.get_or_create(username="bench-import")
+    Chat.objects.filter(user=target).delete()
+    started = time.perf_counter()
+    call_command("import_chats", output, user=target.username, skip_index=True)
+    elapsed = time.perf_counter() - started
+    imported = Message.objects.filter(chat__user=target).count()
+    print(f"import  {elapsed:7.1f}s {imported / elapsed:9.0f} messages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Local OpenAI/Groq-compatible fake LLM server for benchmarks.
+
+Serves ``POST .../chat/completions`` (both ``/openai/v1`` as used by the Groq
+SDK and plain ``/v1``) with configurable time-to-first-token and tokens/sec,
+so load tests never touch the real Groq API. A share of requests can fail
+with an HTTP error (``--error-rate``) or have their stream cut off after a
+random number of tokens (``--drop-rate``).
+
+Usage:
+    python -m benchmarks.fake_llm --port 8808 --ttft 0.2 --tps 80 --error-rate 0.01
+    LLM_BASE_URL=http://127.0.0.1:8808 GROQ_API_KEY=fake ...
+"""
+
+# Standard library
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+import threading
+import time
+import uuid
+
+
+class FakeLLMServer:
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=8808,
+        ttft=0.2,
+        tps=80.0,
+        tokens=64,
+        error_rate=0.0,
+        drop_rate=0.0,
+        error_status=500,
+        seed=None,
+    ):
+        self.host = host
+        self.port = port
+        self.ttft = ttft
+        self.tps = tps
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.drops = 0
+        self.connections = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def handle(self, reader, writer):
+        # Keep-alive loop: one connection may carry many requests
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b"{}"
+                self.requests += 1
+
+                if method != "POST" or not path.rstrip("/").endswith(
+                    "/chat/completions"
+                ):
+                    self.write_json(writer, 404, {"error": {"message": "not found"}})
+                    await writer.drain()
+                    continue
+
+                payload = json.loads(body)
+                if self.rng.random() < self.error_rate:
+                    self.errors += 1
+                    await asyncio.sleep(self.ttft)
+                    self.write_json(writer, self.error_status, self.error())
+                    await writer.drain()
+                elif payload.get("stream"):
+                    if not await self.stream_completion(writer, payload):
+                        break
+                else:
+                    await asyncio.sleep(self.ttft + self.tokens / self.tps)
+                    self.write_json(writer, 200, self.completion(payload))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def write_json(self, writer, status, data):
+        body = json.dumps(data).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+
+    def error(self):
+        return {"error": {"message": "Fake LLM error", "type": "server_error"}}
+
+    def write_chunk(self, writer, data):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    def completion(self, payload):
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": " ".join(["token"] * self.tokens),
+                    },
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 0,
+                "completion_tokens": self.tokens,
+                "total_tokens": self.tokens,
+            },
+        }
+
+    async def stream_completion(self, writer, payload):
+        # Returns False when the connection was dropped mid-stream
+        drop_at = self.tokens
+        if self.rng.random() < self.drop_rate:
+            self.drops += 1
+            drop_at = self.rng.randrange(self.tokens)
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        await writer.drain()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        await asyncio.sleep(self.ttft)
+        for i in range(self.tokens):
+            if i == drop_at:
+                return False
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": payload.get("model", "fake"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": "token " if i else "token"},
+                        "finish_reason": None,
+                    }
+                ],
+            }
+            self.write_chunk(writer, f"data: {json.dumps(chunk)}\n\n".encode())
+            await writer.drain()
+            await asyncio.sleep(1 / self.tps)
+        self.write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return True
+
+
+def start_in_thread(**options):
+    # Run a server on its own event loop thread, for benchmarks using sync clients
+    loop = asyncio.new_event_loop()
+    server = FakeLLMServer(**options)
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+
+    thread = threading.Thread(target=run, name="fake-llm", daemon=True)
+    thread.start()
+    ready.wait()
+
+    def shutdown():
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    server.shutdown = shutdown
+    return server
+
+
+def _serve_process(options, ready):
+    async def run():
+        await FakeLLMServer(**options).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+def start_in_process(**options):
+    # Run a server in a separate process so it does not compete with the
+    # benchmarked client for the GIL/event loop; returns (base_url, process)
+    if not options.get("port"):
+        with socket.socket() as sock:
+            sock.bind((options.get("host", "127.0.0.1"), 0))
+            options["port"] = sock.getsockname()[1]
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    process = context.Process(target=_serve_process, args=(options, ready), daemon=True)
+    process.start()
+    ready.wait()
+    return f"http://{options.get('host', '127.0.0.1')}:{options['port']}", process
+
+
+async def serve(args):
+    server = await FakeLLMServer(
+        args.host,
+        args.port,
+        args.ttft,
+        args.tps,
+        args.tokens,
+        args.error_rate,
+        args.drop_rate,
+        args.error_status,
+    ).start()
+    print(f"Fake LLM listening on {server.base_url}")
+    await server.server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds")
+    parser.add_argument("--tps", type=float, default=80.0, help="tokens per second")
+    parser.add_argument("--tokens", type=int, default=64, help="tokens per answer")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of requests failing"
+    )
+    parser.add_argument(
+        "--drop-rate", type=float, default=0.0, help="share of streams cut off"
+    )
+    parser.add_argument("--error-status", type=int, default=500)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
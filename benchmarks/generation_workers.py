@@ -0,0 +1,124 @@
+"""
+Generation worker pool check: Redis job queue throughput and fairness.
+
+Enqueues jobs through GenerationQueue and drains them with run_worker, each
+job streaming one answer from the fake LLM server (in its own process)
+through LLMRouter. Reports jobs/s as worker threads grow, then a fairness
+run where one heavy user queues a burst ahead of several light users.
+Needs the Redis from the Django settings (REDIS_HOST/REDIS_PORT).
+
+Usage:
+    python -m benchmarks.generation_workers --jobs 64 --threads 1 2 4 8 16
+"""
+
+# Standard library
+import argparse
+import os
+import statistics
+import threading
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+# Django / third-party
+import django
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+
+# Local imports
+from chat.backends import LLMRouter, build_backend  # noqa: E402
+from chat.jobs import GenerationQueue, run_worker  # noqa: E402
+from .fake_llm import start_in_process  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+def clear(generation_queue):
+    keys = list(generation_queue.redis.scan_iter(f"{generation_queue.prefix}*"))
+    if keys:
+        generation_queue.redis.delete(*keys)
+
+
+def drain(router, jobs, threads):
+    # Run workers until `jobs` handlers finished; returns {user: [finish times]}
+    start = time.perf_counter()
+    finished = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def handler(payload):
+        for _content in router.stream(list(MESSAGES), "fake"):
+            pass
+        with lock:
+            finished.setdefault(payload["user"], []).append(time.perf_counter() - start)
+            if sum(len(times) for times in finished.values()) == jobs:
+                stop.set()
+
+    def fail(payload, error):
+        raise RuntimeError(error)
+
+    run_worker(handler, fail, threads, stop, poll=0.1)
+    return time.perf_counter() - start, finished
+
+
+def run_throughput(router, jobs, threads):
+    settings.GENERATION_USER_CONCURRENCY = 0
+    generation_queue = GenerationQueue()
+    clear(generation_queue)
+    for i in range(jobs):
+        user = i % 16
+        generation_queue.enqueue(user, "fake", {"user": user})
+    elapsed, _finished = drain(router, jobs, threads)
+    print(f"threads={threads:<4} jobs={jobs:<5} wall={elapsed:6.2f}s jobs/s={jobs / elapsed:7.1f}")
+
+
+def run_fairness(router, heavy_jobs, light_users, threads, user_limit):
+    settings.GENERATION_USER_CONCURRENCY = user_limit
+    generation_queue = GenerationQueue()
+    clear(generation_queue)
+    for _ in range(heavy_jobs):
+        generation_queue.enqueue("heavy", "fake", {"user": "heavy"})
+    for i in range(light_users):
+        for _ in range(2):
+            generation_queue.enqueue(f"light-{i}", "fake", {"user": f"light-{i}"})
+    elapsed, finished = drain(router, heavy_jobs + 2 * light_users, threads)
+
+    light = [max(times) for user, times in finished.items() if user != "heavy"]
+    print(
+        f"fairness user_limit={user_limit or 'none':<4} wall={elapsed:6.2f}s "
+        f"light_done_p50={statistics.median(light):6.2f}s "
+        f"light_done_max={max(light):6.2f}s heavy_done={max(finished['heavy']):6.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=64)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--heavy-jobs", type=int, default=40)
+    parser.add_argument("--light-users", type=int, default=4)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tps", type=float, default=200.0)
+    parser.add_argument("--tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    base_url, server = start_in_process(ttft=args.ttft, tps=args.tps, tokens=args.tokens)
+    router = LLMRouter(
+        [build_backend({"name": "fake", "kind": "local", "base_url": f"{base_url}/v1"})]
+    )
+    try:
+        for threads in args.threads:
+            run_throughput(router, args.jobs, threads)
+        # FIFO would finish every heavy job before the first light one;
+        # round-robin plus the per-user limit lets light users through early
+        for user_limit in (0, 2):
+            run_fairness(router, args.heavy_jobs, args.light_users, 4, user_limit)
+    finally:
+        clear(GenerationQueue())
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
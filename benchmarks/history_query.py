@@ -0,0 +1,94 @@
+"""
+Chat history query benchmark over a seeded long chat.
+
+Compares the old full-load history (``list(all())[-10:]``) with the tail
+query and the token-budget variant of ``ChatService``, reporting per-request
+latency and peak Python memory.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=benchmarks.settings \\
+        python -m benchmarks.history_query --messages 100000
+"""
+
+# Standard library
+import argparse
+import os
+import statistics
+import time
+import tracemalloc
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+# Django / third-party
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+
+# Local app imports
+from chat.models import Chat, Message  # noqa: E402
+from chat.services import ChatService  # noqa: E402
+
+
+def seed(count, content_size):
+    user, _ = get_user_model().objects.get_or_create(username="bench-history")
+    chat, _ = Chat.objects.get_or_create(user=user, title="bench-history")
+    existing = chat.messages.count()
+    body = "x" * content_size
+    batch = []
+    for i in range(existing, count):
+        role = "user" if i % 2 == 0 else "assistant"
+        batch.append(Message(chat=chat, role=role, content=f"{i} {body}"))
+        if len(batch) == 5000:
+            Message.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Message.objects.bulk_create(batch)
+    return chat
+
+
+def measure(name, func, repeat):
+    timings = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<16} rows={len(result):<5} "
+        f"p50={statistics.median(timings) * 1000:9.2f}ms "
+        f"max={max(timings) * 1000:9.2f}ms peak_mem={peak / 1024 / 1024:8.2f}MiB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--content-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=2000)
+    args = parser.parse_args()
+
+    call_command("migrate", verbosity=0)
+    chat = seed(args.messages, args.content_size)
+    service = ChatService()
+
+    measure(
+        "full-load",
+        lambda: list(chat.messages.all().order_by("created_at"))[-10:],
+        max(1, args.repeat // 10),
+    )
+    measure("tail", lambda: service.get_chat_history(chat), args.repeat)
+    measure(
+        "token-budget",
+        lambda: service.get_chat_history_by_tokens(chat, args.tokens),
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
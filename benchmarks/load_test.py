@@ -0,0 +1,559 @@
+"""
+End-to-end load test: logins, chat creation, streamed answers and uploads.
+
+Runs the app on a threaded WSGI server (SQLite, benchmarks.settings) in one
+process and the fake LLM server in another, then drives --users virtual users
+over HTTP from this one. Each logs in, then for every chat posts the first
+prompt to ``create_chat`` and streams the answer from ``ChatStreamView``
+(with a text file every --upload-every turns), as chat.html does, followed
+by --turns - 1 more streamed turns in the same chat. Reports:
+
+- throughput and latency percentiles per step, time to first token and
+  full stream time, and stream outcomes (done / error / HTTP status)
+- DB queries per request by view (the webai_db_queries histogram scraped
+  from /metrics) and per generation, counted in the generation threads
+- server RSS growth per concurrent stream
+
+Redis is a fakeredis TCP server in a third process by default (``pip install
+fakeredis lupa``; ``--redis local`` uses REDIS_HOST/REDIS_PORT instead), so
+Redis-bound steps are slower than against a real Redis. Uploads are saved to
+a local directory.
+Settings such as GENERATION_QUEUE or SSE_COMPACT are read from the
+environment; with GENERATION_QUEUE the generation workers run as threads of
+the server process.
+
+Usage:
+    python -m benchmarks.load_test --users 50 --chats 2 --turns 3 --error-rate 0.02
+"""
+
+# Standard library
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Django / third-party
+import httpx
+
+# Local imports
+from .fake_llm import start_in_process
+from .stream_capacity import percentile
+
+PASSWORD = "load-test-password"
+FINAL_EVENTS = {"done", "error", "cancelled"}
+SERIES_RE = re.compile(r'^webai_db_queries_(sum|count)\{view="([^"]*)"\} (\S+)$')
+
+WORDS = (
+    "latency budget cache shard replica token stream queue worker index "
+    "chunk prompt summary archive upload quota router backend metric"
+).split()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+# Server processes ----------------------------------------------------------
+
+
+def serve_redis(port, ready):
+    # fakeredis speaking the Redis protocol, standing in for a local Redis
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", port))
+    server.daemon_threads = True
+    ready.set()
+    server.serve_forever()
+
+
+def serve_app(port, users, pipe):
+    # Django is set up here, after the parent exported the environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.core.files.storage import FileSystemStorage
+    from django.core.management import call_command
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+    from django.db.backends.signals import connection_created
+
+    from chat import services
+    from chat.jobs import run_worker
+
+    call_command("migrate", verbosity=0)
+    user_model = get_user_model()
+    password = make_password(PASSWORD)
+    user_model.objects.bulk_create(
+        [user_model(username=f"load-{i}", password=password) for i in range(users)],
+        ignore_conflicts=True,
+    )
+
+    # Uploads land in a local directory instead of the bucket
+    upload_dir = tempfile.mkdtemp(prefix="load-uploads-")
+
+    class LocalUploads(FileSystemStorage):
+        @property
+        def bucket(self):
+            return self
+
+        def upload_file(self, path, key, Config=None):
+            target = self.path(key)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(path, target)
+
+    services.chat_uploads = LocalUploads(location=upload_dir)
+
+    # Queries of background threads, by pool (request threads are counted
+    # per view by MetricsMiddleware)
+    background = Counter()
+
+    def count_background(execute, sql, params, many, context):
+        name = threading.current_thread().name
+        if name.startswith(("chat-generation", "generation-worker")):
+            background["generation"] += 1
+        elif name.startswith("chat-"):
+            background[name.rsplit("_", 1)[0]] += 1
+        return execute(sql, params, many, context)
+
+    def install_counter(sender, connection, **kwargs):
+        # Fired on every reconnect of the thread's (reused) connection wrapper
+        if count_background not in connection.execute_wrappers:
+            connection.execute_wrappers.append(count_background)
+
+    connection_created.connect(install_counter, weak=False)
+
+    if settings.GENERATION_QUEUE:
+        chat_service = services.ChatService()
+
+        def handler(payload):
+            chat_service.run_generation(
+                payload["chat_id"],
+                payload["turn"],
+                payload["messages"],
+                payload.get("lease"),
+                payload.get("user_id"),
+            )
+
+        def fail(payload, error):
+            chat_service.fail_generation(
+                payload["chat_id"],
+                payload["turn"],
+                error,
+                payload.get("lease"),
+                payload.get("user_id"),
+            )
+
+        threading.Thread(
+            target=run_worker,
+            args=(handler, fail, settings.GENERATION_WORKERS, threading.Event()),
+            daemon=True,
+        ).start()
+
+    # Open streaming responses, sampled with the RSS
+    state = {"active": 0, "peak_active": 0, "baseline": rss_bytes(), "peak_rss": 0}
+    lock = threading.Lock()
+
+    class TrackedResponse:
+        def __init__(self, response):
+            self.response = response
+
+        def __iter__(self):
+            return iter(self.response)
+
+        def close(self):
+            try:
+                self.response.close()
+            finally:
+                with lock:
+                    state["active"] -= 1
+
+    wsgi_app = get_wsgi_application()
+
+    def app(environ, start_response):
+        if "/stream/" not in environ["PATH_INFO"]:
+            return wsgi_app(environ, start_response)
+        with lock:
+            state["active"] += 1
+            state["peak_active"] = max(state["peak_active"], state["active"])
+        return TrackedResponse(wsgi_app(environ, start_response))
+
+    def sample():
+        while True:
+            rss = rss_bytes()
+            with lock:
+                state["peak_rss"] = max(state["peak_rss"], rss)
+            time.sleep(0.02)
+
+    class Server(ThreadedWSGIServer):
+        request_queue_size = 1024
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = Server(("127.0.0.1", port), QuietHandler)
+    server.set_app(app)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    threading.Thread(target=sample, daemon=True).start()
+    pipe.send("ready")
+
+    while True:
+        command = pipe.recv()
+        if command == "mark":
+            # Start of the measured run: the app is warm
+            with lock:
+                state.update(
+                    baseline=rss_bytes(), peak_rss=0, peak_active=state["active"]
+                )
+                background.clear()
+            pipe.send(None)
+        elif command == "stats":
+            with lock:
+                pipe.send({**state, "queries": dict(background)})
+        else:
+            server.shutdown()
+            return
+
+
+# Virtual users -------------------------------------------------------------
+
+
+def error(response):
+    # The "error" of a JSON error response, shortened to group outcomes
+    try:
+        return str(response.json().get("error"))[:60]
+    except ValueError:
+        return response.reason_phrase
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.outcomes = Counter()
+        self.active = 0
+        self.peak_active = 0
+
+    def add(self, step, seconds):
+        with self.lock:
+            self.timings[step].append(seconds)
+
+    def outcome(self, name):
+        with self.lock:
+            self.outcomes[name] += 1
+
+    def stream_opened(self):
+        with self.lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+
+    def stream_closed(self):
+        with self.lock:
+            self.active -= 1
+
+
+class VirtualUser:
+    def __init__(self, base_url, index, args, results):
+        self.client = httpx.Client(base_url=base_url, timeout=args.timeout)
+        self.username = f"load-{index}"
+        self.args = args
+        self.results = results
+        self.rng = random.Random(index)
+        self.turns = 0
+
+    def prompt(self):
+        return " ".join(self.rng.choices(WORDS, k=self.args.prompt_words))
+
+    def form(self, prompt):
+        return {"prompt": prompt, "csrfmiddlewaretoken": self.client.cookies["csrftoken"]}
+
+    def headers(self):
+        return {"X-CSRFToken": self.client.cookies["csrftoken"]}
+
+    def login(self):
+        started = time.perf_counter()
+        self.client.get("/users/login/")
+        response = self.client.post(
+            "/users/login/",
+            data={
+                "username": self.username,
+                "password": PASSWORD,
+                "csrfmiddlewaretoken": self.client.cookies["csrftoken"],
+            },
+        )
+        self.results.add("login", time.perf_counter() - started)
+        if response.status_code != 302:
+            self.results.outcome(f"login HTTP {response.status_code}")
+            return False
+        return True
+
+    def create_chat(self, prompt):
+        started = time.perf_counter()
+        response = self.client.post(
+            "/chat/create/", data=self.form(prompt), headers=self.headers()
+        )
+        self.results.add("create_chat", time.perf_counter() - started)
+        if response.status_code != 200:
+            self.results.outcome(
+                f"create_chat HTTP {response.status_code}: {error(response)}"
+            )
+            return None
+        return response.json()["chat_id"]
+
+    def upload(self):
+        size = self.args.file_kb * 1024
+        text = ""
+        while len(text) < size:
+            text += self.prompt() + ".\n"
+        return {"file": (f"notes-{self.turns}.txt", text.encode(), "text/plain")}
+
+    def stream(self, chat_id, prompt):
+        self.turns += 1
+        files = None
+        step = "stream"
+        if self.args.upload_every and self.turns % self.args.upload_every == 0:
+            files = self.upload()
+            step = "stream+upload"
+
+        started = time.perf_counter()
+        self.results.stream_opened()
+        try:
+            with self.client.stream(
+                "POST",
+                f"/chat/{chat_id}/stream/",
+                data=self.form(prompt),
+                files=files,
+                headers=self.headers(),
+            ) as response:
+                self.results.add(f"{step} headers", time.perf_counter() - started)
+                if response.status_code != 200:
+                    response.read()
+                    self.results.outcome(
+                        f"stream HTTP {response.status_code}: {error(response)}"
+                    )
+                    return
+                ttft, outcome = self.read_events(response, started)
+        except httpx.HTTPError as e:
+            self.results.outcome(f"stream {type(e).__name__}")
+            return
+        finally:
+            self.results.stream_closed()
+
+        if ttft is not None:
+            self.results.add(f"{step} ttft", ttft)
+        self.results.add(f"{step} total", time.perf_counter() - started)
+        self.results.outcome(f"stream {outcome}")
+
+    def read_events(self, response, started):
+        # (time to first content, final event type) from SSE frames, JSON
+        # or SSE_COMPACT "event: t" text
+        ttft = None
+        event = None
+        for line in response.iter_lines():
+            if not line:
+                event = None
+            elif line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                kind = "content" if event == "t" else json.loads(line[5:])["type"]
+                if kind == "content":
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                elif kind in FINAL_EVENTS:
+                    return ttft, kind
+        return ttft, "truncated"
+
+    def run(self, chats, turns):
+        if not self.login():
+            return
+        for _ in range(chats):
+            prompt = self.prompt()
+            chat_id = self.create_chat(prompt)
+            if chat_id is None:
+                continue
+            self.stream(chat_id, prompt)
+            for _ in range(turns - 1):
+                self.stream(chat_id, self.prompt())
+
+    def close(self):
+        self.client.close()
+
+
+def scrape_queries(base_url):
+    # {view: (sum, count)} of webai_db_queries
+    series = defaultdict(lambda: [0.0, 0.0])
+    for line in httpx.get(f"{base_url}/metrics", timeout=30).text.splitlines():
+        match = SERIES_RE.match(line)
+        if match:
+            field, view, value = match.groups()
+            series[view][0 if field == "sum" else 1] += float(value)
+    return series
+
+
+def report(results, elapsed, server, before, after):
+    print(f"{'step':<22} {'n':>6} {'per s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for step, timings in sorted(results.timings.items()):
+        print(
+            f"{step:<22} {len(timings):>6} {len(timings) / elapsed:>8.1f} "
+            f"{statistics.median(timings) * 1000:>7.1f}ms "
+            f"{percentile(timings, 95) * 1000:>7.1f}ms "
+            f"{percentile(timings, 99) * 1000:>7.1f}ms"
+        )
+    print(f"outcomes: {dict(sorted(results.outcomes.items()))}")
+
+    print(f"{'view':<22} {'requests':>8} {'queries/request':>16}")
+    for view, (total, count) in sorted(after.items()):
+        total -= before.get(view, [0, 0])[0]
+        count -= before.get(view, [0, 0])[1]
+        if count:
+            print(f"{view:<22} {count:>8.0f} {total / count:>16.1f}")
+    streams = sum(
+        count for name, count in results.outcomes.items() if name.startswith("stream ")
+    )
+    for pool, queries in sorted(server["queries"].items()):
+        per_stream = f" ({queries / streams:.1f} per stream)" if streams else ""
+        print(f"background {pool}: {queries} queries{per_stream}")
+
+    growth = max(0, server["peak_rss"] - server["baseline"])
+    peak = server["peak_active"]
+    print(
+        f"server RSS {server['baseline'] / 2**20:.1f} MiB -> peak "
+        f"{server['peak_rss'] / 2**20:.1f} MiB with {peak} concurrent streams "
+        f"(client saw {results.peak_active}): "
+        f"{growth / max(peak, 1) / 1024:.0f} KiB per stream"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="concurrent users")
+    parser.add_argument("--chats", type=int, default=2, help="chats per user")
+    parser.add_argument("--turns", type=int, default=3, help="streamed turns per chat")
+    parser.add_argument("--upload-every", type=int, default=3, help="0 disables uploads")
+    parser.add_argument("--file-kb", type=int, default=16)
+    parser.add_argument("--prompt-words", type=int, default=12)
+    parser.add_argument(
+        "--ramp", type=float, default=1.0, help="seconds to start all users"
+    )
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tps", type=float, default=80.0)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--redis", choices=["fake", "local"], default="fake")
+    parser.add_argument("--rate-limits", action="store_true", help="keep per-user limits")
+    parser.add_argument("--db", default="", help="SQLite file (a new one by default)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    llm_url, llm = start_in_process(
+        ttft=args.ttft,
+        tps=args.tps,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        drop_rate=args.drop_rate,
+        seed=42,
+    )
+    context = multiprocessing.get_context("spawn")
+    redis = None
+    if args.redis == "fake":
+        ready = context.Event()
+        redis_port = free_port()
+        redis = context.Process(target=serve_redis, args=(redis_port, ready), daemon=True)
+        redis.start()
+        ready.wait()
+        os.environ["REDIS_HOST"] = "127.0.0.1"
+        os.environ["REDIS_PORT"] = str(redis_port)
+
+    # Inherited by the server process
+    os.environ["BENCH_DB"] = args.db or os.path.join(workdir, "load.sqlite3")
+    os.environ["LLM_BASE_URL"] = llm_url
+    os.environ["RATE_LIMIT_ENABLED"] = str(args.rate_limits)
+    os.environ.setdefault("UPLOAD_SPOOL_DIR", os.path.join(workdir, "spool"))
+    # Scraped on loopback for the query counts
+    os.environ["METRICS_PUBLIC"] = "True"
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    pipe, child_pipe = context.Pipe()
+    app = context.Process(
+        target=serve_app, args=(port, args.users, child_pipe), daemon=True
+    )
+    app.start()
+    try:
+        pipe.recv()
+
+        # One untimed turn loads the tokenizer, embeddings and templates
+        warmup = VirtualUser(base_url, 0, args, Results())
+        warmup.run(1, 1)
+        warmup.close()
+        pipe.send("mark")
+        pipe.recv()
+        before = scrape_queries(base_url)
+
+        results = Results()
+        virtual_users = [
+            VirtualUser(base_url, i, args, results) for i in range(args.users)
+        ]
+
+        def run(index, user):
+            time.sleep(args.ramp * index / args.users)
+            user.run(args.chats, args.turns)
+
+        threads = [
+            threading.Thread(target=run, args=(i, user))
+            for i, user in enumerate(virtual_users)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        for user in virtual_users:
+            user.close()
+
+        pipe.send("stats")
+        server = pipe.recv()
+        after = scrape_queries(base_url)
+        print(
+            f"users={args.users} chats={args.chats} turns={args.turns} "
+            f"redis={args.redis} llm ttft={args.ttft}s tps={args.tps} "
+            f"tokens={args.tokens} error_rate={args.error_rate} "
+            f"drop_rate={args.drop_rate}: {elapsed:.1f}s"
+        )
+        report(results, elapsed, server, before, after)
+        pipe.send("stop")
+        app.join(10)
+    finally:
+        app.terminate()
+        llm.terminate()
+        if redis is not None:
+            redis.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Upload extraction benchmark over a corpus of synthetic PDFs.
+
+Each mode runs in a fresh process and reports wall time, effective pages/sec
+(document pages / wall time) and peak RSS including pool workers:
+
+    full           every page extracted and joined (the old process_file)
+    lazy           pages streamed until the character budget is reached
+    parallel       budgeted extraction with page ranges on a warm process pool
+    parallel-full  every page extracted on the process pool
+
+Usage:
+    python -m benchmarks.pdf_extraction --pages 10 100 500 --workers 4
+"""
+
+# Standard library
+import argparse
+import io
+import multiprocessing
+import resource
+import sys
+import time
+
+# Local imports
+from chat import extraction
+
+LINE = "The quick brown fox jumps over the lazy dog while the benchmark runs."
+
+
+def build_pdf(pages, lines_per_page=50):
+    # Minimal PDF with one Helvetica text stream per page
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for number in range(pages):
+        text = " ".join(
+            f"({number + 1}.{line} {LINE}) Tj T*" for line in range(lines_per_page)
+        )
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td {text} ET".encode()
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        )
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(
+        b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, xref)
+    )
+    return out.getvalue()
+
+
+def run_mode(mode, data, max_chars, workers, results):
+    file = io.BytesIO(data)
+    if mode.startswith("parallel"):
+        # Warm the pool so spawn cost is not counted (web workers keep it alive)
+        list(extraction.get_pool(workers).map(abs, range(workers * 2)))
+        if mode == "parallel-full":
+            max_chars = sys.maxsize
+    start = time.perf_counter()
+    if mode == "full":
+        extraction.extract_pdf_text(file, max_chars=sys.maxsize, timeout=3600)
+    elif mode == "lazy":
+        extraction.extract_pdf_text(file, max_chars=max_chars, timeout=3600)
+    else:
+        extraction.extract_pdf_text(
+            file,
+            max_chars=max_chars,
+            timeout=3600,
+            parallel_min_pages=1,
+            workers=workers,
+        )
+    elapsed = time.perf_counter() - start
+    if extraction._pool is not None:
+        extraction._pool.shutdown()
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    results.put((elapsed, peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--max-chars", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    for pages in args.pages:
+        data = build_pdf(pages)
+        for mode in ("full", "lazy", "parallel", "parallel-full"):
+            results = context.Queue()
+            process = context.Process(
+                target=run_mode,
+                args=(mode, data, args.max_chars, args.workers, results),
+            )
+            process.start()
+            elapsed, peak = results.get()
+            process.join()
+            print(
+                f"pages={pages:<5} mode={mode:<13} wall={elapsed * 1000:9.1f}ms "
+                f"pages/s={pages / elapsed:9.1f} peak_rss={peak / 1024:7.1f}MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Rate limiter latency: one RateLimiter.acquire() (one Lua call) per request.
+
+Measures acquire + settle round trips against the Redis from the Django
+settings (REDIS_HOST/REDIS_PORT), spread over --users users so the
+per-minute window is not the limit being measured.
+
+Usage:
+    python -m benchmarks.rate_limit --requests 5000 --users 500
+"""
+
+# Standard library
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+# Django / third-party
+import django
+
+django.setup()
+
+# Local imports
+from chat.limits import RateLimited, RateLimiter  # noqa: E402
+from .stream_capacity import percentile  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    limiter = RateLimiter()
+    acquire, settle, limited = [], [], 0
+    for i in range(args.requests):
+        user_id = f"bench-{i % args.users}"
+        start = time.perf_counter()
+        try:
+            lease = limiter.acquire(user_id)
+        except RateLimited:
+            limited += 1
+            acquire.append(time.perf_counter() - start)
+            continue
+        acquire.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        limiter.settle(user_id, lease, 100, 200)
+        settle.append(time.perf_counter() - start)
+
+    for name, samples in (("acquire", acquire), ("settle", settle)):
+        if samples:
+            print(
+                f"{name:<8} n={len(samples):<6} "
+                f"p50={statistics.median(samples) * 1000:6.3f}ms "
+                f"p99={percentile(samples, 99) * 1000:6.3f}ms"
+            )
+    print(f"limited={limited}")
+
+    keys = [key for user in range(args.users) for key in limiter.keys(f"bench-{user}")]
+    keys += [limiter.ledger_key(f"bench-{user}") for user in range(args.users)]
+    limiter.redis.delete(*keys)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Full-text search benchmark over a seeded corpus.
+
+Seeds users with chats of synthetic messages (Zipf-distributed words),
+builds the search index with ``manage.py rebuild_search_index`` and reports
+latency percentiles of ranked search against a ``LIKE '%term%'`` scan.
+
+Usage:
+    DJANGO_SETTINGS_MODULE=benchmarks.settings BENCH_DB=/tmp/search.sqlite3 \\
+        python -m benchmarks.search --messages 1000000 --users 100
+"""
+
+# Standard library
+import argparse
+import itertools
+import os
+import random
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+# Django / third-party
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+
+# Local app imports
+from chat.models import Chat, Message, SearchPosting  # noqa: E402
+from chat.search import SearchIndex  # noqa: E402
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "qu", "pa", "do"]
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def seed(args, rng, words):
+    # Zipf-like word choice: weight 1/rank
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    user_model = get_user_model()
+    per_user = args.messages // args.users
+    for u in range(args.users):
+        user, _ = user_model.objects.get_or_create(username=f"bench-search-{u}")
+        existing = Message.objects.filter(chat__user=user).count()
+        if existing >= per_user:
+            continue
+        chats = Chat.objects.bulk_create(
+            Chat(user=user, title=" ".join(rng.choices(words, cum_weights=weights, k=4)))
+            for _ in range(max(1, (per_user - existing) // args.chat_size))
+        )
+        batch = []
+        for i in range(per_user - existing):
+            text = " ".join(rng.choices(words, cum_weights=weights, k=args.words))
+            batch.append(
+                Message(
+                    chat=chats[i % len(chats)],
+                    role="user" if i % 2 == 0 else "assistant",
+                    content=text,
+                )
+            )
+            if len(batch) == 5000:
+                Message.objects.bulk_create(batch)
+                batch = []
+        Message.objects.bulk_create(batch)
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+
+    def pick(q):
+        return timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+
+    return f"p50={pick(0.5):8.2f}ms p95={pick(0.95):8.2f}ms p99={pick(0.99):8.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--chat-size", type=int, default=50)
+    parser.add_argument("--words", type=int, default=30)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--like-queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    words = vocabulary(args.vocabulary, rng)
+    call_command("migrate", verbosity=0)
+    started = time.perf_counter()
+    seed(args, rng, words)
+    print(f"seeded {Message.objects.count()} messages in {time.perf_counter() - started:.1f}s")
+    if not SearchPosting.objects.exists():
+        started = time.perf_counter()
+        call_command("rebuild_search_index")
+        print(
+            f"indexed {SearchPosting.objects.count()} postings "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+    user_ids = list(
+        get_user_model()
+        .objects.filter(username__startswith="bench-search-")
+        .values_list("id", flat=True)
+    )
+    # Queries mix frequent, mid and rare words (rank 0 sits in most
+    # messages), one to three terms each
+    queries = [
+        (
+            rng.choice(user_ids),
+            " ".join(
+                words[min(len(words) - 1, int(rng.paretovariate(0.5)) - 1)]
+                for _ in range(rng.randint(1, 3))
+            ),
+        )
+        for _ in range(args.queries)
+    ]
+
+    index = SearchIndex()
+    timings = []
+    hits = 0
+    for user_id, query in queries:
+        start = time.perf_counter()
+        results, total = index.search(user_id, query)
+        timings.append(time.perf_counter() - start)
+        hits += bool(total)
+    print(
+        f"{'index search':<14} queries={len(queries):<5} {percentiles(timings)} "
+        f"with_hits={hits}"
+    )
+
+    timings = []
+    for user_id, query in queries[: args.like_queries]:
+        start = time.perf_counter()
+        list(
+            Message.objects.filter(
+                chat__user_id=user_id, content__icontains=query.split()[0]
+            )
+            .order_by("-id")
+            .values("id", "content")[: index.page_size]
+        )
+        timings.append(time.perf_counter() - start)
+    print(f"{'LIKE scan':<14} queries={len(timings):<5} {percentiles(timings)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Offline settings for benchmarks: SQLite instead of MySQL, with placeholder
+values for the required environment variables.
+
+    DJANGO_SETTINGS_MODULE=benchmarks.settings python -m benchmarks.<name>
+"""
+
+# Standard library
+import os
+
+for name, value in {
+    "SECRET_KEY": "benchmark",
+    "DEBUG": "False",
+    "AI_MODEL": "fake",
+    "SYSTEM_PROMPT": "You are a helpful assistant.",
+    "DB_NAME": "",
+    "DB_USER": "",
+    "DB_PASSWORD": "",
+    "DB_HOST": "",
+    "DB_PORT": "",
+    "MINIO_ID": "minio",
+    "MINIO_ACCESS_KEY": "minio",
+    "MINIO_HOST": "127.0.0.1",
+    "MINIO_PORT": "9000",
+    "REDIS_HOST": "127.0.0.1",
+    "REDIS_PORT": "6379",
+    "REDIS_DB": "0",
+    "TZ": "UTC",
+    "GROQ_API_KEY": "fake",
+}.items():
+    os.environ.setdefault(name, value)
+
+from webai.settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ.get("BENCH_DB", BASE_DIR / "bench.sqlite3"),
+    }
+}
@@ -0,0 +1,114 @@
+"""
+SSE framing micro-benchmark: per-token frames vs coalesced frames.
+
+Feeds a synthetic token stream through the old path (one JSON frame and one
+string concatenation per token) and through TokenBuffer + sse_frames, with
+JSON and compact (SSE_COMPACT) content frames. Reports CPU time per 1k
+tokens, frames and bytes per answer, and frames/s for a stream paced at
+--tps tokens per second.
+
+Usage:
+    python -m benchmarks.sse_framing --tokens 2000 --tps 1000
+"""
+
+# Standard library
+import argparse
+import os
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+# Django / third-party
+import django
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+
+# Local imports
+from chat.services import TokenBuffer  # noqa: E402
+from chat.views import sse_event, sse_frames  # noqa: E402
+
+TOKENS = ["Hello", " world", ",", " \"quoted\"", " café", " 日本語", " token", "\n", "```", "code"]
+
+
+def per_token(tokens, paced=None):
+    # Previous behaviour: every chunk is its own frame and write
+    frames = []
+    response = ""
+    for i, content in enumerate(tokens):
+        if paced:
+            paced(i)
+        response += content
+        frames.append(sse_event({"type": "content", "content": content}, f"{i}-0"))
+    return frames, response
+
+
+def coalesced(tokens, paced=None):
+    # Producer flushes through TokenBuffer; the reader turns each batch of
+    # stream entries into one write (XREAD returns up to 100 entries)
+    frames = []
+    entries = []
+    buffer = TokenBuffer()
+    for i, content in enumerate(tokens):
+        if paced:
+            paced(i)
+        content = buffer.add(content)
+        if content:
+            entries.append((f"{i}-0", {"type": "content", "content": content}))
+            frames.append(sse_frames(entries)[0])
+            entries = []
+    content = buffer.take()
+    if content:
+        frames.append(sse_frames([("end-0", {"type": "content", "content": content})])[0])
+    return frames, buffer.text()
+
+
+def cpu_run(name, path, tokens, rounds):
+    start = time.process_time()
+    for _ in range(rounds):
+        frames, response = path(tokens)
+    cpu = (time.process_time() - start) / rounds
+    size = sum(len(frame.encode()) for frame in frames)
+    print(
+        f"{name:<18} cpu/1k_tokens={cpu / len(tokens) * 1000 * 1000:7.3f}ms "
+        f"frames={len(frames):<6} bytes={size:<8} text_ok={response == ''.join(tokens)}"
+    )
+
+
+def paced_run(name, path, tokens, tps):
+    start = time.perf_counter()
+
+    def paced(i):
+        delay = start + i / tps - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    frames, _response = path(tokens, paced)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<18} tps={tps:<6} frames/s={len(frames) / elapsed:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--tps", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    tokens = [TOKENS[i % len(TOKENS)] for i in range(args.tokens)]
+    paced_tokens = tokens[: int(args.tps * 2)]
+    for compact in (False, True):
+        settings.SSE_COMPACT = compact
+        label = "compact" if compact else "json"
+        if not compact:
+            cpu_run("per-token", per_token, tokens, args.rounds)
+        cpu_run(f"coalesced-{label}", coalesced, tokens, args.rounds)
+
+    settings.SSE_COMPACT = False
+    paced_run("per-token", per_token, paced_tokens, args.tps)
+    paced_run("coalesced", coalesced, paced_tokens, args.tps)
+
+
+if __name__ == "__main__":
+    main()
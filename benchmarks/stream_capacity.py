@@ -0,0 +1,102 @@
+"""
+Concurrent-stream capacity: sync Groq client vs AsyncGroq.
+
+The sync path runs each stream on a worker thread, bounded by ``--workers``
+the same way web worker slots bound ``ChatStreamView``. The async path runs
+every stream as a task on one event loop, like ``AsyncChatStreamView`` under
+ASGI. Both talk to the local fake LLM server, so no Groq quota is used.
+
+Usage:
+    python -m benchmarks.stream_capacity --streams 1000 --workers 64
+"""
+
+# Standard library
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Django / third-party
+from groq import Groq, AsyncGroq
+
+# Local imports
+from .fake_llm import start_in_process
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def report(name, ttfts, elapsed, streams):
+    print(
+        f"{name:<6} streams={streams:<6} done={len(ttfts):<6} "
+        f"wall={elapsed:7.2f}s streams/s={len(ttfts) / elapsed:8.1f} "
+        f"ttft_p50={statistics.median(ttfts) * 1000 if ttfts else 0:8.1f}ms "
+        f"ttft_p99={percentile(ttfts, 99) * 1000:8.1f}ms"
+    )
+
+
+def run_sync(base_url, streams, workers):
+    client = Groq(base_url=base_url, api_key="fake")
+    ttfts = []
+
+    def one_stream(submitted):
+        first = None
+        for chunk in client.chat.completions.create(
+            model="fake", messages=MESSAGES, stream=True
+        ):
+            if first is None and chunk.choices[0].delta.content:
+                first = time.perf_counter() - submitted
+        ttfts.append(first)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in range(streams):
+            pool.submit(one_stream, time.perf_counter())
+    report("sync", ttfts, time.perf_counter() - start, streams)
+
+
+async def run_async(base_url, streams):
+    client = AsyncGroq(base_url=base_url, api_key="fake")
+    ttfts = []
+
+    async def one_stream(submitted):
+        first = None
+        stream = await client.chat.completions.create(
+            model="fake", messages=MESSAGES, stream=True
+        )
+        async for chunk in stream:
+            if first is None and chunk.choices[0].delta.content:
+                first = time.perf_counter() - submitted
+        ttfts.append(first)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_stream(time.perf_counter()) for _ in range(streams)))
+    report("async", ttfts, time.perf_counter() - start, streams)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--streams", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=64, help="sync worker slots")
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tps", type=float, default=80.0)
+    parser.add_argument("--tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    base_url, server = start_in_process(ttft=args.ttft, tps=args.tps, tokens=args.tokens)
+    try:
+        run_sync(base_url, args.streams, args.workers)
+        asyncio.run(run_async(base_url, args.streams))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,63 @@
 # Django / third-party
-from groq import Groq
 from django.conf import settings
 
+# Local app imports
+from .backends import BackendError, get_router
+
 
 # Inference AI
 class AIModelManager:
     def __init__(self):
-        self.client = Groq()
+        # Shared per-process router over the configured LLM backends
+        self.router = get_router()
         self.default_model = settings.AI_MODEL
 
-    def get_chat_completion(self, messages, stream=True, model=None, preferences=None):
+    def stream_chat(self, messages, model=None, preferences=None, max_tokens=None):
+        # Yields text deltas; fails over or hedges across backends per model
+        # Optionally modify messages based on preferences
+        if preferences:
+            messages.insert(0, {"role": "system", "content": preferences})
+        try:
+            yield from self.router.stream(
+                messages, model or self.default_model, max_tokens=max_tokens
+            )
+        except BackendError as e:
+            raise AIModelException(f"Error getting completion: {str(e)}")
+
+    async def astream_chat(self, messages, model=None, preferences=None, max_tokens=None):
+        if preferences:
+            messages.insert(0, {"role": "system", "content": preferences})
+        try:
+            async for content in self.router.astream(
+                messages, model or self.default_model, max_tokens=max_tokens
+            ):
+                yield content
+        except BackendError as e:
+            raise AIModelException(f"Error getting completion: {str(e)}")
+
+    def complete(self, messages, model=None, max_tokens=None):
+        try:
+            return self.router.complete(
+                messages, model or self.default_model, max_tokens=max_tokens
+            )
+        except BackendError as e:
+            raise AIModelException(f"Error getting completion: {str(e)}")
+
+    async def acomplete(self, messages, model=None, max_tokens=None):
         try:
-            # Optionally modify messages based on preferences
-            if preferences:
-                messages.insert(0, {"role": "system", "content": preferences})
-            return self.client.chat.completions.create(
-                model=model or self.default_model,
-                messages=messages,
-                temperature=0.7,
-                top_p=1,
-                stream=stream,
+            return await self.router.acomplete(
+                messages, model or self.default_model, max_tokens=max_tokens
             )
-        except Exception as e:
+        except BackendError as e:
             raise AIModelException(f"Error getting completion: {str(e)}")
 
     # def generate_title(self, conversation):
     #     try:
     #         title_prompt = f"{conversation}\n\nBased on this conversation, generate a very short title (5 words or less)."
-    #         completion = self.get_chat_completion(
+    #         return self.complete(
     #             messages=[{"role": "user", "content": title_prompt}],
-    #             stream=False,
     #             max_tokens=20,
-    #         )
-    #         return completion.choices[0].message.content.strip().strip('"')
+    #         ).strip().strip('"')
     #     except Exception as e:
     #         raise AIModelException(f"Error generating title: {str(e)}")
 
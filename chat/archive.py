@@ -0,0 +1,106 @@
+# Cold storage for idle chats.
+# `manage.py archive_chats` writes every message of a chat idle for
+# ARCHIVE_AFTER_DAYS days to one zstd-compressed JSONL object and deletes the
+# rows (and their search postings), leaving the Chat row behind as a stub.
+# Opening the chat streams the object back into the table with the original
+# ids and timestamps, so cursors, summaries and attachment links still hold.
+
+# Standard library
+import io
+import json
+import tempfile
+from datetime import datetime
+
+# Django / third-party
+import zstandard
+from django.conf import settings
+from django.core.files import File
+from storages.backends.s3boto3 import S3Boto3Storage
+
+# Local app imports
+from .models import Attachment, Message
+
+chat_archives = S3Boto3Storage(bucket_name=settings.BUCKET_CHAT_ARCHIVES)
+
+# Message fields kept in the archive, besides id and created_at
+FIELDS = [
+    "role",
+    "content",
+    "status",
+    "prompt_tokens",
+    "completion_tokens",
+    "ttft_ms",
+    "latency_ms",
+]
+
+# Archives are spooled in memory up to this size, then on disk
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+# zstd JSONL archives of chat messages in object storage
+class ChatArchive:
+    def __init__(self, storage=None):
+        self.storage = storage or chat_archives
+        self.level = settings.ARCHIVE_COMPRESSION_LEVEL
+        self.batch_size = settings.ARCHIVE_BATCH_SIZE
+
+    def key(self, chat, now):
+        return f"chats/{chat.user_id}/{chat.id}-{now:%Y%m%d%H%M%S}.jsonl.zst"
+
+    def rows(self, chat_id, upto_id):
+        links = {}
+        for attachment_id, message_id in Attachment.objects.filter(
+            chat_id=chat_id, message_id__isnull=False
+        ).values_list("id", "message_id"):
+            links.setdefault(message_id, []).append(attachment_id)
+
+        messages = (
+            Message.objects.filter(chat_id=chat_id, id__lte=upto_id)
+            .order_by("id")
+            .values("id", "created_at", *FIELDS)
+        )
+        for row in messages.iterator(chunk_size=self.batch_size):
+            row["created_at"] = row["created_at"].isoformat()
+            row["attachments"] = links.get(row["id"], [])
+            yield row
+
+    def write(self, chat, upto_id, now):
+        # Returns (key, messages, raw bytes, compressed bytes)
+        count = raw = 0
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as spool:
+            compressor = zstandard.ZstdCompressor(level=self.level)
+            with compressor.stream_writer(spool, closefd=False) as writer:
+                for row in self.rows(chat.id, upto_id):
+                    line = json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n"
+                    writer.write(line)
+                    count += 1
+                    raw += len(line)
+            size = spool.tell()
+            spool.seek(0)
+            key = self.storage.save(self.key(chat, now), File(spool))
+        return key, count, raw, size
+
+    def open(self, key):
+        # The object body as a stream (storage.open would download it whole)
+        return self.storage.bucket.Object(key).get()["Body"]
+
+    def read(self, key):
+        # Yields lists of message dicts, at most batch_size at a time
+        body = self.open(key)
+        try:
+            reader = zstandard.ZstdDecompressor().stream_reader(body)
+            batch = []
+            for line in io.TextIOWrapper(reader, encoding="utf-8"):
+                row = json.loads(line)
+                row["created_at"] = datetime.fromisoformat(row["created_at"])
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            body.close()
+
+    def delete(self, key):
+        self.storage.delete(key)
@@ -0,0 +1,797 @@
+# Pluggable LLM backends and the per-model router that picks between them.
+# Every backend speaks the OpenAI chat-completions shape and yields plain text
+# deltas, so callers never handle provider-specific chunk objects.
+
+# Standard library
+import abc
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+
+# Django / third-party
+import httpx
+from groq import Groq, AsyncGroq, NOT_GIVEN
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+# Process-wide pooled HTTP clients shared by every backend
+_http_client = None
+_async_http_clients = weakref.WeakKeyDictionary()
+_client_lock = threading.Lock()
+_router = None
+_router_lock = threading.Lock()
+
+pool_counters = {"requests": 0, "responses": 0, "errors": 0}
+
+
+def _count_request(request):
+    pool_counters["requests"] += 1
+
+
+def _count_response(response):
+    pool_counters["responses"] += 1
+    if response.status_code >= 400:
+        pool_counters["errors"] += 1
+
+
+async def _acount_request(request):
+    _count_request(request)
+
+
+async def _acount_response(response):
+    _count_response(response)
+
+
+def http_client_options():
+    return {
+        "http2": settings.LLM_HTTP2,
+        "limits": httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(
+            connect=settings.LLM_CONNECT_TIMEOUT,
+            read=settings.LLM_READ_TIMEOUT,
+            write=settings.LLM_WRITE_TIMEOUT,
+            pool=settings.LLM_POOL_TIMEOUT,
+        ),
+    }
+
+
+def get_http_client():
+    global _http_client
+    with _client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                event_hooks={"request": [_count_request], "response": [_count_response]},
+                **http_client_options(),
+            )
+    return _http_client
+
+
+def get_async_http_client():
+    # Async connections are bound to their event loop, so keep one per loop
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        client = _async_http_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                event_hooks={
+                    "request": [_acount_request],
+                    "response": [_acount_response],
+                },
+                **http_client_options(),
+            )
+            _async_http_clients[loop] = client
+    return client
+
+
+def _pool_connections(client):
+    # httpx does not expose pool state publicly; read it from httpcore
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    return list(getattr(pool, "connections", []))
+
+
+def pool_stats():
+    connections = []
+    if _http_client is not None:
+        connections += _pool_connections(_http_client)
+    for client in list(_async_http_clients.values()):
+        connections += _pool_connections(client)
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "max_connections": settings.LLM_MAX_CONNECTIONS,
+        **pool_counters,
+    }
+
+
+class BackendError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(response):
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def parse_sse_delta(line):
+    # Text delta of one OpenAI-style SSE line: "" when empty, None at [DONE]
+    if not line.startswith("data:"):
+        return ""
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return None
+    chunk = json.loads(data)
+    if chunk.get("error"):
+        raise BackendError(str(chunk["error"]))
+    choices = chunk.get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+# Backend base class
+class LLMBackend(abc.ABC):
+    kind = None
+    default_base_url = None
+
+    def __init__(self, name, base_url=None, api_key=None, models=None, max_retries=None):
+        self.name = name
+        self.base_url = base_url or self.default_base_url
+        self.api_key = api_key
+        # Maps our model names to the provider's; empty means "serves anything"
+        if isinstance(models, (list, tuple)):
+            models = {model: model for model in models}
+        self.models = models or {}
+        self.max_retries = (
+            settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        )
+
+    def serves(self, model):
+        return not self.models or model in self.models
+
+    def provider_model(self, model):
+        return self.models.get(model) or model
+
+    @abc.abstractmethod
+    def stream(self, messages, model, max_tokens=None):
+        pass
+
+    @abc.abstractmethod
+    def astream(self, messages, model, max_tokens=None):
+        pass
+
+    @abc.abstractmethod
+    def complete(self, messages, model, max_tokens=None):
+        pass
+
+    @abc.abstractmethod
+    async def acomplete(self, messages, model, max_tokens=None):
+        pass
+
+
+# Groq through its SDK. The SDK's own retries are off by default
+# (LLM_MAX_RETRIES=0): the router retries and fails over instead.
+class GroqBackend(LLMBackend):
+    kind = "groq"
+
+    def __init__(self, name, **options):
+        super().__init__(name, **options)
+        self.base_url = self.base_url or settings.LLM_BASE_URL or None
+        self.client = Groq(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            max_retries=self.max_retries,
+            http_client=get_http_client(),
+        )
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @property
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncGroq(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                max_retries=self.max_retries,
+                http_client=get_async_http_client(),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def request(self, messages, model, stream, max_tokens):
+        return {
+            "model": self.provider_model(model),
+            "messages": messages,
+            "temperature": 0.7,
+            "top_p": 1,
+            "stream": stream,
+            "max_tokens": max_tokens or NOT_GIVEN,
+        }
+
+    def error(self, e):
+        return BackendError(
+            f"{self.name}: {e}", retry_after_seconds(getattr(e, "response", None))
+        )
+
+    def stream(self, messages, model, max_tokens=None):
+        try:
+            with self.client.chat.completions.create(
+                **self.request(messages, model, True, max_tokens)
+            ) as chunks:
+                for chunk in chunks:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        except Exception as e:
+            raise self.error(e) from e
+
+    async def astream(self, messages, model, max_tokens=None):
+        try:
+            chunks = await self.async_client.chat.completions.create(
+                **self.request(messages, model, True, max_tokens)
+            )
+            try:
+                async for chunk in chunks:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await chunks.close()
+        except Exception as e:
+            raise self.error(e) from e
+
+    def complete(self, messages, model, max_tokens=None):
+        try:
+            completion = self.client.chat.completions.create(
+                **self.request(messages, model, False, max_tokens)
+            )
+        except Exception as e:
+            raise self.error(e) from e
+        return completion.choices[0].message.content or ""
+
+    async def acomplete(self, messages, model, max_tokens=None):
+        try:
+            completion = await self.async_client.chat.completions.create(
+                **self.request(messages, model, False, max_tokens)
+            )
+        except Exception as e:
+            raise self.error(e) from e
+        return completion.choices[0].message.content or ""
+
+
+# Any OpenAI-compatible /chat/completions endpoint, over the shared pool
+class OpenAICompatibleBackend(LLMBackend):
+    kind = "openai"
+    default_base_url = "https://api.openai.com/v1"
+
+    @property
+    def url(self):
+        return f"{self.base_url.rstrip('/')}/chat/completions"
+
+    @property
+    def headers(self):
+        if self.api_key:
+            return {"Authorization": f"Bearer {self.api_key}"}
+        return {}
+
+    def request(self, messages, model, stream, max_tokens):
+        payload = {
+            "model": self.provider_model(model),
+            "messages": messages,
+            "temperature": 0.7,
+            "top_p": 1,
+            "stream": stream,
+        }
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+        return payload
+
+    def check(self, response):
+        if response.status_code >= 400:
+            raise BackendError(
+                f"{self.name}: HTTP {response.status_code} {response.text[:200]}",
+                retry_after_seconds(response),
+            )
+
+    def stream(self, messages, model, max_tokens=None):
+        try:
+            with get_http_client().stream(
+                "POST",
+                self.url,
+                json=self.request(messages, model, True, max_tokens),
+                headers=self.headers,
+            ) as response:
+                if response.status_code >= 400:
+                    response.read()
+                self.check(response)
+                for line in response.iter_lines():
+                    content = parse_sse_delta(line)
+                    if content is None:
+                        break
+                    if content:
+                        yield content
+        except BackendError:
+            raise
+        except Exception as e:
+            raise BackendError(f"{self.name}: {e}") from e
+
+    async def astream(self, messages, model, max_tokens=None):
+        try:
+            async with get_async_http_client().stream(
+                "POST",
+                self.url,
+                json=self.request(messages, model, True, max_tokens),
+                headers=self.headers,
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                self.check(response)
+                async for line in response.aiter_lines():
+                    content = parse_sse_delta(line)
+                    if content is None:
+                        break
+                    if content:
+                        yield content
+        except BackendError:
+            raise
+        except Exception as e:
+            raise BackendError(f"{self.name}: {e}") from e
+
+    def parse_completion(self, response):
+        self.check(response)
+        return response.json()["choices"][0]["message"].get("content") or ""
+
+    def complete(self, messages, model, max_tokens=None):
+        try:
+            response = get_http_client().post(
+                self.url,
+                json=self.request(messages, model, False, max_tokens),
+                headers=self.headers,
+            )
+            return self.parse_completion(response)
+        except BackendError:
+            raise
+        except Exception as e:
+            raise BackendError(f"{self.name}: {e}") from e
+
+    async def acomplete(self, messages, model, max_tokens=None):
+        try:
+            response = await get_async_http_client().post(
+                self.url,
+                json=self.request(messages, model, False, max_tokens),
+                headers=self.headers,
+            )
+            return self.parse_completion(response)
+        except BackendError:
+            raise
+        except Exception as e:
+            raise BackendError(f"{self.name}: {e}") from e
+
+
+# Self-hosted llama.cpp / vLLM / Ollama server (OpenAI-compatible, no key)
+class LocalBackend(OpenAICompatibleBackend):
+    kind = "local"
+    default_base_url = "http://127.0.0.1:8080/v1"
+
+
+BACKEND_KINDS = {
+    backend.kind: backend for backend in (GroqBackend, OpenAICompatibleBackend, LocalBackend)
+}
+
+
+def build_backend(config):
+    # One LLM_BACKENDS entry: {"name", "kind", "base_url", "api_key_env", "models", ...}
+    config = dict(config)
+    kind = config.pop("kind", "openai")
+    if kind not in BACKEND_KINDS:
+        raise ImproperlyConfigured(f"Unknown LLM backend kind: {kind}")
+    api_key_env = config.pop("api_key_env", None)
+    if api_key_env:
+        config["api_key"] = os.environ.get(api_key_env)
+    config.setdefault("name", kind)
+    return BACKEND_KINDS[kind](**config)
+
+
+# Per-model routing with latency-aware ordering, failover and hedging
+class LLMRouter:
+    def __init__(self, backends, routes=None, hedge_after=0, cooldown=30, max_attempts=3):
+        self.backends = {backend.name: backend for backend in backends}
+        self.routes = routes or {}
+        self.hedge_after = hedge_after
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.health = {
+            name: {
+                "ttft": None,
+                "successes": 0,
+                "failures": 0,
+                "hedges": 0,
+                "cooldown_until": 0.0,
+                "last_error": "",
+            }
+            for name in self.backends
+        }
+
+    def route(self, model):
+        # Ordered candidate backends for a model, plus its hedge threshold
+        config = self.routes.get(model, {})
+        if config.get("backends"):
+            backends = [
+                self.backends[name] for name in config["backends"] if name in self.backends
+            ]
+        else:
+            backends = [
+                backend for backend in self.backends.values() if backend.serves(model)
+            ]
+        if not backends:
+            raise BackendError(f"No LLM backend configured for model {model}")
+
+        now = time.monotonic()
+        with self.lock:
+            # Cooling-down backends go last; within a group, fastest TTFT first.
+            # Unmeasured backends sort first so they get probed. sorted() is
+            # stable, so ties keep the configured order.
+            if config.get("strategy", "latency") == "latency":
+                backends.sort(
+                    key=lambda backend: (
+                        self.health[backend.name]["cooldown_until"] > now,
+                        self.health[backend.name]["ttft"] or 0.0,
+                    )
+                )
+            else:
+                backends.sort(
+                    key=lambda backend: self.health[backend.name]["cooldown_until"] > now
+                )
+        return backends[: self.max_attempts], config.get("hedge_after", self.hedge_after)
+
+    def attempts(self, backends, errors):
+        # Yields (backend, seconds to wait first) up to max_attempts times.
+        # Untried backends that are not cooling down go first; a backend that
+        # failed is retried only after its Retry-After or a capped exponential
+        # backoff, and dropped when that exceeds LLM_RETRY_MAX_WAIT. Callers
+        # append each failure to `errors` before asking for the next attempt.
+        failures = {}
+        ready_at = {}
+        previous = None
+        for _ in range(self.max_attempts):
+            now = time.monotonic()
+            if previous is not None:
+                count = failures[previous.name] = failures.get(previous.name, 0) + 1
+                wait = errors[-1].retry_after or settings.LLM_RETRY_BACKOFF * 2 ** (
+                    count - 1
+                )
+                ready_at[previous.name] = (
+                    now + wait if wait <= settings.LLM_RETRY_MAX_WAIT else None
+                )
+            with self.lock:
+                cooling = {
+                    backend.name
+                    for backend in backends
+                    if self.health[backend.name]["cooldown_until"] > now
+                }
+            candidates = []
+            for index, backend in enumerate(backends):
+                if backend.name not in failures:
+                    candidates.append(((now, backend.name in cooling, index), backend))
+                elif ready_at[backend.name] is not None:
+                    candidates.append(((ready_at[backend.name], True, index), backend))
+            if not candidates:
+                return
+            (ready, _, _), previous = min(candidates, key=lambda item: item[0])
+            yield previous, max(0.0, ready - now)
+
+    def record_success(self, backend, ttft=None):
+        with self.lock:
+            health = self.health[backend.name]
+            if ttft is not None:
+                # Exponentially weighted moving average of time-to-first-token
+                alpha = settings.LLM_LATENCY_ALPHA
+                health["ttft"] = (
+                    ttft
+                    if health["ttft"] is None
+                    else health["ttft"] * (1 - alpha) + ttft * alpha
+                )
+            health["successes"] += 1
+            health["cooldown_until"] = 0.0
+
+    def record_failure(self, backend, error):
+        logger.warning("LLM backend %s failed: %s", backend.name, error)
+        with self.lock:
+            health = self.health[backend.name]
+            health["failures"] += 1
+            health["cooldown_until"] = time.monotonic() + (
+                error.retry_after or self.cooldown
+            )
+            health["last_error"] = str(error)[:200]
+
+    def record_hedge(self, backend):
+        with self.lock:
+            self.health[backend.name]["hedges"] += 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            return {
+                name: {
+                    **{key: value for key, value in health.items() if key != "cooldown_until"},
+                    "cooling_down": health["cooldown_until"] > now,
+                }
+                for name, health in self.health.items()
+            }
+
+    def all_failed(self, errors):
+        return BackendError(
+            "All LLM backends failed: " + "; ".join(str(error) for error in errors)
+        )
+
+    def stream(self, messages, model, max_tokens=None):
+        backends, hedge_after = self.route(model)
+        if hedge_after and len(backends) > 1:
+            return self.stream_hedged(backends, hedge_after, messages, model, max_tokens)
+        return self.stream_failover(backends, messages, model, max_tokens)
+
+    def stream_failover(self, backends, messages, model, max_tokens):
+        # Move to the next backend only while nothing has been yielded yet
+        errors = []
+        for backend, wait in self.attempts(backends, errors):
+            time.sleep(wait)
+            started = time.monotonic()
+            stream = backend.stream(messages, model, max_tokens=max_tokens)
+            try:
+                try:
+                    first = next(stream)
+                except StopIteration:
+                    self.record_success(backend, time.monotonic() - started)
+                    return
+                except BackendError as e:
+                    self.record_failure(backend, e)
+                    errors.append(e)
+                    continue
+                self.record_success(backend, time.monotonic() - started)
+                yield first
+                try:
+                    yield from stream
+                except BackendError as e:
+                    self.record_failure(backend, e)
+                    raise
+                return
+            finally:
+                stream.close()
+        raise self.all_failed(errors)
+
+    def stream_hedged(self, backends, hedge_after, messages, model, max_tokens):
+        # Each attempt runs on its own thread and reports into one queue. A new
+        # attempt starts when the current ones stay silent for hedge_after
+        # seconds or all of them failed; the first to produce a token wins.
+        events = queue.Queue()
+        pending = list(backends)
+        running = {}
+        errors = []
+        winner = None
+
+        def run(index, backend, cancel):
+            started = time.monotonic()
+            stream = backend.stream(messages, model, max_tokens=max_tokens)
+            try:
+                for content in stream:
+                    if cancel.is_set():
+                        return
+                    events.put((index, "content", content, time.monotonic() - started))
+                events.put((index, "done", None, time.monotonic() - started))
+            except BackendError as e:
+                events.put((index, "error", e, time.monotonic() - started))
+            finally:
+                stream.close()
+
+        def launch():
+            backend = pending.pop(0)
+            index = len(backends) - len(pending) - 1
+            cancel = threading.Event()
+            running[index] = (backend, cancel)
+            threading.Thread(
+                target=run, args=(index, backend, cancel), name="llm-hedge", daemon=True
+            ).start()
+
+        launch()
+        try:
+            while True:
+                try:
+                    timeout = hedge_after if winner is None and pending else None
+                    index, kind, value, elapsed = events.get(timeout=timeout)
+                except queue.Empty:
+                    self.record_hedge(running[max(running)][0])
+                    launch()
+                    continue
+
+                backend = running[index][0]
+                if winner is None:
+                    if kind == "error":
+                        self.record_failure(backend, value)
+                        errors.append(value)
+                        del running[index]
+                        if not running:
+                            if not pending:
+                                raise self.all_failed(errors)
+                            launch()
+                        continue
+                    winner = index
+                    self.record_success(backend, elapsed)
+                    for other, (_, cancel) in running.items():
+                        if other != winner:
+                            cancel.set()
+                if index != winner:
+                    continue
+                if kind == "content":
+                    yield value
+                elif kind == "done":
+                    return
+                else:
+                    self.record_failure(backend, value)
+                    raise value
+        finally:
+            for _, cancel in running.values():
+                cancel.set()
+
+    def astream(self, messages, model, max_tokens=None):
+        backends, hedge_after = self.route(model)
+        if hedge_after and len(backends) > 1:
+            return self.astream_hedged(backends, hedge_after, messages, model, max_tokens)
+        return self.astream_failover(backends, messages, model, max_tokens)
+
+    async def astream_failover(self, backends, messages, model, max_tokens):
+        errors = []
+        for backend, wait in self.attempts(backends, errors):
+            await asyncio.sleep(wait)
+            started = time.monotonic()
+            stream = backend.astream(messages, model, max_tokens=max_tokens)
+            try:
+                try:
+                    first = await stream.__anext__()
+                except StopAsyncIteration:
+                    self.record_success(backend, time.monotonic() - started)
+                    return
+                except BackendError as e:
+                    self.record_failure(backend, e)
+                    errors.append(e)
+                    continue
+                self.record_success(backend, time.monotonic() - started)
+                yield first
+                try:
+                    async for content in stream:
+                        yield content
+                except BackendError as e:
+                    self.record_failure(backend, e)
+                    raise
+                return
+            finally:
+                await stream.aclose()
+        raise self.all_failed(errors)
+
+    async def astream_hedged(self, backends, hedge_after, messages, model, max_tokens):
+        # Same protocol as stream_hedged, with tasks instead of threads
+        events = asyncio.Queue()
+        pending = list(backends)
+        running = {}
+        errors = []
+        winner = None
+
+        async def run(index, backend):
+            started = time.monotonic()
+            stream = backend.astream(messages, model, max_tokens=max_tokens)
+            try:
+                async for content in stream:
+                    await events.put((index, "content", content, time.monotonic() - started))
+                await events.put((index, "done", None, time.monotonic() - started))
+            except BackendError as e:
+                await events.put((index, "error", e, time.monotonic() - started))
+            finally:
+                await stream.aclose()
+
+        def launch():
+            backend = pending.pop(0)
+            index = len(backends) - len(pending) - 1
+            running[index] = (backend, asyncio.create_task(run(index, backend)))
+
+        launch()
+        try:
+            while True:
+                try:
+                    timeout = hedge_after if winner is None and pending else None
+                    index, kind, value, elapsed = await asyncio.wait_for(
+                        events.get(), timeout
+                    )
+                except asyncio.TimeoutError:
+                    self.record_hedge(running[max(running)][0])
+                    launch()
+                    continue
+
+                backend = running[index][0]
+                if winner is None:
+                    if kind == "error":
+                        self.record_failure(backend, value)
+                        errors.append(value)
+                        del running[index]
+                        if not running:
+                            if not pending:
+                                raise self.all_failed(errors)
+                            launch()
+                        continue
+                    winner = index
+                    self.record_success(backend, elapsed)
+                    for other, (_, task) in running.items():
+                        if other != winner:
+                            task.cancel()
+                if index != winner:
+                    continue
+                if kind == "content":
+                    yield value
+                elif kind == "done":
+                    return
+                else:
+                    self.record_failure(backend, value)
+                    raise value
+        finally:
+            for _, task in running.values():
+                task.cancel()
+
+    def complete(self, messages, model, max_tokens=None):
+        backends, _ = self.route(model)
+        errors = []
+        for backend, wait in self.attempts(backends, errors):
+            time.sleep(wait)
+            try:
+                content = backend.complete(messages, model, max_tokens=max_tokens)
+            except BackendError as e:
+                self.record_failure(backend, e)
+                errors.append(e)
+                continue
+            # Full-completion time is not a TTFT sample, so only count it
+            self.record_success(backend)
+            return content
+        raise self.all_failed(errors)
+
+    async def acomplete(self, messages, model, max_tokens=None):
+        backends, _ = self.route(model)
+        errors = []
+        for backend, wait in self.attempts(backends, errors):
+            await asyncio.sleep(wait)
+            try:
+                content = await backend.acomplete(messages, model, max_tokens=max_tokens)
+            except BackendError as e:
+                self.record_failure(backend, e)
+                errors.append(e)
+                continue
+            # Full-completion time is not a TTFT sample, so only count it
+            self.record_success(backend)
+            return content
+        raise self.all_failed(errors)
+
+
+def get_router():
+    # One router per process, so health and latency stats are shared
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = LLMRouter(
+                [build_backend(config) for config in settings.LLM_BACKENDS],
+                routes=settings.LLM_ROUTES,
+                hedge_after=settings.LLM_HEDGE_AFTER,
+                cooldown=settings.LLM_BACKEND_COOLDOWN,
+                max_attempts=settings.LLM_FAILOVER_ATTEMPTS,
+            )
+    return _router
@@ -0,0 +1,869 @@
+# Standard library
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+# Django / third-party
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import RedisError
+
+# Local app imports
+from .embeddings import embed, embedding_id
+
+logger = logging.getLogger(__name__)
+
+# redis.asyncio clients, one per event loop (for the ASGI stream view)
+_async_redis_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis(alias="default"):
+    loop = asyncio.get_running_loop()
+    client = _async_redis_clients.get(loop)
+    if client is None:
+        client = AsyncRedis.from_url(settings.CACHES[alias]["LOCATION"])
+        _async_redis_clients[loop] = client
+    return client
+
+
+# Replace a conversation list only if no write bumped its version since the
+# caller read it (KEYS: list, version; ARGV: version, ttl, items...), so a
+# fill built from an older DB read cannot hide a message appended meanwhile
+CONVERSATION_FILL = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+if #ARGV > 2 then
+    redis.call('RPUSH', KEYS[1], unpack(ARGV, 3))
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+
+# Write-through conversation cache (one Redis list per chat)
+class ConversationCache:
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self.max_size = settings.CONVERSATION_CACHE_SIZE
+        self.timeout = settings.CONVERSATION_CACHE_TIMEOUT
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.alias)
+
+    def key(self, chat_id):
+        return cache.make_key(f"chat_conversation:{chat_id}")
+
+    def version_key(self, chat_id):
+        # Bumped by every write, filled or not
+        return cache.make_key(f"chat_conversation_version:{chat_id}")
+
+    def encode(self, role, content):
+        return json.dumps({"role": role, "text": content})
+
+    def get(self, chat_id):
+        try:
+            items = self.redis.lrange(self.key(chat_id), 0, -1)
+        except RedisError as e:
+            logger.warning("Conversation cache read failed: %s", e)
+            items = []
+
+        if not items:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [json.loads(item) for item in items]
+
+    def version(self, chat_id):
+        # Read before querying the database; pass to fill(). None skips the fill.
+        try:
+            return (self.redis.get(self.version_key(chat_id)) or b"").decode()
+        except RedisError as e:
+            logger.warning("Conversation cache read failed: %s", e)
+            return None
+
+    def fill(self, chat_id, messages, version):
+        # messages: iterable of (role, content) in chronological order
+        if version is None:
+            return
+        items = [self.encode(role, content) for role, content in messages]
+        try:
+            self.redis.register_script(CONVERSATION_FILL)(
+                keys=[self.key(chat_id), self.version_key(chat_id)],
+                args=[version, self.timeout, *items[-self.max_size :]],
+            )
+        except RedisError as e:
+            logger.warning("Conversation cache fill failed: %s", e)
+
+    def bump(self, pipe, chat_id):
+        version_key = self.version_key(chat_id)
+        pipe.incr(version_key)
+        pipe.expire(version_key, self.timeout)
+
+    def append(self, chat_id, role, content):
+        # RPUSHX only appends to a list that is already cached, so a partial
+        # list is never mistaken for the whole conversation
+        key = self.key(chat_id)
+        try:
+            pipe = self.redis.pipeline()
+            self.bump(pipe, chat_id)
+            pipe.rpushx(key, self.encode(role, content))
+            pipe.ltrim(key, -self.max_size, -1)
+            pipe.expire(key, self.timeout)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning("Conversation cache append failed: %s", e)
+
+    def invalidate(self, chat_id):
+        try:
+            pipe = self.redis.pipeline()
+            self.bump(pipe, chat_id)
+            pipe.delete(self.key(chat_id))
+            pipe.execute()
+        except RedisError as e:
+            logger.warning("Conversation cache invalidate failed: %s", e)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+# Upsert one chat into a filled recent-chats index, trimming it to max size.
+# The index is an exact prefix of the user's (-updated_at, -id) ordering, so
+# it is only touched once filled; the "~complete" field of the titles hash
+# marks that the prefix is the whole list.
+RECENT_CHATS_UPSERT = """
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+local extra = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[4])
+if extra > 0 then
+    local dropped = redis.call('ZRANGE', KEYS[1], 0, extra - 1)
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, extra - 1)
+    redis.call('HDEL', KEYS[2], unpack(dropped))
+    redis.call('HSET', KEYS[2], '~complete', '0')
+end
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+return 1
+"""
+
+# Rebuild the index only if no write bumped its version since the caller
+# read it (KEYS: index, titles, version; ARGV: version, ttl, complete, then
+# member, score, title for each row)
+RECENT_CHATS_FILL = """
+if (redis.call('GET', KEYS[3]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+for i = 4, #ARGV, 3 do
+    redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+    redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 2])
+end
+if #ARGV > 3 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+redis.call('HSET', KEYS[2], '~complete', ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+# Set a chat's last-message marker ("owner id:message id") unless it already
+# names a newer message, so racing writers cannot move it backwards
+RAISE_MESSAGE_MARKER = """
+local current = redis.call('GET', KEYS[1])
+if current and tonumber(string.match(current, ':(%d+)$')) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1] .. ':' .. ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+# (owner id, last message id) per chat: lets idle polls answer without the DB
+class MessageMarkers:
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self.timeout = settings.MESSAGE_MARKER_TIMEOUT
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.alias)
+
+    def key(self, chat_id):
+        return cache.make_key(f"chat_last_message:{chat_id}")
+
+    def get(self, chat_id):
+        # None when unset or unreadable; callers fall back to the database
+        try:
+            value = self.redis.get(self.key(chat_id))
+        except RedisError as e:
+            logger.warning("Message marker read failed: %s", e)
+            return None
+        if value is None:
+            return None
+        user_id, message_id = value.decode().split(":")
+        return int(user_id), int(message_id)
+
+    def raise_to(self, chat_id, user_id, message_id):
+        try:
+            self.redis.register_script(RAISE_MESSAGE_MARKER)(
+                keys=[self.key(chat_id)], args=[user_id, message_id, self.timeout]
+            )
+        except RedisError as e:
+            logger.warning("Message marker update failed: %s", e)
+
+    def delete(self, chat_id):
+        # Only when the newest message goes away; the next read rebuilds it
+        try:
+            self.redis.delete(self.key(chat_id))
+        except RedisError as e:
+            logger.warning("Message marker delete failed: %s", e)
+
+
+# Per-user index of the most recently updated chats (sidebar first page)
+class RecentChatsCache:
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self.max_size = settings.RECENT_CHATS_SIZE
+        self.timeout = settings.RECENT_CHATS_TIMEOUT
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.alias)
+
+    def keys(self, user_id):
+        # Sorted set of chat ids scored by updated_at (microseconds) + titles
+        return (
+            cache.make_key(f"recent_chats:{user_id}"),
+            cache.make_key(f"recent_chats:{user_id}:titles"),
+        )
+
+    def version_key(self, user_id):
+        # Bumped by every write, filled or not
+        return cache.make_key(f"recent_chats:{user_id}:version")
+
+    def member(self, chat_id):
+        # Zero-padded, so equal scores order by id like the database does
+        return f"{chat_id:012d}"
+
+    def page(self, user_id, limit):
+        # First `limit` (+1 to detect more) rows, or None when not cached
+        # or when the cached prefix is too short to answer
+        index_key, titles_key = self.keys(user_id)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zrevrange(index_key, 0, limit, withscores=True)
+            pipe.hget(titles_key, "~complete")
+            members, complete = pipe.execute()
+            titles = self.redis.hmget(titles_key, [m for m, _ in members]) if members else []
+        except RedisError as e:
+            logger.warning("Recent chats cache read failed: %s", e)
+            members, complete = [], None
+
+        if (
+            complete is None
+            or (len(members) <= limit and complete != b"1")
+            or None in titles
+        ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [
+            {"id": int(member), "title": title.decode(), "updated_at": int(score)}
+            for (member, score), title in zip(members, titles)
+        ]
+
+    def version(self, user_id):
+        # Read before querying the database; pass to fill(). None skips the fill.
+        try:
+            return (self.redis.get(self.version_key(user_id)) or b"").decode()
+        except RedisError as e:
+            logger.warning("Recent chats cache read failed: %s", e)
+            return None
+
+    def fill(self, user_id, rows, complete, version):
+        # rows: newest-first dicts with id, title and updated_at
+        if version is None:
+            return
+        args = [version, self.timeout, "1" if complete else "0"]
+        for row in rows[: self.max_size]:
+            args += [self.member(row["id"]), row["updated_at"], row["title"]]
+        try:
+            self.redis.register_script(RECENT_CHATS_FILL)(
+                keys=[*self.keys(user_id), self.version_key(user_id)], args=args
+            )
+        except RedisError as e:
+            logger.warning("Recent chats cache fill failed: %s", e)
+
+    def upsert(self, user_id, chat_id, title, updated_at):
+        try:
+            self.redis.register_script(RECENT_CHATS_UPSERT)(
+                keys=[*self.keys(user_id), self.version_key(user_id)],
+                args=[self.member(chat_id), updated_at, title, self.max_size, self.timeout],
+            )
+        except RedisError as e:
+            logger.warning("Recent chats cache update failed: %s", e)
+
+    def remove(self, user_id, chat_id):
+        # Removing a member keeps the rest an exact prefix of the ordering
+        index_key, titles_key = self.keys(user_id)
+        try:
+            pipe = self.redis.pipeline()
+            self.bump(pipe, user_id)
+            pipe.zrem(index_key, self.member(chat_id))
+            pipe.hdel(titles_key, self.member(chat_id))
+            pipe.execute()
+        except RedisError as e:
+            logger.warning("Recent chats cache remove failed: %s", e)
+
+    def bump(self, pipe, user_id):
+        version_key = self.version_key(user_id)
+        pipe.incr(version_key)
+        pipe.expire(version_key, self.timeout)
+
+    def invalidate(self, user_id):
+        try:
+            pipe = self.redis.pipeline()
+            self.bump(pipe, user_id)
+            pipe.delete(*self.keys(user_id))
+            pipe.execute()
+        except RedisError as e:
+            logger.warning("Recent chats cache invalidate failed: %s", e)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+# Content-addressed cache for extracted upload text (Redis + optional disk tier)
+class ExtractedTextCache:
+    # Disk tier is pruned every N local writes
+    PRUNE_EVERY = 100
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self.max_bytes = settings.UPLOAD_CACHE_MAX_BYTES
+        self.max_entry_bytes = settings.UPLOAD_CACHE_MAX_ENTRY_BYTES
+        self.timeout = settings.UPLOAD_CACHE_TIMEOUT
+        self.disk_dir = (
+            Path(settings.UPLOAD_CACHE_DIR) if settings.UPLOAD_CACHE_DIR else None
+        )
+        self.disk_max_bytes = settings.UPLOAD_CACHE_DISK_MAX_BYTES
+        self.disk_writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.alias)
+
+    def key(self, digest, variant):
+        return cache.make_key(f"upload_text:{digest}:{variant}")
+
+    @property
+    def index_key(self):
+        # Sorted set of cached keys scored by last access, for LRU eviction
+        return cache.make_key("upload_text:index")
+
+    @property
+    def sizes_key(self):
+        return cache.make_key("upload_text:sizes")
+
+    @property
+    def total_key(self):
+        return cache.make_key("upload_text:bytes")
+
+    def encode(self, text, truncated):
+        return ("1" if truncated else "0") + text
+
+    def decode(self, value):
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return value[1:], value[0] == "1"
+
+    def get(self, digest, variant):
+        value = self.disk_get(digest, variant)
+        if value is not None:
+            self.hits += 1
+            return self.decode(value)
+
+        key = self.key(digest, variant)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.get(key)
+            pipe.zadd(self.index_key, {key: time.time()}, xx=True)
+            value = pipe.execute()[0]
+        except RedisError as e:
+            logger.warning("Upload text cache read failed: %s", e)
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value = value.decode("utf-8")
+        self.disk_set(digest, variant, value)
+        return self.decode(value)
+
+    def set(self, digest, variant, text, truncated):
+        value = self.encode(text, truncated)
+        size = len(value.encode("utf-8"))
+        if size > self.max_entry_bytes:
+            return
+        self.disk_set(digest, variant, value)
+
+        key = self.key(digest, variant)
+        try:
+            previous = int(self.redis.hget(self.sizes_key, key) or 0)
+            pipe = self.redis.pipeline()
+            pipe.set(key, value, ex=self.timeout)
+            pipe.zadd(self.index_key, {key: time.time()})
+            pipe.hset(self.sizes_key, key, size)
+            pipe.incrby(self.total_key, size - previous)
+            total = pipe.execute()[-1]
+            if total > self.max_bytes:
+                self.evict(total)
+        except RedisError as e:
+            logger.warning("Upload text cache write failed: %s", e)
+
+    def evict(self, total):
+        # Drop least recently used entries until back under the byte budget
+        while total > self.max_bytes:
+            oldest = self.redis.zpopmin(self.index_key, 16)
+            if not oldest:
+                break
+            keys = [key for key, _ in oldest]
+            sizes = self.redis.hmget(self.sizes_key, keys)
+            freed = sum(int(size or 0) for size in sizes)
+            pipe = self.redis.pipeline()
+            pipe.delete(*keys)
+            pipe.hdel(self.sizes_key, *keys)
+            pipe.decrby(self.total_key, freed)
+            total = pipe.execute()[-1]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    # Local disk tier
+    def disk_path(self, digest, variant):
+        return self.disk_dir / digest[:2] / f"{digest}-{variant}.txt"
+
+    def disk_get(self, digest, variant):
+        if not self.disk_dir:
+            return None
+        path = self.disk_path(digest, variant)
+        try:
+            value = path.read_text(encoding="utf-8")
+            os.utime(path)
+            return value
+        except OSError:
+            return None
+
+    def disk_set(self, digest, variant, value):
+        if not self.disk_dir:
+            return
+        path = self.disk_path(digest, variant)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=path.parent, delete=False
+            ) as tmp:
+                tmp.write(value)
+            os.replace(tmp.name, path)
+        except OSError as e:
+            logger.warning("Upload text disk cache write failed: %s", e)
+            return
+
+        self.disk_writes += 1
+        if self.disk_writes % self.PRUNE_EVERY == 0:
+            self.disk_prune()
+
+    def disk_prune(self):
+        entries = []
+        total = 0
+        for path in self.disk_dir.glob("*/*.txt"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.disk_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+# Response cache for repeated prompts: exact tier + embedding similarity tier
+class ResponseCache:
+    # Per-process vector indexes kept in memory (namespace -> index)
+    MAX_LOCAL_INDEXES = 256
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self.enabled = settings.RESPONSE_CACHE_ENABLED
+        self.timeout = settings.RESPONSE_CACHE_TIMEOUT
+        self.max_entries = settings.RESPONSE_CACHE_MAX_ENTRIES
+        self.threshold = settings.RESPONSE_CACHE_SIMILARITY
+        self.window = settings.RESPONSE_CACHE_WINDOW
+        self.shared = settings.RESPONSE_CACHE_SHARED
+        self.max_prompt_chars = settings.RESPONSE_CACHE_MAX_PROMPT_CHARS
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.alias)
+
+    def normalize(self, text):
+        return " ".join(text.lower().split())
+
+    def split(self, model, messages, user_id):
+        # Namespace = model + user (unless shared) + system prompts + every
+        # earlier turn; the last user message is matched exactly or by
+        # similarity inside it. Conversations longer than the window are
+        # not cached, so a follow-up never gets another chat's answer.
+        system = [msg["content"] for msg in messages if msg["role"] == "system"]
+        turns = [msg for msg in messages if msg["role"] != "system"]
+        if not turns or len(turns) > self.window or turns[-1]["role"] != "user":
+            return None
+        question = self.normalize(turns[-1]["content"])
+        if not question or len(question) > self.max_prompt_chars:
+            return None
+        context = json.dumps(
+            [
+                model,
+                embedding_id(),
+                None if self.shared else user_id,
+                system,
+                [(msg["role"], self.normalize(msg["content"])) for msg in turns[:-1]],
+            ]
+        )
+        namespace = hashlib.sha256(context.encode("utf-8")).hexdigest()[:32]
+        entry_id = hashlib.sha256(question.encode("utf-8")).hexdigest()[:32]
+        return namespace, entry_id, question
+
+    def key(self, namespace, suffix):
+        return cache.make_key(f"response_cache:{namespace}:{suffix}")
+
+    def lookup(self, model, messages, user_id):
+        if not self.enabled:
+            return None
+        parts = self.split(model, messages, user_id)
+        if parts is None:
+            return None
+        namespace, entry_id, question = parts
+
+        try:
+            value = self.redis.get(self.key(namespace, f"entry:{entry_id}"))
+            if value is None:
+                entry_id = self.nearest(namespace, question)
+                if entry_id is not None:
+                    value = self.redis.get(self.key(namespace, f"entry:{entry_id}"))
+                    if value is None:
+                        # Entry expired; drop its vector
+                        self.redis.hdel(self.key(namespace, "vectors"), entry_id)
+                    else:
+                        self.semantic_hits += 1
+            if value is not None:
+                self.redis.zadd(self.key(namespace, "lru"), {entry_id: time.time()})
+        except RedisError as e:
+            logger.warning("Response cache read failed: %s", e)
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value.decode("utf-8")
+
+    def nearest(self, namespace, question):
+        version = self.redis.get(self.key(namespace, "version"))
+        if version is None:
+            return None
+        # The LRU is shared by request threads: every access holds the lock,
+        # the rebuild itself runs outside it
+        with self.lock:
+            index = self.indexes.get(namespace)
+            if index is not None and index[0] == version:
+                self.indexes.move_to_end(namespace)
+            else:
+                index = None
+        if index is None:
+            vectors = self.redis.hgetall(self.key(namespace, "vectors"))
+            if not vectors:
+                return None
+            ids = [entry_id.decode("utf-8") for entry_id in vectors]
+            matrix = np.vstack(
+                [np.frombuffer(vector, dtype=np.float32) for vector in vectors.values()]
+            )
+            index = (version, ids, matrix)
+            with self.lock:
+                self.indexes[namespace] = index
+                self.indexes.move_to_end(namespace)
+                if len(self.indexes) > self.MAX_LOCAL_INDEXES:
+                    self.indexes.popitem(last=False)
+
+        _, ids, matrix = index
+        scores = matrix @ embed([question])[0]
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return ids[best]
+
+    def store(self, model, messages, response, user_id):
+        if not self.enabled or not response:
+            return
+        parts = self.split(model, messages, user_id)
+        if parts is None:
+            return
+        namespace, entry_id, question = parts
+        vector = embed([question])[0].astype(np.float32).tobytes()
+
+        lru_key = self.key(namespace, "lru")
+        vectors_key = self.key(namespace, "vectors")
+        version_key = self.key(namespace, "version")
+        try:
+            pipe = self.redis.pipeline()
+            pipe.set(self.key(namespace, f"entry:{entry_id}"), response, ex=self.timeout)
+            pipe.hset(vectors_key, entry_id, vector)
+            pipe.zadd(lru_key, {entry_id: time.time()})
+            pipe.incr(version_key)
+            for key in (vectors_key, lru_key, version_key):
+                pipe.expire(key, self.timeout)
+            pipe.zcard(lru_key)
+            size = pipe.execute()[-1]
+
+            # LRU eviction inside the namespace
+            if size > self.max_entries:
+                evicted = [
+                    entry.decode("utf-8")
+                    for entry, _ in self.redis.zpopmin(lru_key, size - self.max_entries)
+                ]
+                pipe = self.redis.pipeline()
+                pipe.delete(
+                    *[self.key(namespace, f"entry:{entry}") for entry in evicted]
+                )
+                pipe.hdel(vectors_key, *evicted)
+                pipe.incr(version_key)
+                pipe.execute()
+        except RedisError as e:
+            logger.warning("Response cache write failed: %s", e)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+# Drop the active-generation pointer only if it still names this turn
+CLEAR_ACTIVE_GENERATION = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+# Token buffers for in-flight generations (one Redis Stream per chat turn).
+# The generation publishes events here; every SSE connection for the turn
+# replays and tails the stream, so clients can resume with Last-Event-ID.
+class GenerationStreams:
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self.timeout = settings.GENERATION_STREAM_TIMEOUT
+        self.block_ms = settings.GENERATION_BLOCK_MS
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.alias)
+
+    @property
+    def aredis(self):
+        return get_async_redis(self.alias)
+
+    def key(self, chat_id, turn):
+        return cache.make_key(f"chat_generation:{chat_id}:{turn}")
+
+    def active_key(self, chat_id):
+        return cache.make_key(f"chat_generation_active:{chat_id}")
+
+    def cancel_key(self, chat_id, turn):
+        return cache.make_key(f"chat_generation_cancel:{chat_id}:{turn}")
+
+    def text_key(self, chat_id, turn):
+        # Answer text so far, for readers that want the message, not events
+        return cache.make_key(f"chat_generation_text:{chat_id}:{turn}")
+
+    def encode(self, payload):
+        return {"data": json.dumps(payload)}
+
+    def start(self, chat_id, turn):
+        key = self.key(chat_id, turn)
+        pipe = self.redis.pipeline()
+        pipe.xadd(key, self.encode({"type": "start", "turn": str(turn)}))
+        pipe.expire(key, self.timeout)
+        pipe.set(self.active_key(chat_id), str(turn), ex=self.timeout)
+        pipe.set(self.text_key(chat_id, turn), "", ex=self.timeout)
+        pipe.execute()
+
+    def publish(self, chat_id, turn, payload):
+        pipe = self.redis.pipeline()
+        self.queue_publish(pipe, chat_id, turn, payload)
+        pipe.execute()
+
+    def queue_publish(self, pipe, chat_id, turn, payload):
+        # Every event pushes the expiry back, so generations longer than
+        # the timeout keep their stream, active marker and text
+        key = self.key(chat_id, turn)
+        pipe.xadd(key, self.encode(payload))
+        pipe.expire(key, self.timeout)
+        pipe.expire(self.active_key(chat_id), self.timeout)
+        if payload["type"] == "content":
+            text_key = self.text_key(chat_id, turn)
+            pipe.append(text_key, payload["content"])
+            pipe.expire(text_key, self.timeout)
+
+    def finish(self, chat_id, turn, payload):
+        # Final event; the buffer stays readable for late reconnects until expiry
+        key = self.key(chat_id, turn)
+        pipe = self.redis.pipeline()
+        pipe.xadd(key, self.encode(payload))
+        pipe.expire(key, self.timeout)
+        pipe.delete(self.cancel_key(chat_id, turn))
+        pipe.delete(self.text_key(chat_id, turn))
+        pipe.execute()
+        self.redis.register_script(CLEAR_ACTIVE_GENERATION)(
+            keys=[self.active_key(chat_id)], args=[str(turn)]
+        )
+
+    async def apublish(self, chat_id, turn, payload):
+        pipe = self.aredis.pipeline()
+        self.queue_publish(pipe, chat_id, turn, payload)
+        await pipe.execute()
+
+    async def afinish(self, chat_id, turn, payload):
+        key = self.key(chat_id, turn)
+        pipe = self.aredis.pipeline()
+        pipe.xadd(key, self.encode(payload))
+        pipe.expire(key, self.timeout)
+        pipe.delete(self.cancel_key(chat_id, turn))
+        pipe.delete(self.text_key(chat_id, turn))
+        await pipe.execute()
+        await self.aredis.eval(
+            CLEAR_ACTIVE_GENERATION, 1, self.active_key(chat_id), str(turn)
+        )
+
+    def active(self, chat_id):
+        try:
+            turn = self.redis.get(self.active_key(chat_id))
+        except RedisError as e:
+            logger.warning("Active generation lookup failed: %s", e)
+            return None
+        return turn.decode() if turn else None
+
+    def progress(self, chat_id):
+        # (active turn, characters generated so far), or None when idle
+        turn = self.active(chat_id)
+        if turn is None:
+            return None
+        try:
+            return turn, self.redis.strlen(self.text_key(chat_id, turn))
+        except RedisError as e:
+            logger.warning("Generation progress lookup failed: %s", e)
+            return None
+
+    def running(self, chat_id, turns):
+        # The turns whose generation has not finished (its text buffer lives
+        # from start() to finish()). Redis errors propagate, so an outage is
+        # never taken for a crashed generation.
+        pipe = self.redis.pipeline(transaction=False)
+        for turn in turns:
+            pipe.exists(self.text_key(chat_id, turn))
+        return {turn for turn, exists in zip(turns, pipe.execute()) if exists}
+
+    def partial(self, chat_id, turn):
+        # Answer text so far ("" once finished or unknown)
+        try:
+            text = self.redis.get(self.text_key(chat_id, turn))
+        except RedisError as e:
+            logger.warning("Partial answer read failed: %s", e)
+            return ""
+        return text.decode() if text else ""
+
+    def cancel(self, chat_id, turn):
+        self.redis.set(self.cancel_key(chat_id, turn), 1, ex=self.timeout)
+
+    def cancelled(self, chat_id, turn):
+        return bool(self.redis.exists(self.cancel_key(chat_id, turn)))
+
+    async def acancelled(self, chat_id, turn):
+        return bool(await self.aredis.exists(self.cancel_key(chat_id, turn)))
+
+    def decode_entries(self, response):
+        # XREAD reply for one key -> [(entry id, payload)]
+        entries = response[0][1] if response else []
+        return [
+            (entry_id.decode(), json.loads(fields[b"data"])) for entry_id, fields in entries
+        ]
+
+    def read(self, chat_id, turn, last_id):
+        # Events after last_id, blocking up to block_ms for new ones.
+        # Returns None once the buffer is gone (unknown or expired turn).
+        key = self.key(chat_id, turn)
+        response = self.redis.xread({key: last_id}, block=self.block_ms, count=100)
+        if not response and not self.redis.exists(key):
+            return None
+        return self.decode_entries(response)
+
+    async def aread(self, chat_id, turn, last_id):
+        key = self.key(chat_id, turn)
+        response = await self.aredis.xread({key: last_id}, block=self.block_ms, count=100)
+        if not response and not await self.aredis.exists(key):
+            return None
+        return self.decode_entries(response)
@@ -0,0 +1,68 @@
+# Local CPU text embeddings.
+# Uses fastembed (ONNX, no GPU) when installed and EMBEDDING_MODEL is set,
+# otherwise a feature-hashing embedding over words, bigrams and trigrams.
+
+# Standard library
+import hashlib
+import logging
+import re
+from functools import lru_cache
+
+# Django / third-party
+import numpy as np
+from django.conf import settings
+
+try:
+    from fastembed import TextEmbedding
+except ImportError:  # pragma: no cover - optional dependency
+    TextEmbedding = None
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=1)
+def get_model():
+    if TextEmbedding is None or not settings.EMBEDDING_MODEL:
+        return None
+    try:
+        return TextEmbedding(settings.EMBEDDING_MODEL)
+    except Exception as e:
+        logger.warning("Embedding model %s unavailable: %s", settings.EMBEDDING_MODEL, e)
+        return None
+
+
+def embedding_id():
+    # Identifies the vector space, so indexes built by different backends never mix
+    if get_model() is not None:
+        return f"fastembed:{settings.EMBEDDING_MODEL}"
+    return f"hash:{settings.EMBEDDING_HASH_DIM}"
+
+
+def hashed_embedding(text, dim):
+    vector = np.zeros(dim, dtype=np.float32)
+    words = WORD_RE.findall(text.lower())
+    features = words + [" ".join(words[i : i + 2]) for i in range(len(words) - 1)]
+    features += [word[i : i + 3] for word in words for i in range(len(word) - 2)]
+    for feature in features:
+        value = int.from_bytes(
+            hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little"
+        )
+        vector[value % dim] += -1.0 if value >> 63 else 1.0
+    return vector
+
+
+def embed(texts):
+    # Returns an (n, dim) float32 matrix of L2-normalized rows
+    model = get_model()
+    if model is not None:
+        matrix = np.array(list(model.embed(list(texts))), dtype=np.float32)
+    else:
+        matrix = np.array(
+            [hashed_embedding(text, settings.EMBEDDING_HASH_DIM) for text in texts],
+            dtype=np.float32,
+        ).reshape(-1, settings.EMBEDDING_HASH_DIM)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
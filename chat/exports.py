@@ -0,0 +1,198 @@
+# Chat history export and import as NDJSON.
+# The stream is a {"type": "chat"} line followed by that chat's
+# {"type": "message"} lines, for every chat in id order. Rows are read in
+# keyset pages (mysqlclient buffers a whole result set even under
+# QuerySet.iterator()), so memory stays flat whatever the history size.
+# Archived chats are exported from their archive without restoring them.
+
+# Standard library
+import json
+import zlib
+from datetime import datetime
+
+# Django / third-party
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+
+# Local app imports
+from .archive import FIELDS
+from .models import Chat, Message
+
+CHAT_FIELDS = ["id", "title", "created_at", "updated_at", "archive_key"]
+
+
+def encode(record):
+    return json.dumps(record, ensure_ascii=False, default=datetime.isoformat) + "\n"
+
+
+def gzip_stream(lines, level=1, block_size=64 * 1024):
+    # Gzip-compresses an iterable of str lines on the fly, block_size
+    # characters at a time. Level 1 compresses chat text ~6x faster than
+    # the default 6 for a 15% larger file.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    block = []
+    size = 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= block_size:
+            data = compressor.compress("".join(block).encode("utf-8"))
+            block = []
+            size = 0
+            if data:
+                yield data
+    yield compressor.compress("".join(block).encode("utf-8")) + compressor.flush()
+
+
+# Streams chats and their messages as NDJSON lines
+class ChatExporter:
+    def __init__(self, archive, batch_size=None):
+        self.archive = archive
+        self.batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+
+    def chat_pages(self, chats):
+        last_id = 0
+        while True:
+            page = list(
+                chats.filter(id__gt=last_id)
+                .order_by("id")
+                .values("user__username", *CHAT_FIELDS)[: self.batch_size]
+            )
+            if not page:
+                return
+            yield page
+            last_id = page[-1]["id"]
+
+    def messages(self, chat_ids):
+        # Messages of `chat_ids` ordered by (chat, id), a page at a time
+        rows = Message.objects.filter(chat_id__in=chat_ids).order_by("chat_id", "id")
+        after = Q()
+        while True:
+            page = list(
+                rows.filter(after).values("id", "chat_id", "created_at", *FIELDS)[
+                    : self.batch_size
+                ]
+            )
+            yield from page
+            if len(page) < self.batch_size:
+                return
+            last = page[-1]
+            after = Q(chat_id__gt=last["chat_id"]) | Q(
+                chat_id=last["chat_id"], id__gt=last["id"]
+            )
+
+    def lines(self, user_id=None):
+        chats = Chat.objects.all()
+        if user_id is not None:
+            chats = chats.filter(user_id=user_id)
+        for page in self.chat_pages(chats):
+            messages = self.messages([chat["id"] for chat in page])
+            message = next(messages, None)
+            for chat in page:
+                archive_key = chat.pop("archive_key")
+                yield encode({"type": "chat", "user": chat.pop("user__username"), **chat})
+                while message is not None and message["chat_id"] <= chat["id"]:
+                    if message["chat_id"] == chat["id"]:
+                        yield encode({"type": "message", **message})
+                    message = next(messages, None)
+                if archive_key:
+                    for rows in self.archive.read(archive_key):
+                        for row in rows:
+                            row.pop("attachments")
+                            yield encode({"type": "message", "chat_id": chat["id"], **row})
+
+
+# Creates chats and messages from exported NDJSON lines, in batches
+class ChatImporter:
+    def __init__(self, user=None, create_users=False, batch_size=None):
+        # user: import everything for this user instead of by username
+        self.user = user
+        self.create_users = create_users
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.users = {}
+        self.chat = None
+        self.chats = []
+        self.messages = []
+        self.chat_count = 0
+        self.message_count = 0
+        self.skipped = 0
+        self.user_ids = set()
+
+    def get_user(self, username):
+        if self.user is not None:
+            return self.user
+        if username not in self.users:
+            user_model = get_user_model()
+            user = user_model.objects.filter(username=username).first()
+            if user is None and self.create_users:
+                user = user_model(username=username)
+                user.set_unusable_password()
+                user.save()
+            self.users[username] = user
+        return self.users[username]
+
+    def add_chat(self, record):
+        user = self.get_user(record["user"])
+        if user is None:
+            self.chat = None
+            self.skipped += 1
+            return
+        # One INSERT per chat: MySQL cannot return ids from bulk_create,
+        # and its messages need the new id
+        self.chat = Chat.objects.create(
+            user=user,
+            title=record["title"][:200],
+            created_at=datetime.fromisoformat(record["created_at"]),
+        )
+        # auto_now stamped updated_at; restored with the next batch
+        self.chat.updated_at = datetime.fromisoformat(record["updated_at"])
+        self.chats.append(self.chat)
+        self.user_ids.add(user.id)
+        self.chat_count += 1
+
+    def add_message(self, record):
+        if self.chat is None:
+            return
+        status = record.get("status", Message.COMPLETE)
+        self.messages.append(
+            Message(
+                chat=self.chat,
+                role=record["role"],
+                content=record["content"],
+                # A reply cut off by the export is not generating here
+                status=Message.CANCELLED if status == Message.STREAMING else status,
+                prompt_tokens=record.get("prompt_tokens"),
+                completion_tokens=record.get("completion_tokens"),
+                ttft_ms=record.get("ttft_ms"),
+                latency_ms=record.get("latency_ms"),
+                created_at=datetime.fromisoformat(record["created_at"]),
+            )
+        )
+
+    def flush(self):
+        Message.objects.bulk_create(self.messages)
+        self.message_count += len(self.messages)
+        Chat.objects.bulk_update(self.chats, ["updated_at"])
+        self.messages = []
+        # The current chat may still get messages, its row is kept for them
+        self.chats = self.chats[-1:]
+
+    def run(self, lines):
+        records = (json.loads(line) for line in lines if line.strip())
+        pending = True
+        while pending:
+            # One transaction per batch of messages
+            with transaction.atomic():
+                pending = False
+                for record in records:
+                    if record["type"] == "chat":
+                        self.add_chat(record)
+                    elif record["type"] == "message":
+                        self.add_message(record)
+                    if len(self.messages) >= self.batch_size:
+                        pending = True
+                        break
+                self.flush()
+        return self
@@ -0,0 +1,153 @@
+# Upload text extraction.
+# Kept free of Django imports so process-pool workers can import it directly.
+#
+# The timeout is checked between pages: PyPDF2 cannot be interrupted inside
+# extract_text(), so a single pathological page can overrun it. Pool workers
+# also stop at their next page boundary once the deadline has passed, since
+# cancelling a future cannot stop a task that is already running.
+
+# Standard library
+import codecs
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+# Third-party
+import PyPDF2
+
+PAGE_SEPARATOR = "\n\n"
+
+_pool = None
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def get_pool(max_workers):
+    # "spawn" keeps workers independent of the gevent/gunicorn parent state
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def extract_page_range(data, start, end, max_chars, deadline):
+    # Runs in a worker process: extract pages [start, end) up to max_chars,
+    # or until `deadline` (wall clock, shared across processes)
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    texts = []
+    total = 0
+    for index in range(start, end):
+        if time.time() > deadline:
+            break
+        text = reader.pages[index].extract_text() or ""
+        texts.append(text)
+        total += len(text) + len(PAGE_SEPARATOR)
+        if total >= max_chars:
+            break
+    return texts
+
+
+def iter_pages(reader, deadline):
+    for page in reader.pages:
+        if time.monotonic() > deadline:
+            raise ExtractionTimeout()
+        yield page.extract_text() or ""
+
+
+def iter_pages_parallel(data, num_pages, deadline, max_chars, workers):
+    # One contiguous page range per worker, yielded in order. Every range
+    # stops at max_chars, so a large document costs at most `workers` budgets.
+    pool = get_pool(workers)
+    chunk_pages = -(-num_pages // workers)
+    wall_deadline = time.time() + (deadline - time.monotonic())
+    pending = [
+        pool.submit(
+            extract_page_range,
+            data,
+            start,
+            min(start + chunk_pages, num_pages),
+            max_chars,
+            wall_deadline,
+        )
+        for start in range(0, num_pages, chunk_pages)
+    ]
+    try:
+        while pending:
+            yield from _wait(pending.pop(0), deadline)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _wait(future, deadline):
+    try:
+        return future.result(timeout=max(0, deadline - time.monotonic()))
+    except FutureTimeout:
+        future.cancel()
+        raise ExtractionTimeout()
+
+
+def collect(pages, max_chars):
+    # Join pages lazily until max_chars; returns (text, truncated, timed_out)
+    parts = []
+    total = 0
+    truncated = False
+    timed_out = False
+    try:
+        for text in pages:
+            if parts:
+                parts.append(PAGE_SEPARATOR)
+                total += len(PAGE_SEPARATOR)
+            parts.append(text)
+            total += len(text)
+            if total >= max_chars:
+                truncated = True
+                break
+    except ExtractionTimeout:
+        timed_out = True
+    finally:
+        pages.close()
+    return "".join(parts)[:max_chars], truncated, timed_out
+
+
+def extract_pdf_text(file, max_chars, timeout, parallel_min_pages=50, workers=1):
+    deadline = time.monotonic() + timeout
+    reader = PyPDF2.PdfReader(file)
+    num_pages = len(reader.pages)
+
+    if workers > 1 and num_pages >= parallel_min_pages:
+        file.seek(0)
+        data = file.read()
+        pages = iter_pages_parallel(data, num_pages, deadline, max_chars, workers)
+    else:
+        pages = iter_pages(reader, deadline)
+
+    text, truncated, timed_out = collect(pages, max_chars)
+    file.seek(0)
+    return text, truncated, timed_out
+
+
+def read_text(file, max_chars, chunk_size=64 * 1024):
+    # Decode UTF-8 incrementally and stop reading once max_chars are available
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts = []
+    total = 0
+    truncated = False
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            parts.append(decoder.decode(b"", final=True))
+            break
+        text = decoder.decode(chunk)
+        parts.append(text)
+        total += len(text)
+        if total > max_chars:
+            truncated = True
+            break
+    file.seek(0)
+    return "".join(parts)[:max_chars], truncated, False
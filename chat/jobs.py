@@ -0,0 +1,277 @@
+# Redis-backed generation job queue with fair per-user scheduling.
+# Web requests enqueue jobs; `manage.py run_generation_workers` processes
+# pull them, so LLM concurrency is sized apart from the web workers.
+
+# Standard library
+import json
+import logging
+import threading
+import time
+import uuid
+
+# Django / third-party
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+# Local app imports
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Append a job to its user's queue; a user enters the round-robin ring only
+# when their queue goes from empty to non-empty
+ENQUEUE = """
+local prefix = ARGV[1]
+if redis.call('RPUSH', prefix .. 'user:' .. ARGV[2], ARGV[3]) == 1 then
+    redis.call('RPUSH', prefix .. 'users', ARGV[2])
+end
+redis.call('LPUSH', prefix .. 'wakeup', 1)
+redis.call('LTRIM', prefix .. 'wakeup', 0, 99)
+return 1
+"""
+
+# Round-robin over users with queued jobs and take the first head job whose
+# user and model are both under their concurrency limits. Running jobs are
+# leases (sorted sets scored by deadline), so a crashed worker's slots free
+# themselves once the lease runs out; the `leases` set lets another worker
+# find and fail the jobs it was running.
+DEQUEUE = """
+local prefix = ARGV[1]
+local now = tonumber(ARGV[2])
+local deadline = tonumber(ARGV[3])
+local user_limit = tonumber(ARGV[4])
+local ring = prefix .. 'users'
+for i = 1, redis.call('LLEN', ring) do
+    local user = redis.call('LPOP', ring)
+    if not user then
+        return false
+    end
+    local queue = prefix .. 'user:' .. user
+    local job = redis.call('LINDEX', queue, 0)
+    if job then
+        local job_key = prefix .. 'job:' .. job
+        local model = redis.call('HGET', job_key, 'model') or ''
+        local model_limit = tonumber(redis.call('HGET', job_key, 'model_limit') or '0')
+        local user_running = prefix .. 'running:user:' .. user
+        local model_running = prefix .. 'running:model:' .. model
+        redis.call('ZREMRANGEBYSCORE', user_running, '-inf', now)
+        redis.call('ZREMRANGEBYSCORE', model_running, '-inf', now)
+        if (user_limit <= 0 or redis.call('ZCARD', user_running) < user_limit)
+            and (model_limit <= 0 or redis.call('ZCARD', model_running) < model_limit) then
+            redis.call('LPOP', queue)
+            redis.call('ZADD', user_running, deadline, job)
+            redis.call('ZADD', model_running, deadline, job)
+            redis.call('ZADD', prefix .. 'leases', deadline, job)
+            if redis.call('LLEN', queue) > 0 then
+                redis.call('RPUSH', ring, user)
+            end
+            return {job, user, model}
+        end
+        redis.call('RPUSH', ring, user)
+    end
+end
+return false
+"""
+
+
+# Generation job queue (one Redis list per user + a ring of waiting users)
+class GenerationQueue:
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self.prefix = cache.make_key("genq:")
+        self.user_limit = settings.GENERATION_USER_CONCURRENCY
+        self.lease = settings.GENERATION_JOB_LEASE
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.alias)
+
+    def job_key(self, job_id):
+        return f"{self.prefix}job:{job_id}"
+
+    def model_limit(self, model):
+        return settings.GENERATION_MODEL_LIMITS.get(
+            model, settings.GENERATION_MODEL_CONCURRENCY
+        )
+
+    def enqueue(self, user_id, model, payload):
+        # The job hash lives until release(): a job that waited too long is
+        # still found and failed, so its stream and rate limiter lease settle
+        job_id = uuid.uuid4().hex
+        self.redis.hset(
+            self.job_key(job_id),
+            mapping={
+                "user": user_id,
+                "model": model,
+                "model_limit": self.model_limit(model),
+                "payload": json.dumps(payload),
+                "enqueued_at": time.time(),
+            },
+        )
+        self.redis.register_script(ENQUEUE)(args=[self.prefix, user_id, job_id])
+        return job_id
+
+    def dequeue(self):
+        # Returns (job_id, job) or None when nothing is eligible; job["expired"]
+        # is set when it waited longer than its stream lives
+        now = time.time()
+        claimed = self.redis.register_script(DEQUEUE)(
+            args=[self.prefix, now, now + self.lease, self.user_limit]
+        )
+        if not claimed:
+            return None
+        job_id, user, model = (value.decode() for value in claimed)
+        job = {"user": user, "model": model}
+        payload, enqueued_at = self.redis.hmget(
+            self.job_key(job_id), ["payload", "enqueued_at"]
+        )
+        if payload is None:
+            # Hash lost (e.g. evicted): nothing to run, give the slots back
+            logger.warning("Generation job %s has no payload", job_id)
+            self.release(job_id, job)
+            return None
+        job["payload"] = json.loads(payload)
+        job["expired"] = (
+            now - float(enqueued_at or now) > settings.GENERATION_STREAM_TIMEOUT
+        )
+        return job_id, job
+
+    def extend(self, jobs):
+        # Renew the leases of jobs still running in this process
+        if not jobs:
+            return
+        deadline = time.time() + self.lease
+        pipe = self.redis.pipeline()
+        for job_id, job in jobs.items():
+            for key in (
+                f"{self.prefix}running:user:{job['user']}",
+                f"{self.prefix}running:model:{job['model']}",
+                f"{self.prefix}leases",
+            ):
+                pipe.zadd(key, {job_id: deadline}, xx=True)
+        pipe.execute()
+
+    def reclaim(self, limit=100):
+        # Jobs whose lease ran out, i.e. their worker died mid-generation.
+        # ZREM decides which worker reclaims each one.
+        leases = f"{self.prefix}leases"
+        reclaimed = []
+        for job_id in self.redis.zrangebyscore(leases, "-inf", time.time(), 0, limit):
+            if not self.redis.zrem(leases, job_id):
+                continue
+            job_id = job_id.decode()
+            fields = self.redis.hgetall(self.job_key(job_id))
+            job = {
+                "user": fields.get(b"user", b"").decode(),
+                "model": fields.get(b"model", b"").decode(),
+            }
+            if b"payload" in fields:
+                job["payload"] = json.loads(fields[b"payload"])
+            reclaimed.append((job_id, job))
+        return reclaimed
+
+    def release(self, job_id, job):
+        pipe = self.redis.pipeline()
+        pipe.zrem(f"{self.prefix}running:user:{job['user']}", job_id)
+        pipe.zrem(f"{self.prefix}running:model:{job['model']}", job_id)
+        pipe.zrem(f"{self.prefix}leases", job_id)
+        pipe.delete(self.job_key(job_id))
+        # Slots changed: let an idle worker re-check limited users
+        pipe.lpush(f"{self.prefix}wakeup", 1)
+        pipe.ltrim(f"{self.prefix}wakeup", 0, 99)
+        pipe.execute()
+
+    def wait(self, timeout):
+        # Block until something was enqueued or released (or timeout)
+        self.redis.blpop([f"{self.prefix}wakeup"], timeout=timeout)
+
+    def stats(self):
+        # None when Redis is unavailable
+        try:
+            users = self.redis.lrange(f"{self.prefix}users", 0, -1)
+            pipe = self.redis.pipeline()
+            for user in users:
+                pipe.llen(f"{self.prefix}user:{user.decode()}")
+            return {"waiting_users": len(users), "queued": sum(pipe.execute())}
+        except RedisError as e:
+            logger.warning("Generation queue stats failed: %s", e)
+            return None
+
+
+# Worker loop: one thread per concurrent generation, until `stop` is set.
+# `fail(payload, error)` answers jobs that cannot run: they waited too long
+# or the worker running them died.
+def run_worker(handler, fail, threads, stop, poll=1):
+    generation_queue = GenerationQueue()
+    running = {}
+
+    def give_up(job_id, job, error):
+        try:
+            if "payload" in job:
+                fail(job["payload"], error)
+        except Exception:
+            logger.exception("Generation job %s could not be failed", job_id)
+        finally:
+            generation_queue.release(job_id, job)
+            connections.close_all()
+
+    def heartbeat():
+        # Keep this process's leases alive (generations can outlast a lease)
+        # and fail the jobs of workers whose leases ran out
+        interval = max(1, generation_queue.lease // 3)
+        while not stop.wait(interval):
+            try:
+                generation_queue.extend(dict(running))
+                for job_id, job in generation_queue.reclaim():
+                    logger.warning("Generation job %s lost its worker", job_id)
+                    give_up(job_id, job, "The generation worker stopped unexpectedly.")
+            except RedisError as e:
+                logger.warning("Generation lease renewal failed: %s", e)
+
+    def loop():
+        while not stop.is_set():
+            try:
+                claimed = generation_queue.dequeue()
+                if claimed is None:
+                    generation_queue.wait(poll)
+                    # Idle workers still push their metrics out
+                    metrics.maybe_flush()
+                    continue
+            except RedisError as e:
+                logger.warning("Generation queue unavailable: %s", e)
+                stop.wait(poll)
+                continue
+
+            job_id, job = claimed
+            if job["expired"]:
+                try:
+                    give_up(job_id, job, "The request waited too long in the queue.")
+                except RedisError as e:
+                    logger.warning("Generation job %s release failed: %s", job_id, e)
+                continue
+            running[job_id] = job
+            try:
+                handler(job["payload"])
+            except Exception:
+                logger.exception("Generation job %s failed", job_id)
+            finally:
+                running.pop(job_id, None)
+                try:
+                    generation_queue.release(job_id, job)
+                except RedisError as e:
+                    logger.warning("Generation job %s release failed: %s", job_id, e)
+                connections.close_all()
+
+    workers = [
+        threading.Thread(target=loop, name=f"generation-worker-{i}", daemon=True)
+        for i in range(threads)
+    ]
+    threading.Thread(target=heartbeat, name="generation-heartbeat", daemon=True).start()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    metrics.flush()
@@ -0,0 +1,204 @@
+# Per-user limits for LLM generations, enforced in Redis before the LLM call:
+# requests/minute (sliding window log), concurrent streams (leases) and
+# tokens/day (token bucket refilled continuously over a day). Each check is
+# one Lua script call, i.e. a single round trip.
+
+# Standard library
+import logging
+import math
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+# Django / third-party
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+# Local app imports
+from .cache import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS: request log (zset), stream leases (zset), token bucket (hash)
+# ARGV: now, lease id, requests/min, max streams, tokens/day, lease seconds
+# Returns {0, 0, ""} when admitted, else {1, retry after ms, reason}
+ACQUIRE = """
+local now = tonumber(ARGV[1])
+local per_minute = tonumber(ARGV[3])
+local max_streams = tonumber(ARGV[4])
+local per_day = tonumber(ARGV[5])
+
+if per_minute > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - 60)
+    if redis.call('ZCARD', KEYS[1]) >= per_minute then
+        local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+        return {1, math.ceil((tonumber(oldest[2]) + 60 - now) * 1000), 'requests'}
+    end
+end
+
+if max_streams > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+    if redis.call('ZCARD', KEYS[2]) >= max_streams then
+        local first = redis.call('ZRANGE', KEYS[2], 0, 0, 'WITHSCORES')
+        return {1, math.ceil((tonumber(first[2]) - now) * 1000), 'streams'}
+    end
+end
+
+if per_day > 0 then
+    local bucket = redis.call('HMGET', KEYS[3], 'level', 'ts')
+    local level = tonumber(bucket[1]) or per_day
+    local ts = tonumber(bucket[2]) or now
+    level = math.min(per_day, level + (now - ts) * per_day / 86400)
+    redis.call('HSET', KEYS[3], 'level', level, 'ts', now)
+    redis.call('EXPIRE', KEYS[3], 172800)
+    if level <= 0 then
+        return {1, math.ceil((1 - level) * 86400 / per_day * 1000), 'tokens'}
+    end
+end
+
+if per_minute > 0 then
+    redis.call('ZADD', KEYS[1], now, ARGV[2])
+    redis.call('EXPIRE', KEYS[1], 60)
+end
+if max_streams > 0 then
+    redis.call('ZADD', KEYS[2], now + tonumber(ARGV[6]), ARGV[2])
+    redis.call('EXPIRE', KEYS[2], tonumber(ARGV[6]))
+end
+return {0, 0, ''}
+"""
+
+# KEYS: stream leases, token bucket, usage ledger (hash)
+# ARGV: now, lease id, tokens/day, prompt tokens, completion tokens, day
+SETTLE = """
+local now = tonumber(ARGV[1])
+local per_day = tonumber(ARGV[3])
+local used = tonumber(ARGV[4]) + tonumber(ARGV[5])
+redis.call('ZREM', KEYS[1], ARGV[2])
+if per_day > 0 and used > 0 then
+    local bucket = redis.call('HMGET', KEYS[2], 'level', 'ts')
+    local level = tonumber(bucket[1]) or per_day
+    local ts = tonumber(bucket[2]) or now
+    level = math.min(per_day, level + (now - ts) * per_day / 86400) - used
+    redis.call('HSET', KEYS[2], 'level', level, 'ts', now)
+    redis.call('EXPIRE', KEYS[2], 172800)
+end
+redis.call('HINCRBY', KEYS[3], ARGV[6] .. ':prompt', ARGV[4])
+redis.call('HINCRBY', KEYS[3], ARGV[6] .. ':completion', ARGV[5])
+redis.call('HINCRBY', KEYS[3], ARGV[6] .. ':requests', 1)
+redis.call('EXPIRE', KEYS[3], 3456000)
+return 1
+"""
+
+
+# Raised when a user is over a limit; retry_after in whole seconds
+class RateLimited(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Rate limit exceeded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# Request, concurrency and token limits per user (+ token usage ledger)
+class RateLimiter:
+    MESSAGES = {
+        "requests": "Too many requests, please slow down.",
+        "streams": "Too many answers in progress, wait for one to finish.",
+        "tokens": "Daily token quota used up.",
+    }
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self.per_minute = settings.RATE_LIMIT_REQUESTS_PER_MINUTE
+        self.max_streams = settings.RATE_LIMIT_CONCURRENT_STREAMS
+        self.per_day = settings.RATE_LIMIT_TOKENS_PER_DAY
+        self.lease = settings.RATE_LIMIT_STREAM_LEASE
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.alias)
+
+    @property
+    def aredis(self):
+        return get_async_redis(self.alias)
+
+    def keys(self, user_id):
+        return [
+            cache.make_key(f"ratelimit:requests:{user_id}"),
+            cache.make_key(f"ratelimit:streams:{user_id}"),
+            cache.make_key(f"ratelimit:tokens:{user_id}"),
+        ]
+
+    def ledger_key(self, user_id):
+        return cache.make_key(f"token_ledger:{user_id}")
+
+    def acquire_args(self, lease):
+        return [
+            time.time(), lease, self.per_minute, self.max_streams, self.per_day, self.lease
+        ]
+
+    def check(self, result):
+        denied, retry_after_ms, reason = result
+        if denied:
+            reason = reason.decode() if isinstance(reason, bytes) else reason
+            raise RateLimited(reason, max(1, math.ceil(retry_after_ms / 1000)))
+
+    def acquire(self, user_id):
+        # Returns a lease id to pass to settle(); raises RateLimited.
+        # Fails open (no limits) if Redis is unavailable.
+        lease = uuid.uuid4().hex
+        if not settings.RATE_LIMIT_ENABLED:
+            return lease
+        try:
+            result = self.redis.register_script(ACQUIRE)(
+                keys=self.keys(user_id), args=self.acquire_args(lease)
+            )
+        except RedisError as e:
+            logger.warning("Rate limiter unavailable: %s", e)
+            return lease
+        self.check(result)
+        return lease
+
+    async def aacquire(self, user_id):
+        lease = uuid.uuid4().hex
+        if not settings.RATE_LIMIT_ENABLED:
+            return lease
+        try:
+            result = await self.aredis.register_script(ACQUIRE)(
+                keys=self.keys(user_id), args=self.acquire_args(lease)
+            )
+        except RedisError as e:
+            logger.warning("Rate limiter unavailable: %s", e)
+            return lease
+        self.check(result)
+        return lease
+
+    def release(self, user_id, lease):
+        # Frees the stream slot of a request that never started generating
+        try:
+            self.redis.zrem(self.keys(user_id)[1], lease)
+        except RedisError as e:
+            logger.warning("Rate limiter release failed: %s", e)
+
+    def settle(self, user_id, lease, prompt_tokens=0, completion_tokens=0):
+        # Frees the stream slot and charges the tokens actually used
+        _requests, streams, tokens = self.keys(user_id)
+        day = datetime.now(dt_timezone.utc).strftime("%Y%m%d")
+        try:
+            self.redis.register_script(SETTLE)(
+                keys=[streams, tokens, self.ledger_key(user_id)],
+                args=[
+                    time.time(), lease, self.per_day, prompt_tokens, completion_tokens, day
+                ],
+            )
+        except RedisError as e:
+            logger.warning("Rate limiter settle failed: %s", e)
+
+    def usage(self, user_id):
+        # Token ledger: {day: {"prompt", "completion", "requests"}}
+        ledger = {}
+        for field, value in self.redis.hgetall(self.ledger_key(user_id)).items():
+            day, _, kind = field.decode().partition(":")
+            ledger.setdefault(day, {})[kind] = int(value)
+        return dict(sorted(ledger.items()))
@@ -0,0 +1,59 @@
+# Standard library
+import time
+from datetime import timedelta
+
+# Django / third-party
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+# Local app imports
+from chat.models import Chat
+from chat.services import ChatService
+
+
+# Move idle chats to the archive bucket (run daily, see docker-compose.yaml)
+class Command(BaseCommand):
+    help = "Archive the messages of idle chats to object storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.ARCHIVE_AFTER_DAYS,
+            help="Archive chats without activity for this many days.",
+        )
+        parser.add_argument("--limit", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        idle_before = timezone.now() - timedelta(days=options["days"])
+        chats = list(
+            Chat.objects.filter(archived_at__isnull=True, updated_at__lt=idle_before)
+            .order_by("updated_at")
+            .only("id", "user_id", "archived_at")[: options["limit"]]
+        )
+
+        chat_service = ChatService()
+        started = time.perf_counter()
+        archived = messages = raw = compressed = postings = 0
+        for chat in chats:
+            try:
+                stats = chat_service.archive_chat(chat, idle_before)
+            except Exception as e:
+                self.stderr.write(f"Chat {chat.id}: {e}")
+                continue
+            if stats:
+                archived += 1
+                messages += stats["messages"]
+                raw += stats["raw_bytes"]
+                compressed += stats["compressed_bytes"]
+                postings += stats["postings"]
+
+        ratio = raw / compressed if compressed else 0
+        self.stdout.write(
+            f"Archived {archived} of {len(chats)} idle chats "
+            f"({messages} messages, {postings} search postings) "
+            f"in {time.perf_counter() - started:.1f}s: "
+            f"{raw / 2**20:.1f} MiB of messages stored as "
+            f"{compressed / 2**20:.1f} MiB ({ratio:.1f}x)."
+        )
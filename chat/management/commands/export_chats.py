@@ -0,0 +1,47 @@
+# Standard library
+import sys
+
+# Django / third-party
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+# Local app imports
+from chat.archive import ChatArchive
+from chat.exports import ChatExporter, gzip_stream
+
+
+# Dump chat history as NDJSON (gzipped when the output ends in .gz)
+class Command(BaseCommand):
+    help = "Export chats and messages as NDJSON, for one user or everyone."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only this username.")
+        parser.add_argument("--output", default="-", help="File path, - for stdout.")
+        parser.add_argument("--batch-size", type=int)
+
+    def handle(self, *args, **options):
+        user_id = None
+        if options["user"]:
+            user_id = (
+                get_user_model()
+                .objects.filter(username=options["user"])
+                .values_list("id", flat=True)
+                .first()
+            )
+            if user_id is None:
+                raise CommandError(f"Unknown user {options['user']}")
+
+        lines = ChatExporter(ChatArchive(), options["batch_size"]).lines(user_id)
+        output = options["output"]
+        if output.endswith(".gz"):
+            chunks = gzip_stream(lines)
+        else:
+            chunks = (line.encode("utf-8") for line in lines)
+
+        stream = sys.stdout.buffer if output == "-" else open(output, "wb")
+        try:
+            for chunk in chunks:
+                stream.write(chunk)
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
@@ -0,0 +1,40 @@
+# Standard library
+from datetime import timedelta
+
+# Django / third-party
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+# Local app imports
+from chat.models import UploadOutbox
+from chat.services import ChatService
+
+
+# Retry uploads left pending in the outbox (every minute, see the
+# upload_flusher service in docker-compose.yaml). Must run where the web
+# containers' UPLOAD_SPOOL_DIR is mounted.
+class Command(BaseCommand):
+    help = "Persist pending chat uploads from the local spool to object storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=60,
+            help="Only retry uploads untouched for this many seconds.",
+        )
+        parser.add_argument("--limit", type=int, default=500)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options["min_age"])
+        upload_ids = list(
+            UploadOutbox.objects.filter(
+                status=UploadOutbox.PENDING, updated_at__lte=cutoff
+            )
+            .order_by("updated_at")
+            .values_list("id", flat=True)[: options["limit"]]
+        )
+
+        chat_service = ChatService()
+        stored = sum(1 for upload_id in upload_ids if chat_service.flush_upload(upload_id))
+        self.stdout.write(f"Stored {stored} of {len(upload_ids)} pending uploads.")
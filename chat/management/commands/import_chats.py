@@ -0,0 +1,66 @@
+# Standard library
+import gzip
+import io
+import sys
+import time
+
+# Django / third-party
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+# Local app imports
+from chat.cache import RecentChatsCache
+from chat.exports import ChatImporter
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+# Load NDJSON written by export_chats (plain or gzipped), then index it
+class Command(BaseCommand):
+    help = "Import chats and messages from an export_chats NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File path, - for stdin.")
+        parser.add_argument("--user", help="Import every chat for this username.")
+        parser.add_argument(
+            "--create-users",
+            action="store_true",
+            help="Create missing users (without a usable password).",
+        )
+        parser.add_argument("--batch-size", type=int)
+        parser.add_argument(
+            "--skip-index",
+            action="store_true",
+            help="Leave search indexing to a later rebuild_search_index.",
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            user = get_user_model().objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"Unknown user {options['user']}")
+
+        raw = sys.stdin.buffer if options["path"] == "-" else open(options["path"], "rb")
+        stream = io.BufferedReader(raw)
+        if stream.peek(2)[:2] == GZIP_MAGIC:
+            stream = gzip.GzipFile(fileobj=stream)
+
+        started = time.perf_counter()
+        importer = ChatImporter(user, options["create_users"], options["batch_size"])
+        with io.TextIOWrapper(stream, encoding="utf-8") as lines:
+            importer.run(lines)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Imported {importer.chat_count} chats and {importer.message_count} "
+            f"messages in {elapsed:.1f}s "
+            f"({importer.message_count / max(elapsed, 1e-9):.0f} messages/s); "
+            f"skipped {importer.skipped} chats of unknown users."
+        )
+
+        recent_chats = RecentChatsCache()
+        for user_id in importer.user_ids:
+            recent_chats.invalidate(user_id)
+            if not options["skip_index"]:
+                call_command("rebuild_search_index", user=user_id)
@@ -0,0 +1,42 @@
+# Django / third-party
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+# Local app imports
+from chat.models import Chat, Message, SearchPosting
+from chat.search import SearchIndex
+
+
+# Rebuild the search postings from the chats and messages tables (after a
+# bulk import, or to index history written before search existed)
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only this user id.")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chats = Chat.objects.all()
+        if options["user"]:
+            chats = chats.filter(user_id=options["user"])
+        index = SearchIndex()
+        batch_size = options["batch_size"]
+
+        with transaction.atomic():
+            SearchPosting.objects.filter(chat__in=chats).delete()
+            postings = []
+            for chat in chats.exclude(title="New Chat").only("id", "user_id", "title"):
+                postings += index.postings(chat.user_id, chat.id, None, chat.title)
+
+            messages = Message.objects.filter(chat__in=chats).exclude(content="")
+            rows = messages.values_list("id", "chat_id", "chat__user_id", "content")
+            count = 0
+            for message_id, chat_id, user_id, content in rows.iterator(batch_size):
+                postings += index.postings(user_id, chat_id, message_id, content)
+                count += 1
+                if len(postings) >= batch_size:
+                    SearchPosting.objects.bulk_create(postings)
+                    postings = []
+            SearchPosting.objects.bulk_create(postings)
+        self.stdout.write(f"Indexed {count} messages.")
@@ -0,0 +1,81 @@
+# Standard library
+import multiprocessing
+import signal
+import threading
+
+# Django / third-party
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Entry point of each worker process
+def serve(threads):
+    django.setup()
+    from chat.jobs import run_worker
+    from chat.services import ChatService
+
+    chat_service = ChatService()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+
+    def handler(payload):
+        chat_service.run_generation(
+            payload["chat_id"],
+            payload["turn"],
+            payload["messages"],
+            payload.get("lease"),
+            payload.get("user_id"),
+        )
+
+    def fail(payload, error):
+        chat_service.fail_generation(
+            payload["chat_id"],
+            payload["turn"],
+            error,
+            payload.get("lease"),
+            payload.get("user_id"),
+        )
+
+    run_worker(handler, fail, threads, stop)
+
+
+# Generation worker pool fed by the Redis job queue (see chat/jobs.py)
+class Command(BaseCommand):
+    help = "Run LLM generation workers that consume the Redis job queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1)
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=settings.GENERATION_WORKERS,
+            help="Concurrent generations per process.",
+        )
+
+    def handle(self, *args, **options):
+        processes, threads = options["processes"], options["threads"]
+        self.stdout.write(
+            f"Starting {processes} generation worker process(es) x {threads} threads."
+        )
+        if processes == 1:
+            serve(threads)
+            return
+
+        context = multiprocessing.get_context("spawn")
+        children = [
+            context.Process(target=serve, args=(threads,), name=f"generation-{i}")
+            for i in range(processes)
+        ]
+        for child in children:
+            child.start()
+
+        def stop(*args):
+            for child in children:
+                child.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for child in children:
+            child.join()
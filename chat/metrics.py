@@ -0,0 +1,209 @@
+# Prometheus-style metrics shared by web and generation worker processes.
+# Each process aggregates observations in memory and flushes them to Redis
+# hashes (HINCRBYFLOAT) at most every METRICS_FLUSH_INTERVAL seconds; the
+# /metrics view renders the summed totals in the Prometheus text format.
+
+# Standard library
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+# Django / third-party
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+RATE_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800, 1600)
+
+# name -> (help, buckets)
+HISTOGRAMS = {
+    "webai_request_seconds": (
+        "Request time by view (streamed responses: until headers)",
+        LATENCY_BUCKETS,
+    ),
+    "webai_db_queries": ("Database queries per request by view", QUERY_BUCKETS),
+    "webai_ttft_seconds": ("Generation time to first token", LATENCY_BUCKETS),
+    "webai_generation_seconds": ("Total generation time", LATENCY_BUCKETS),
+    "webai_tokens_per_second": (
+        "Completion tokens per second after the first token",
+        RATE_BUCKETS,
+    ),
+    "webai_prompt_tokens": ("Prompt tokens per generation", TOKEN_BUCKETS),
+    "webai_completion_tokens": ("Completion tokens per generation", TOKEN_BUCKETS),
+    "webai_file_extraction_seconds": ("Upload text extraction time", LATENCY_BUCKETS),
+    "webai_upload_save_seconds": ("Upload save time to object storage", LATENCY_BUCKETS),
+    "webai_chat_restore_seconds": ("Archived chat restore time", LATENCY_BUCKETS),
+    "webai_document_index_seconds": (
+        "Uploaded document chunking and embedding time",
+        LATENCY_BUCKETS,
+    ),
+}
+
+# name -> help
+COUNTERS = {
+    "webai_cache_requests_total": "Cache lookups by cache and result",
+}
+
+
+LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def format_labels(labels):
+    return ",".join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for key, value in sorted(labels.items())
+    )
+
+
+def parse_labels(label_str):
+    return dict(LABEL_RE.findall(label_str))
+
+
+def hit_ratio(counts):
+    return counts["hit"] / (counts["hit"] + counts["miss"])
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Process-local aggregation + Redis flush
+class Metrics:
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self.lock = threading.Lock()
+        # (metric, label string, field) -> increment since the last flush
+        self.pending = defaultdict(float)
+        self.flushed_at = time.monotonic()
+        # Cache objects with hits/misses counters, reported as deltas
+        self.caches = {}
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.alias)
+
+    def key(self, name):
+        return cache.make_key(f"metrics:{name}")
+
+    def observe(self, name, value, **labels):
+        if not settings.METRICS_ENABLED:
+            return
+        label_str = format_labels(labels)
+        buckets = HISTOGRAMS[name][1]
+        with self.lock:
+            # Buckets are cumulative: every bound >= value counts it
+            for bound in buckets:
+                if value <= bound:
+                    self.pending[(name, label_str, format_value(bound))] += 1
+            self.pending[(name, label_str, "+Inf")] += 1
+            self.pending[(name, label_str, "sum")] += value
+            self.pending[(name, label_str, "count")] += 1
+        self.maybe_flush()
+
+    def inc(self, name, amount=1, **labels):
+        if not settings.METRICS_ENABLED or not amount:
+            return
+        with self.lock:
+            self.pending[(name, format_labels(labels), "value")] += amount
+        self.maybe_flush()
+
+    def track_cache(self, name, tracked):
+        with self.lock:
+            self.caches[name] = [tracked, tracked.hits, tracked.misses]
+
+    def collect_caches(self):
+        with self.lock:
+            deltas = []
+            for name, entry in self.caches.items():
+                tracked, hits, misses = entry
+                deltas.append((name, tracked.hits - hits, tracked.misses - misses))
+                entry[1], entry[2] = tracked.hits, tracked.misses
+        for name, hits, misses in deltas:
+            self.inc("webai_cache_requests_total", hits, cache=name, result="hit")
+            self.inc("webai_cache_requests_total", misses, cache=name, result="miss")
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.flushed_at = time.monotonic()
+            pending, self.pending = self.pending, defaultdict(float)
+        if not pending:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for (name, label_str, field), amount in pending.items():
+                pipe.hincrbyfloat(self.key(name), f"{label_str}|{field}", amount)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning("Metrics flush failed, dropped %s series: %s", len(pending), e)
+
+    def read(self, name):
+        # {label string: {field: value}} summed over all processes
+        series = defaultdict(dict)
+        try:
+            fields = self.redis.hgetall(self.key(name))
+        except RedisError as e:
+            logger.warning("Metrics read of %s failed: %s", name, e)
+            fields = {}
+        for field, value in fields.items():
+            label_str, _, suffix = field.decode().rpartition("|")
+            series[label_str][suffix] = float(value)
+        return series
+
+    def render(self, gauges=None):
+        # Prometheus text exposition; gauges: {name: (help, {labels: value})}
+        self.collect_caches()
+        self.flush()
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for label_str, fields in sorted(self.read(name).items()):
+                prefix = f"{label_str}," if label_str else ""
+                for bound in [format_value(bound) for bound in buckets] + ["+Inf"]:
+                    count = format_value(fields.get(bound, 0))
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+                labels = f"{{{label_str}}}" if label_str else ""
+                lines.append(f"{name}_sum{labels} {format_value(fields.get('sum', 0))}")
+                lines.append(f"{name}_count{labels} {format_value(fields.get('count', 0))}")
+
+        lookups = defaultdict(lambda: {"hit": 0, "miss": 0})
+        for name, help_text in COUNTERS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for label_str, fields in sorted(self.read(name).items()):
+                lines.append(f"{name}{{{label_str}}} {format_value(fields['value'])}")
+                if name == "webai_cache_requests_total":
+                    labels = parse_labels(label_str)
+                    lookups[labels["cache"]][labels["result"]] = fields["value"]
+
+        gauges = dict(gauges or {})
+        gauges["webai_cache_hit_ratio"] = (
+            "Cache hit ratio since metrics were first recorded",
+            {
+                format_labels({"cache": name}): hit_ratio(counts)
+                for name, counts in lookups.items()
+                if counts["hit"] + counts["miss"]
+            },
+        )
+        for name, (help_text, values) in gauges.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for label_str, value in sorted(values.items()):
+                labels = f"{{{label_str}}}" if label_str else ""
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,66 @@
+# Standard library
+import time
+
+# Django / third-party
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+
+# Local app imports
+from .metrics import metrics
+
+
+# Records request time and DB query count per view (webai_request_seconds,
+# webai_db_queries). Works under WSGI and ASGI; on the async path queries
+# run in sync_to_async threads, so only the time is recorded there.
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(1)
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        view = self.view_name(request)
+        if view:
+            self.record(request, response, view, time.perf_counter() - start)
+            metrics.observe("webai_db_queries", len(queries), view=view)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        view = self.view_name(request)
+        if view:
+            self.record(request, response, view, time.perf_counter() - start)
+        return response
+
+    def view_name(self, request):
+        # Only the chat/ and users/ views (so not /metrics scrapes)
+        match = request.resolver_match
+        if match is None or match.route.split("/")[0] not in ("chat", "users"):
+            return None
+        return match.view_name
+
+    def record(self, request, response, view, elapsed):
+        metrics.observe(
+            "webai_request_seconds",
+            elapsed,
+            view=view,
+            method=request.method,
+            status=response.status_code,
+        )
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_chat_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='summary_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
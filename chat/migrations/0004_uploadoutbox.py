@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_chat_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('storage_key', models.CharField(max_length=255)),
+                ('spool_path', models.CharField(max_length=500)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.BigIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('chat', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploads', to='chat.chat')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='upload_status_updated_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_uploadoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='response_cache_enabled',
+            field=models.BooleanField(default=True),
+        ),
+    ]
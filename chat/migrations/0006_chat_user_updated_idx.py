@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_chat_response_cache_enabled'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['user', 'updated_at'], name='chat_user_updated_idx'),
+        ),
+    ]
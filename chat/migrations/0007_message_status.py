@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_chat_user_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='completion_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='latency_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='prompt_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='status',
+            field=models.CharField(choices=[('streaming', 'Streaming'), ('complete', 'Complete'), ('cancelled', 'Cancelled'), ('failed', 'Failed')], default='complete', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='ttft_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
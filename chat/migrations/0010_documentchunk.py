@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_searchposting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('ordinal', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('tokens', models.PositiveIntegerField()),
+                ('embedding_id', models.CharField(max_length=100)),
+                ('embedding', models.BinaryField()),
+                ('attachment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chunks', to='chat.attachment')),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_chunks', to='chat.chat')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['chat', 'id'], name='chunk_chat_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_documentchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='archive_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_chat_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chat',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,6 +1,7 @@
 # Django
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 # Table Chat
@@ -9,22 +10,165 @@ class Chat(models.Model):
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="chats"
     )
     title = models.CharField(max_length=200)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Rolling summary of messages evicted from the prompt context window
+    summary = models.TextField(blank=True, default="")
+    summary_message_id = models.BigIntegerField(null=True, blank=True)
+    # Per-chat opt-out of the shared response cache
+    response_cache_enabled = models.BooleanField(default=True)
+    # Set while the messages are archived in object storage (chat/archive.py)
+    archived_at = models.DateTimeField(null=True, blank=True)
+    archive_key = models.CharField(max_length=255, blank=True, default="")
+    # A default rather than auto_now_add, so restores and imports keep it
+    created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Sidebar keyset pagination on (-updated_at, -id) per user
+            models.Index(fields=["user", "updated_at"], name="chat_user_updated_idx"),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.user.username}"
 
 
 # Table Message/Chat Detail
 class Message(models.Model):
+    # Assistant replies are saved as STREAMING before the first token and
+    # checkpointed while generating; the rest are COMPLETE from the start
+    STREAMING = "streaming"
+    COMPLETE = "complete"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (STREAMING, "Streaming"),
+        (COMPLETE, "Complete"),
+        (CANCELLED, "Cancelled"),
+        (FAILED, "Failed"),
+    ]
+
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="messages")
     role = models.CharField(max_length=10)  # 'user' or 'assistant'
     content = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=COMPLETE)
+    # Generation stats, set on the final commit of an assistant reply
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
+    ttft_ms = models.PositiveIntegerField(null=True, blank=True)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    # A default rather than auto_now_add, so restores and imports keep it
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["chat", "created_at"], name="message_chat_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
+
+
+# Table Upload Outbox (uploads waiting to be persisted to object storage)
+class UploadOutbox(models.Model):
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (DONE, "Done"), (FAILED, "Failed")]
+
+    chat = models.ForeignKey(
+        Chat, on_delete=models.SET_NULL, null=True, related_name="uploads"
+    )
+    file_name = models.CharField(max_length=255)
+    storage_key = models.CharField(max_length=255)
+    spool_path = models.CharField(max_length=500)
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "updated_at"], name="upload_status_updated_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
+
+
+# Table Attachment (a file uploaded into a chat; stored content-addressed)
+class Attachment(models.Model):
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="attachments")
+    message = models.ForeignKey(
+        Message, on_delete=models.SET_NULL, null=True, blank=True, related_name="attachments"
+    )
+    # Outbox row while the object is still being persisted
+    upload = models.ForeignKey(
+        UploadOutbox, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    file_name = models.CharField(max_length=255)
+    storage_key = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["chat", "created_at"], name="attachment_chat_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.size} bytes)"
+
+
+# Table Search Posting (per-user inverted index over chat titles and messages)
+class SearchPosting(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    term = models.CharField(max_length=40)
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="+")
+    # None for a posting of the chat title
+    message = models.ForeignKey(
+        Message, on_delete=models.CASCADE, null=True, blank=True, related_name="+"
+    )
+    frequency = models.PositiveSmallIntegerField()
+    # Terms in the whole document, for length normalisation
+    length = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            # Covers the ranking query: it never reads the table rows
+            models.Index(
+                fields=["user", "term", "chat", "message", "frequency", "length"],
+                name="search_user_term_idx",
+            ),
+        ]
+
+
+# Table Document Chunk (a passage of an uploaded document, with its embedding)
+class DocumentChunk(models.Model):
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="document_chunks")
+    attachment = models.ForeignKey(
+        Attachment, on_delete=models.SET_NULL, null=True, blank=True, related_name="chunks"
+    )
+    file_name = models.CharField(max_length=255)
+    # Position of the chunk within its document
+    ordinal = models.PositiveIntegerField()
+    text = models.TextField()
+    tokens = models.PositiveIntegerField()
+    # Vector space of `embedding` (see chat/embeddings.py), float32 bytes
+    embedding_id = models.CharField(max_length=100)
+    embedding = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["chat", "id"], name="chunk_chat_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} #{self.ordinal}"
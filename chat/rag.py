@@ -0,0 +1,188 @@
+# Retrieval over documents uploaded into a chat.
+# Extracted text is split into overlapping token windows, embedded with the
+# local model (chat/embeddings.py) and stored as DocumentChunk rows. Each
+# process keeps the chunk vectors of recently used chats as a NumPy matrix
+# (brute-force cosine search; a chat holds at most a few thousand chunks),
+# so every turn sends only the top-k relevant chunks to the LLM.
+
+# Standard library
+import threading
+from collections import OrderedDict
+
+# Django / third-party
+import numpy as np
+from django.conf import settings
+
+# Local app imports
+from .embeddings import embed, embedding_id
+from .models import DocumentChunk
+from .tokens import CHARS_PER_TOKEN, count_tokens, get_encoding
+
+EMBED_BATCH_SIZE = 64
+
+
+def chunk_text(text, chunk_tokens, overlap):
+    # Windows of chunk_tokens tokens, each repeating the last `overlap`
+    # tokens of the previous one so no passage is cut in half
+    encoding = get_encoding()
+    if encoding is None:
+        # Character windows sized by the tokenizer estimate
+        units = text
+        chunk_tokens, overlap = chunk_tokens * CHARS_PER_TOKEN, overlap * CHARS_PER_TOKEN
+    else:
+        units = encoding.encode(text, disallowed_special=())
+    step = max(1, chunk_tokens - overlap)
+    windows = [
+        units[i : i + chunk_tokens] for i in range(0, max(1, len(units) - overlap), step)
+    ]
+    if encoding is None:
+        return windows
+    return [encoding.decode(window) for window in windows]
+
+
+def embed_batched(texts):
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack(
+        [
+            embed(texts[i : i + EMBED_BATCH_SIZE])
+            for i in range(0, len(texts), EMBED_BATCH_SIZE)
+        ]
+    )
+
+
+# Per-chat document chunks + in-process vector indexes
+class DocumentIndex:
+    # Per-process vector indexes kept in memory (chat id -> index)
+    MAX_LOCAL_INDEXES = 256
+
+    def __init__(self):
+        self.enabled = settings.RAG_ENABLED
+        self.chunk_tokens = settings.RAG_CHUNK_TOKENS
+        self.overlap = settings.RAG_CHUNK_OVERLAP
+        self.top_k = settings.RAG_TOP_K
+        self.min_score = settings.RAG_MIN_SCORE
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, chat, attachment, file_name, text):
+        # Returns the number of chunks stored
+        chunks = [
+            chunk
+            for chunk in chunk_text(text, self.chunk_tokens, self.overlap)
+            if chunk.strip()
+        ]
+        if not chunks:
+            return 0
+        space = embedding_id()
+        vectors = embed_batched(chunks)
+        DocumentChunk.objects.bulk_create(
+            [
+                DocumentChunk(
+                    chat_id=chat.id,
+                    attachment=attachment,
+                    file_name=file_name[:255],
+                    ordinal=ordinal,
+                    text=chunk,
+                    tokens=count_tokens(chunk),
+                    embedding_id=space,
+                    embedding=vector.astype(np.float32).tobytes(),
+                )
+                for ordinal, (chunk, vector) in enumerate(zip(chunks, vectors))
+            ]
+        )
+        return len(chunks)
+
+    def version(self, chat_id):
+        # Chunks are only ever added (or deleted with the chat), so the
+        # newest chunk id identifies the index contents
+        return (
+            DocumentChunk.objects.filter(chat_id=chat_id)
+            .order_by("-id")
+            .values_list("id", flat=True)
+            .first()
+        )
+
+    def load(self, chat_id, version):
+        # (version, chunk ids, matrix) with one L2-normalized row per chunk
+        space = embedding_id()
+        # The LRU is shared by request threads: every access holds the lock,
+        # the rebuild itself runs outside it
+        with self.lock:
+            index = self.indexes.get(chat_id)
+            if index is not None and index[0] == (version, space):
+                self.indexes.move_to_end(chat_id)
+                return index
+
+        rows = list(
+            DocumentChunk.objects.filter(chat_id=chat_id)
+            .order_by("id")
+            .values_list("id", "embedding_id", "embedding", "text")
+        )
+        # Chunks embedded by another model are re-embedded once
+        stale = [row for row in rows if row[1] != space]
+        if stale:
+            vectors = embed_batched([text for _, _, _, text in stale])
+            DocumentChunk.objects.bulk_update(
+                [
+                    DocumentChunk(
+                        id=chunk_id,
+                        embedding_id=space,
+                        embedding=vector.astype(np.float32).tobytes(),
+                    )
+                    for (chunk_id, _, _, _), vector in zip(stale, vectors)
+                ],
+                ["embedding_id", "embedding"],
+            )
+            fresh = {row[0]: vector for row, vector in zip(stale, vectors)}
+        else:
+            fresh = {}
+        ids = [row[0] for row in rows]
+        matrix = np.vstack(
+            [
+                fresh[chunk_id]
+                if chunk_id in fresh
+                else np.frombuffer(vector, dtype=np.float32)
+                for chunk_id, _, vector, _ in rows
+            ]
+        )
+        index = ((version, space), ids, matrix)
+        with self.lock:
+            self.indexes[chat_id] = index
+            self.indexes.move_to_end(chat_id)
+            if len(self.indexes) > self.MAX_LOCAL_INDEXES:
+                self.indexes.popitem(last=False)
+        return index
+
+    def search(self, chat_id, query, max_tokens):
+        # Most relevant chunks for `query` within max_tokens, in upload
+        # order: [{"id", "file_name", "ordinal", "text", "tokens", "score"}]
+        if not self.enabled:
+            return []
+        version = self.version(chat_id)
+        if version is None:
+            return []
+        _, ids, matrix = self.load(chat_id, version)
+
+        if query.strip():
+            scores = matrix @ embed([query])[0]
+            order = [
+                i for i in np.argsort(-scores)[: self.top_k] if scores[i] >= self.min_score
+            ]
+        else:
+            # Nothing to match (file sent without a question): the opening chunks
+            scores = np.zeros(len(ids))
+            order = range(min(self.top_k, len(ids)))
+        picked = {ids[i]: float(scores[i]) for i in order}
+        rows = DocumentChunk.objects.filter(id__in=picked).values(
+            "id", "file_name", "ordinal", "text", "tokens"
+        )
+        chunks = []
+        used = 0
+        for row in sorted(rows, key=lambda row: -picked[row["id"]]):
+            if used + row["tokens"] > max_tokens:
+                continue
+            used += row["tokens"]
+            chunks.append({**row, "score": picked[row["id"]]})
+        chunks.sort(key=lambda chunk: chunk["id"])
+        return chunks
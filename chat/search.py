@@ -0,0 +1,200 @@
+# Full-text search over a user's chat titles and messages.
+# Every document (a message, or a chat title) is split into terms stored as
+# SearchPosting rows keyed by (user, term), so a query reads only the
+# postings of its own terms for one user. Matches are ranked with BM25.
+
+# Standard library
+import math
+import re
+from collections import Counter
+
+# Django / third-party
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils.html import escape
+
+# Local app imports
+from .models import Chat, Message, SearchPosting
+
+TERM_RE = re.compile(r"\w+")
+MAX_TERM_LENGTH = 40
+MAX_FREQUENCY = 32767
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its me my of on "
+    "or so that the this to was we were what will with you your".split()
+)
+
+# BM25 term-frequency saturation and length normalisation
+K1 = 1.2
+B = 0.75
+
+
+def terms(text):
+    return [
+        term
+        for term in TERM_RE.findall(text.lower())
+        if len(term) <= MAX_TERM_LENGTH and term not in STOPWORDS
+    ]
+
+
+# Inverted index in the database, maintained by ChatService on every write
+class SearchIndex:
+    def __init__(self):
+        self.page_size = settings.SEARCH_PAGE_SIZE
+        self.max_results = settings.SEARCH_MAX_RESULTS
+        self.max_terms = settings.SEARCH_MAX_TERMS
+        self.snippet_chars = settings.SEARCH_SNIPPET_CHARS
+
+    def postings(self, user_id, chat_id, message_id, text):
+        counts = Counter(terms(text))
+        length = sum(counts.values())
+        return [
+            SearchPosting(
+                user_id=user_id,
+                term=term,
+                chat_id=chat_id,
+                message_id=message_id,
+                frequency=min(count, MAX_FREQUENCY),
+                length=length,
+            )
+            for term, count in counts.items()
+        ]
+
+    def add_message(self, chat, message):
+        SearchPosting.objects.bulk_create(
+            self.postings(chat.user_id, chat.id, message.id, message.content)
+        )
+
+    def set_title(self, chat):
+        SearchPosting.objects.filter(chat_id=chat.id, message__isnull=True).delete()
+        SearchPosting.objects.bulk_create(
+            self.postings(chat.user_id, chat.id, None, chat.title)
+        )
+
+    def document_count(self, user_id):
+        # Corpus size for IDF; cached, as ranking barely moves with it
+        key = f"search_documents:{user_id}"
+        count = cache.get(key)
+        if count is None:
+            count = (
+                Message.objects.filter(chat__user_id=user_id).count()
+                + Chat.objects.filter(user_id=user_id).count()
+            )
+            cache.set(key, count, timeout=settings.SEARCH_STATS_TIMEOUT)
+        return count
+
+    def rank(self, user_id, query_terms):
+        # [(chat_id, message_id or None)] best first, and their scores.
+        # Scoring runs in the database, so common terms never ship their
+        # postings to Python.
+        postings = SearchPosting.objects.filter(user_id=user_id, term__in=query_terms)
+        stats = postings.values("term").annotate(
+            frequency=Count("id"), total_length=Sum("length")
+        )
+        frequencies = {row["term"]: row["frequency"] for row in stats}
+        if not frequencies:
+            return [], {}
+        documents = max(self.document_count(user_id), max(frequencies.values()))
+        # Average length of the matched documents stands in for the corpus
+        average_length = max(
+            1, sum(row["total_length"] for row in stats) / sum(frequencies.values())
+        )
+
+        idf = Case(
+            *[
+                When(
+                    term=term,
+                    then=Value(math.log(1 + (documents - n + 0.5) / (n + 0.5))),
+                )
+                for term, n in frequencies.items()
+            ],
+            output_field=FloatField(),
+        )
+        frequency = Cast("frequency", FloatField())
+        score = Sum(
+            idf
+            * frequency
+            * (K1 + 1)
+            / (
+                frequency
+                + K1 * (1 - B)
+                + Cast("length", FloatField()) * (K1 * B / average_length)
+            )
+        )
+        # Documents with every term first, then by score, newest first on ties
+        rows = (
+            postings.values("chat_id", "message_id")
+            .annotate(score=score, matched=Count("id"))
+            .order_by("-matched", "-score", "-message_id", "-chat_id")
+        )[: self.max_results]
+        scores = {(row["chat_id"], row["message_id"]): row["score"] for row in rows}
+        return list(scores), scores
+
+    def search(self, user_id, query, page=1):
+        # Returns (results, total) for one page of ranked matches
+        query_terms = list(dict.fromkeys(terms(query)))[: self.max_terms]
+        if not query_terms:
+            return [], 0
+        ranked, scores = self.rank(user_id, query_terms)
+        start = (page - 1) * self.page_size
+        documents = ranked[start : start + self.page_size]
+
+        # Only the page's documents are loaded
+        messages = {
+            row["id"]: row
+            for row in Message.objects.filter(
+                id__in=[message_id for _, message_id in documents if message_id]
+            ).values("id", "role", "content", "created_at")
+        }
+        titles = dict(
+            Chat.objects.filter(
+                id__in={chat_id for chat_id, _ in documents}, user_id=user_id
+            ).values_list("id", "title")
+        )
+        results = []
+        for chat_id, message_id in documents:
+            message = messages.get(message_id)
+            if chat_id not in titles or (message_id and message is None):
+                continue
+            text = message["content"] if message else titles[chat_id]
+            results.append(
+                {
+                    "chat_id": chat_id,
+                    "chat_title": titles[chat_id],
+                    "message_id": message_id,
+                    "role": message["role"] if message else None,
+                    "created_at": message["created_at"].isoformat() if message else None,
+                    "score": round(scores[(chat_id, message_id)], 4),
+                    "snippet": self.highlight(text, query_terms),
+                }
+            )
+        return results, len(ranked)
+
+    def highlight(self, text, query_terms):
+        # HTML-escaped excerpt around the first match, matches in <mark>
+        wanted = set(query_terms)
+        matches = [
+            match for match in TERM_RE.finditer(text) if match.group().lower() in wanted
+        ]
+        first = matches[0].start() if matches else 0
+        start = max(0, first - self.snippet_chars // 3)
+        if start:
+            # Start on a word boundary
+            space = text.find(" ", start, first)
+            start = space + 1 if space != -1 else start
+        end = min(len(text), start + self.snippet_chars)
+
+        parts = ["…"] if start else []
+        position = start
+        for match in matches:
+            if match.end() > end:
+                break
+            parts.append(escape(text[position : match.start()]))
+            parts.append(f"<mark>{escape(match.group())}</mark>")
+            position = match.end()
+        parts.append(escape(text[position:end]))
+        if end < len(text):
+            parts.append("…")
+        return "".join(parts)
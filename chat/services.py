@@ -1,72 +1,1401 @@
 # Standard library
+import asyncio
+import contextvars
+import hashlib
+import logging
+import mimetypes
 import os
+import queue
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
 
 
 # Django / third-party
-import PyPDF2
+from asgiref.sync import sync_to_async
+from boto3.s3.transfer import TransferConfig
 from storages.backends.s3boto3 import S3Boto3Storage
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from redis.exceptions import RedisError
 
 # Local app imports
-from .models import Message
+from .models import (
+    Attachment,
+    Chat,
+    DocumentChunk,
+    Message,
+    SearchPosting,
+    UploadOutbox,
+)
 from .ai_models import AIModelManager
+from .archive import ChatArchive
+from .cache import (
+    ConversationCache,
+    ExtractedTextCache,
+    GenerationStreams,
+    MessageMarkers,
+    RecentChatsCache,
+    ResponseCache,
+)
+from .extraction import extract_pdf_text, read_text
+from .jobs import GenerationQueue
+from .limits import RateLimiter
+from .metrics import metrics
+from .rag import DocumentIndex
+from .search import SearchIndex
+from .tokens import count_message_tokens, count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
 
 chat_uploads = S3Boto3Storage(bucket_name=settings.BUCKET_CHAT_UPLOADS)
 
+# Background workers persisting uploads to object storage (see UploadOutbox)
+upload_executor = ThreadPoolExecutor(
+    max_workers=settings.UPLOAD_WORKERS, thread_name_prefix="chat-upload"
+)
+upload_transfer_config = TransferConfig(
+    multipart_threshold=settings.UPLOAD_MULTIPART_THRESHOLD,
+    multipart_chunksize=settings.UPLOAD_MULTIPART_CHUNKSIZE,
+    max_concurrency=settings.UPLOAD_MULTIPART_CONCURRENCY,
+)
+
+# Background workers for rolling summary refreshes
+summary_executor = ThreadPoolExecutor(
+    max_workers=settings.SUMMARY_WORKERS, thread_name_prefix="chat-summary"
+)
+
+# Search indexing of restored archived chats, off the request path
+archive_index_executor = ThreadPoolExecutor(
+    max_workers=settings.ARCHIVE_INDEX_WORKERS, thread_name_prefix="chat-archive-index"
+)
+
+# Chunking and embedding of uploaded documents for retrieval
+document_index_executor = ThreadPoolExecutor(
+    max_workers=settings.RAG_INDEX_WORKERS, thread_name_prefix="chat-document-index"
+)
+
+# In-process generations when GENERATION_QUEUE is off (otherwise the
+# run_generation_workers processes run them)
+generation_executor = ThreadPoolExecutor(
+    max_workers=settings.GENERATION_WORKERS, thread_name_prefix="chat-generation"
+)
+# Generations running as tasks on the ASGI event loop (kept referenced)
+generation_tasks = set()
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an "
+    "assistant. Merge the existing summary with the new messages. Keep facts, "
+    "decisions, names, code identifiers and open questions. Reply with the "
+    "updated summary only."
+)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Upload types whose text is extracted
+TEXT_EXTENSIONS = ["pdf", "txt", "md", "py", "js", "html", "css", "json"]
+
+
+# Attachment download bodies (files are never read into memory whole)
+def iter_file_range(handle, length, chunk_size):
+    try:
+        while length > 0:
+            chunk = handle.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        handle.close()
+
+
+def iter_object_body(body, chunk_size):
+    try:
+        yield from body.iter_chunks(chunk_size)
+    finally:
+        body.close()
+
+
+# Sidebar cursor helpers: updated_at as integer microseconds (exact, and
+# safe as a Redis sorted-set score)
+def to_micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def encode_cursor(row):
+    return f"{row['updated_at']}-{row['id']}"
+
+
+def decode_cursor(cursor):
+    micros, chat_id = cursor.split("-")
+    return EPOCH + timedelta(microseconds=int(micros)), int(chat_id)
+
+
+# Split a cached answer into stream-sized pieces for replay
+def iter_replay_chunks(text, size=64):
+    for start in range(0, len(text), size):
+        yield text[start : start + size]
+
+
+# Message status for each final generation event
+REPLY_STATUS = {"done": Message.COMPLETE, "cancelled": Message.CANCELLED}
+
+
+# Coalesces streamed chunks into fewer, larger stream entries. add() returns
+# the pending text once GENERATION_FLUSH_SIZE characters are buffered or
+# GENERATION_FLUSH_INTERVAL passed since the last flush (the first chunk goes
+# out at once); wait_time() tells the reader when to take() pending text if
+# no chunk arrives. Every chunk is kept in a list and joined once at the end.
+class TokenBuffer:
+    def __init__(self, flush_size=None, flush_interval=None):
+        self.flush_size = flush_size or settings.GENERATION_FLUSH_SIZE
+        self.flush_interval = (
+            settings.GENERATION_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        )
+        self.parts = []
+        self.pending = []
+        self.pending_size = 0
+        self.flushed_at = 0.0
+
+    def add(self, content):
+        self.parts.append(content)
+        self.pending.append(content)
+        self.pending_size += len(content)
+        now = time.monotonic()
+        if (
+            self.pending_size >= self.flush_size
+            or now - self.flushed_at >= self.flush_interval
+        ):
+            return self.take(now)
+        return ""
+
+    def wait_time(self):
+        # Seconds until pending text is due, None when nothing is pending
+        if not self.pending:
+            return None
+        return max(0.0, self.flushed_at + self.flush_interval - time.monotonic())
+
+    def take(self, now=None):
+        # Pending text since the last flush ("" when nothing is pending)
+        if not self.pending:
+            return ""
+        text = "".join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        self.flushed_at = now or time.monotonic()
+        return text
+
+    def text(self):
+        return "".join(self.parts)
+
+
+# Iterate an LLM stream with a timed wait: yields None whenever `timeout()`
+# seconds pass without a chunk. A helper thread does the blocking reads and
+# closes the stream once the consumer has stopped.
+def iter_timed(chunks, timeout):
+    items = queue.Queue()
+    stop = threading.Event()
+
+    def read():
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    break
+                items.put((True, chunk))
+            items.put((False, None))
+        except Exception as e:
+            items.put((False, e))
+        finally:
+            chunks.close()
+
+    threading.Thread(target=read, name="generation-reader", daemon=True).start()
+    try:
+        while True:
+            try:
+                more, value = items.get(timeout=timeout())
+            except queue.Empty:
+                yield None
+                continue
+            if not more:
+                if value is not None:
+                    raise value
+                return
+            yield value
+    finally:
+        stop.set()
+
+
+async def aiter_timed(chunks, timeout):
+    # Async counterpart: the pending read is kept across timeouts, not
+    # cancelled, so no chunk is lost
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(chunks.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=timeout())
+            if not done:
+                yield None
+                continue
+            task, pending = pending, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        await chunks.aclose()
+
 
 # Message/Chat Detail Service Handling
 class ChatService:
     def __init__(self):
         self.ai_manager = AIModelManager()
+        self.conversation_cache = ConversationCache()
+        self.upload_text_cache = ExtractedTextCache()
+        self.response_cache = ResponseCache()
+        self.recent_chats = RecentChatsCache()
+        self.generations = GenerationStreams()
+        self.message_markers = MessageMarkers()
+        self.generation_queue = GenerationQueue()
+        self.limiter = RateLimiter()
+        self.search = SearchIndex()
+        self.documents = DocumentIndex()
+        self.archive = ChatArchive()
+        metrics.track_cache("conversation", self.conversation_cache)
+        metrics.track_cache("upload_text", self.upload_text_cache)
+        metrics.track_cache("response", self.response_cache)
+
+    def file_digest(self, uploaded_file):
+        # SHA-256 of the file bytes, memoized on the upload object
+        digest = getattr(uploaded_file, "sha256", None)
+        if digest is None:
+            hasher = hashlib.sha256()
+            for chunk in uploaded_file.chunks():
+                hasher.update(chunk)
+            uploaded_file.seek(0)
+            digest = uploaded_file.sha256 = hasher.hexdigest()
+        return digest
 
     def process_file(self, uploaded_file):
         if not uploaded_file:
-            return "" ""
+            return "", ""
 
         file_name = uploaded_file.name
         file_ext = os.path.splitext(file_name)[1].lower()[1:]
         file_content = ""
+        truncated = False
+        timed_out = False
+        # Only the excerpt for this turn; documents are indexed in full in the
+        # background (see schedule_document_index)
+        max_chars = settings.UPLOAD_MAX_CHARS
 
         try:
-            if file_ext == "pdf":
-                pdf_reader = PyPDF2.PdfReader(uploaded_file)
-                file_content = "\n\n".join(
-                    page.extract_text() for page in pdf_reader.pages
-                )
-            elif file_ext in ["txt", "md", "py", "js", "html", "css", "json"]:
-                file_content = uploaded_file.read().decode("utf-8")
-                uploaded_file.seek(0)
+            if file_ext in TEXT_EXTENSIONS:
+                # Identical uploads skip extraction via the content hash
+                digest = self.file_digest(uploaded_file)
+                cached = self.upload_text_cache.get(digest, max_chars)
+                if cached is not None:
+                    file_content, truncated = cached
+                else:
+                    started = time.perf_counter()
+                    file_content, truncated, timed_out = self.extract_text(
+                        uploaded_file, file_ext, max_chars
+                    )
+                    metrics.observe(
+                        "webai_file_extraction_seconds",
+                        time.perf_counter() - started,
+                        kind=file_ext,
+                    )
+                    # A timeout depends on load, not on the file: retry next time
+                    if not timed_out:
+                        self.upload_text_cache.set(
+                            digest, max_chars, file_content, truncated
+                        )
 
             file_info = f"\n\nI've uploaded a file: {file_name}"
             if file_content:
-                file_info += "\n\nFile content:\n```\n" + file_content[:20000] + "\n```"
-                if len(file_content) > 20000:
+                file_info += "\n\nFile content:\n```\n" + file_content + "\n```"
+                if timed_out:
+                    file_info += "\n(File content incomplete: extraction timed out)"
+                elif truncated:
                     file_info += "\n(File content truncated due to length)"
 
             return file_info, file_content
         except Exception as e:
             return f"Error processing file: {str(e)}", ""
 
-    def save_file(self, chat_id, uploaded_file):
+    def extract_text(self, uploaded_file, file_ext, max_chars, timeout=None):
+        if file_ext == "pdf":
+            return extract_pdf_text(
+                uploaded_file,
+                max_chars=max_chars,
+                timeout=timeout or settings.UPLOAD_EXTRACT_TIMEOUT,
+                parallel_min_pages=settings.UPLOAD_PARALLEL_MIN_PAGES,
+                workers=settings.UPLOAD_EXTRACT_WORKERS,
+            )
+        return read_text(uploaded_file, max_chars)
+
+    def storage_key(self, uploaded_file):
+        # Content-addressed key: identical files are stored once
+        ext = uploaded_file.name.split(".")[-1]
+        digest = self.file_digest(uploaded_file)
+        return f"objects/{digest[:2]}/{digest}.{ext}"
+
+    def record_attachment(self, chat_id, uploaded_file, storage_key, message=None, upload=None):
+        # The content type is derived from the name, never taken from the client
+        return Attachment.objects.create(
+            chat_id=chat_id,
+            message=message,
+            upload=upload,
+            file_name=uploaded_file.name[:255],
+            storage_key=storage_key,
+            sha256=self.file_digest(uploaded_file),
+            size=uploaded_file.size,
+            content_type=(
+                mimetypes.guess_type(uploaded_file.name)[0] or "application/octet-stream"
+            )[:100],
+        )
+
+    def save_file(self, chat_id, uploaded_file, message=None):
         if uploaded_file:
-            ext = uploaded_file.name.split(".")[-1]
-            filename = f"{uuid.uuid4().hex}.{ext}"
-            path = f"{chat_id}/{filename}"
-            return chat_uploads.save(path, uploaded_file)
+            path = self.storage_key(uploaded_file)
+            if not chat_uploads.exists(path):
+                started = time.perf_counter()
+                path = chat_uploads.save(path, uploaded_file)
+                metrics.observe("webai_upload_save_seconds", time.perf_counter() - started)
+            return self.record_attachment(chat_id, uploaded_file, path, message)
         return None
 
+    def queue_file_save(self, chat_id, uploaded_file, message=None):
+        # Spool the upload locally and record it in the outbox; the object
+        # storage upload then runs off the request path
+        if not uploaded_file:
+            return None
+
+        spool_dir = Path(settings.UPLOAD_SPOOL_DIR)
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        spool_path = spool_dir / f"{uuid.uuid4().hex}.{uploaded_file.name.split('.')[-1]}"
+        with open(spool_path, "wb") as spool:
+            for chunk in uploaded_file.chunks():
+                spool.write(chunk)
+        uploaded_file.seek(0)
+
+        upload = UploadOutbox.objects.create(
+            chat_id=chat_id,
+            file_name=uploaded_file.name[:255],
+            storage_key=self.storage_key(uploaded_file),
+            spool_path=str(spool_path),
+            sha256=self.file_digest(uploaded_file),
+            size=uploaded_file.size,
+        )
+        attachment = self.record_attachment(
+            chat_id, uploaded_file, upload.storage_key, message, upload
+        )
+        transaction.on_commit(
+            lambda: upload_executor.submit(self.run_upload, upload.id)
+        )
+        return attachment
+
+    def flush_upload(self, upload_id):
+        # Returns True once the object is in storage
+        try:
+            upload = UploadOutbox.objects.get(id=upload_id, status=UploadOutbox.PENDING)
+        except UploadOutbox.DoesNotExist:
+            return False
+
+        try:
+            if not chat_uploads.exists(upload.storage_key):
+                if not Path(upload.spool_path).exists():
+                    # Spooled on another host, or that host's spool is not
+                    # mounted yet; not a failed attempt
+                    upload.last_error = f"Spool file not found: {upload.spool_path}"
+                    upload.save(update_fields=["last_error", "updated_at"])
+                    logger.warning("Upload %s: %s", upload_id, upload.last_error)
+                    return False
+                # boto3 switches to multipart above UPLOAD_MULTIPART_THRESHOLD
+                started = time.perf_counter()
+                chat_uploads.bucket.upload_file(
+                    upload.spool_path, upload.storage_key, Config=upload_transfer_config
+                )
+                metrics.observe(
+                    "webai_upload_save_seconds", time.perf_counter() - started
+                )
+        except Exception as e:
+            upload.attempts += 1
+            upload.last_error = str(e)
+            if upload.attempts >= settings.UPLOAD_MAX_ATTEMPTS:
+                upload.status = UploadOutbox.FAILED
+            upload.save(update_fields=["attempts", "last_error", "status", "updated_at"])
+            logger.warning("Upload %s failed (attempt %s): %s", upload_id, upload.attempts, e)
+            return False
+
+        upload.status = UploadOutbox.DONE
+        upload.save(update_fields=["status", "updated_at"])
+        Path(upload.spool_path).unlink(missing_ok=True)
+        return True
+
+    def run_upload(self, upload_id):
+        try:
+            self.flush_upload(upload_id)
+        except Exception as e:
+            logger.warning("Upload %s could not be processed: %s", upload_id, e)
+        finally:
+            connections.close_all()
+
+    def document_indexed(self, chat_id, attachment):
+        # The same file uploaded again into the chat is indexed once
+        return DocumentChunk.objects.filter(
+            chat_id=chat_id, attachment__sha256=attachment.sha256
+        ).exists()
+
+    def schedule_document_index(self, chat, attachment):
+        # Indexes an uploaded document off the request path once the
+        # attachment is committed. Returns False when its chunks are already
+        # retrievable, True when the caller should inline an excerpt instead.
+        if self.document_indexed(chat.id, attachment):
+            return False
+        transaction.on_commit(
+            lambda: document_index_executor.submit(self.run_document_index, attachment.id)
+        )
+        return True
+
+    def document_text(self, attachment):
+        # Up to RAG_MAX_CHARS of the attachment's text, read from the local
+        # spool while the upload is pending there, otherwise from storage
+        file_ext = os.path.splitext(attachment.file_name)[1].lower()[1:]
+        if file_ext not in TEXT_EXTENSIONS:
+            return ""
+        max_chars = settings.RAG_MAX_CHARS
+        cached = self.upload_text_cache.get(attachment.sha256, max_chars)
+        if cached is not None:
+            return cached[0]
+
+        handle = None
+        if attachment.upload is not None:
+            try:
+                handle = open(attachment.upload.spool_path, "rb")
+            except FileNotFoundError:
+                # Stored (and unspooled) in the meantime
+                pass
+        if handle is None:
+            handle = chat_uploads.open(attachment.storage_key, "rb")
+        with handle:
+            started = time.perf_counter()
+            text, truncated, timed_out = self.extract_text(
+                handle, file_ext, max_chars, settings.RAG_EXTRACT_TIMEOUT
+            )
+            metrics.observe(
+                "webai_file_extraction_seconds", time.perf_counter() - started, kind=file_ext
+            )
+        if not timed_out:
+            self.upload_text_cache.set(attachment.sha256, max_chars, text, truncated)
+        return text
+
+    def run_document_index(self, attachment_id):
+        try:
+            attachment = Attachment.objects.select_related("chat", "upload").get(
+                id=attachment_id
+            )
+            text = self.document_text(attachment)
+            if text:
+                self.index_document(attachment.chat, attachment, text)
+        except Exception as e:
+            logger.warning("Document index of attachment %s failed: %s", attachment_id, e)
+        finally:
+            connections.close_all()
+
+    def index_document(self, chat, attachment, text):
+        # Chunks and embeds an uploaded document for retrieval
+        if self.document_indexed(chat.id, attachment):
+            return 0
+        started = time.perf_counter()
+        count = self.documents.add(chat, attachment, attachment.file_name, text)
+        metrics.observe("webai_document_index_seconds", time.perf_counter() - started)
+        return count
+
+    def list_attachments(self, chat):
+        return list(
+            chat.attachments.select_related("upload").order_by("created_at", "id")
+        )
+
+    def attachment_status(self, attachment):
+        # "stored", or the outbox status while the object is not stored yet
+        upload = attachment.upload
+        if upload is None or upload.status == UploadOutbox.DONE:
+            return "stored"
+        return upload.status
+
+    def open_attachment(self, attachment, start, end):
+        # Iterator over bytes start..end (inclusive), read in
+        # ATTACHMENT_CHUNK_SIZE pieces. The source is opened here, so a
+        # missing object fails before a response is started. Pending uploads
+        # are read from the local spool when this host has it.
+        chunk_size = settings.ATTACHMENT_CHUNK_SIZE
+        if self.attachment_status(attachment) == UploadOutbox.PENDING:
+            try:
+                handle = open(attachment.upload.spool_path, "rb")
+            except FileNotFoundError:
+                # Stored (and unspooled) since the status was read
+                pass
+            else:
+                handle.seek(start)
+                return iter_file_range(handle, end - start + 1, chunk_size)
+
+        body = chat_uploads.bucket.Object(attachment.storage_key).get(
+            Range=f"bytes={start}-{end}"
+        )["Body"]
+        return iter_object_body(body, chunk_size)
+
+    def attachment_url(self, attachment):
+        # Short-lived presigned URL that downloads under the original name
+        return chat_uploads.url(
+            attachment.storage_key,
+            parameters={
+                "ResponseContentDisposition": content_disposition_header(
+                    True, attachment.file_name
+                ),
+                "ResponseContentType": attachment.content_type,
+            },
+            expire=settings.ATTACHMENT_URL_EXPIRE,
+        )
+
     def create_message(self, chat, role, content):
-        return Message.objects.create(chat=chat, role=role, content=content)
+        message = Message.objects.create(chat=chat, role=role, content=content)
+        self.search.add_message(chat, message)
+        self.conversation_cache.append(chat.id, role, content)
+        self.set_message_marker(chat, message.id)
+        self.touch_chat(chat)
+        return message
+
+    def set_message_marker(self, chat, message_id):
+        # Only ever raised: a slower writer cannot hide a newer message
+        self.message_markers.raise_to(chat.id, chat.user_id, message_id)
+
+    def get_message_marker(self, chat_id):
+        # Returns (user_id, last_message_id), or None for an unknown chat
+        marker = self.message_markers.get(chat_id)
+        if marker is None:
+            user_id = (
+                Chat.objects.filter(id=chat_id).values_list("user_id", flat=True).first()
+            )
+            if user_id is None:
+                return None
+            last_id = (
+                Message.objects.filter(chat_id=chat_id)
+                .order_by("-id")
+                .values_list("id", flat=True)
+                .first()
+            )
+            marker = (user_id, last_id or 0)
+            self.message_markers.raise_to(chat_id, *marker)
+        return marker
+
+    def expire_orphaned_replies(self, chat_id):
+        # Replies left STREAMING by a generation that no longer runs (a
+        # crashed or killed worker) become FAILED with their checkpointed
+        # text, or are dropped when nothing was saved. Returns True if any
+        # row changed.
+        rows = list(
+            Message.objects.filter(chat_id=chat_id, status=Message.STREAMING)
+            .order_by("id")
+            .values_list("id", "content")
+        )
+        if not rows:
+            return False
+        # A reply answers the user message before it (its turn)
+        turns = {
+            message_id: Message.objects.filter(
+                chat_id=chat_id, role="user", id__lt=message_id
+            )
+            .order_by("-id")
+            .values_list("id", flat=True)
+            .first()
+            for message_id, _ in rows
+        }
+        try:
+            running = self.generations.running(
+                chat_id, [str(turn) for turn in turns.values() if turn]
+            )
+        except RedisError as e:
+            logger.warning("Generation state of chat %s unavailable: %s", chat_id, e)
+            return False
+        orphans = [
+            (message_id, content)
+            for message_id, content in rows
+            if str(turns[message_id]) not in running
+        ]
+        if not orphans:
+            return False
+
+        failed = [message_id for message_id, content in orphans if content]
+        empty = [message_id for message_id, content in orphans if not content]
+        Message.objects.filter(id__in=failed, status=Message.STREAMING).update(
+            status=Message.FAILED
+        )
+        Message.objects.filter(id__in=empty, status=Message.STREAMING).delete()
+        logger.warning("Chat %s: expired orphaned replies %s", chat_id, failed + empty)
+        self.conversation_cache.invalidate(chat_id)
+        self.message_markers.delete(chat_id)
+        return True
+
+    def get_messages_since(self, chat_id, since=0, limit=None):
+        # Messages newer than `since` (a message id), oldest first
+        rows = (
+            Message.objects.filter(chat_id=chat_id, id__gt=since)
+            .order_by("id")
+            .values("id", "role", "content", "status", "created_at")[
+                : limit or settings.MESSAGE_POLL_LIMIT
+            ]
+        )
+        messages = list(rows)
+        if any(
+            message["status"] == Message.STREAMING for message in messages
+        ) and self.expire_orphaned_replies(chat_id):
+            messages = list(rows.all())
+        # A reply still streaming shows the text from Redis, which is ahead
+        # of its last DB checkpoint
+        for message in messages:
+            if message["status"] == Message.STREAMING:
+                turn = self.generations.active(chat_id)
+                partial = self.generations.partial(chat_id, turn) if turn else ""
+                if len(partial) > len(message["content"]):
+                    message["content"] = partial
+        return messages
+
+    def touch_chat(self, chat):
+        # New activity moves the chat to the top of the sidebar; update()
+        # skips a full-row save
+        chat.updated_at = timezone.now()
+        Chat.objects.filter(id=chat.id).update(updated_at=chat.updated_at)
+        self.index_chat(chat)
+
+    def index_chat(self, chat):
+        self.recent_chats.upsert(
+            chat.user_id, chat.id, chat.title, to_micros(chat.updated_at)
+        )
+
+    def query_chats(self, user_id, cursor=None, limit=None):
+        # Keyset page on (-updated_at, -id), served by chat_user_updated_idx
+        chats = Chat.objects.filter(user_id=user_id)
+        if cursor:
+            updated_at, chat_id = decode_cursor(cursor)
+            chats = chats.filter(
+                Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=chat_id)
+            )
+        rows = chats.order_by("-updated_at", "-id").values("id", "title", "updated_at")
+        return [
+            {**row, "updated_at": to_micros(row["updated_at"])} for row in rows[:limit]
+        ]
+
+    def list_chats(self, user_id, cursor=None, limit=None):
+        # Returns (rows, next_cursor); the first page comes from the
+        # recent-chats index when it is filled
+        limit = min(limit or settings.SIDEBAR_PAGE_SIZE, settings.SIDEBAR_PAGE_MAX)
+        if cursor:
+            rows = self.query_chats(user_id, cursor, limit + 1)
+        else:
+            rows = self.recent_chats.page(user_id, limit)
+            if rows is None:
+                version = self.recent_chats.version(user_id)
+                size = max(self.recent_chats.max_size, limit)
+                rows = self.query_chats(user_id, limit=size + 1)
+                self.recent_chats.fill(
+                    user_id,
+                    rows,
+                    complete=len(rows) <= self.recent_chats.max_size,
+                    version=version,
+                )
+
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def get_conversation(self, chat):
+        conversation = self.conversation_cache.get(chat.id)
+        if conversation is None:
+            # Rebuild only the tail the cache can hold
+            version = self.conversation_cache.version(chat.id)
+            limit = self.conversation_cache.max_size
+            messages = chat.messages.all()
+            if self.generations.active(chat.id):
+                # The in-flight reply is streamed to the page separately and
+                # appended here once it is final
+                messages = messages.exclude(status=Message.STREAMING)
+            rows = list(
+                messages.order_by("-created_at").values_list("role", "content")[:limit]
+            )
+            rows.reverse()
+            self.conversation_cache.fill(chat.id, rows, version)
+            conversation = [{"role": role, "text": content} for role, content in rows]
+        return conversation
+
+    def delete_chat(self, chat):
+        chat_id = chat.id
+        chat.delete()
+        if chat.archive_key:
+            self.archive.delete(chat.archive_key)
+        self.conversation_cache.invalidate(chat_id)
+        self.recent_chats.remove(chat.user_id, chat_id)
+        self.message_markers.delete(chat_id)
+
+    def archive_chat(self, chat, idle_before):
+        # Moves the messages of a chat idle since before `idle_before` to
+        # object storage. Returns {"messages", "raw_bytes", "compressed_bytes",
+        # "postings"}, or None if the chat has nothing to archive or saw
+        # activity meanwhile.
+        if chat.archived_at or self.generations.active(chat.id):
+            return None
+        upto_id = chat.messages.order_by("-id").values_list("id", flat=True).first()
+        if upto_id is None:
+            return None
+
+        now = timezone.now()
+        key, count, raw, size = self.archive.write(chat, upto_id, now)
+        with transaction.atomic():
+            idle = (
+                Chat.objects.select_for_update()
+                .filter(id=chat.id, archived_at__isnull=True, updated_at__lt=idle_before)
+                .exists()
+            )
+            if idle:
+                postings, _ = SearchPosting.objects.filter(
+                    chat_id=chat.id, message_id__lte=upto_id
+                ).delete()
+                chat.messages.filter(id__lte=upto_id).delete()
+                Chat.objects.filter(id=chat.id).update(archived_at=now, archive_key=key)
+        if not idle:
+            self.archive.delete(key)
+            return None
+
+        chat.archived_at, chat.archive_key = now, key
+        self.conversation_cache.invalidate(chat.id)
+        self.message_markers.delete(chat.id)
+        return {
+            "messages": count,
+            "raw_bytes": raw,
+            "compressed_bytes": size,
+            "postings": postings,
+        }
+
+    def restore_chat(self, chat):
+        # Streams an archived chat's messages back into the table; called
+        # before the chat is read or written. Returns the messages restored.
+        # Their search postings are rebuilt in the background.
+        if not chat.archived_at:
+            return 0
+        started = time.perf_counter()
+        count = upto_id = 0
+        with transaction.atomic():
+            # Concurrent openers wait on the row lock, then find it restored
+            key = (
+                Chat.objects.select_for_update()
+                .filter(id=chat.id, archived_at__isnull=False)
+                .values_list("archive_key", flat=True)
+                .first()
+            )
+            if key is not None:
+                for rows in self.archive.read(key):
+                    links = [row.pop("attachments") for row in rows]
+                    messages = Message.objects.bulk_create(
+                        [Message(chat_id=chat.id, **row) for row in rows]
+                    )
+                    for message, attachment_ids in zip(messages, links):
+                        if attachment_ids:
+                            Attachment.objects.filter(
+                                chat_id=chat.id, id__in=attachment_ids
+                            ).update(message=message)
+                    count += len(messages)
+                    upto_id = max(upto_id, messages[-1].id)
+                Chat.objects.filter(id=chat.id).update(archived_at=None, archive_key="")
+                transaction.on_commit(lambda: self.archive.delete(key))
+                transaction.on_commit(
+                    lambda: archive_index_executor.submit(
+                        self.index_restored, chat.id, chat.user_id, upto_id
+                    )
+                )
+
+        chat.archived_at, chat.archive_key = None, ""
+        self.conversation_cache.invalidate(chat.id)
+        self.message_markers.delete(chat.id)
+        metrics.observe("webai_chat_restore_seconds", time.perf_counter() - started)
+        return count
+
+    def index_restored(self, chat_id, user_id, upto_id):
+        # Search postings of restored messages (removed when archived)
+        try:
+            rows = Message.objects.filter(chat_id=chat_id, id__lte=upto_id).values_list(
+                "id", "content"
+            )
+            postings = []
+            for message_id, content in rows.iterator(self.archive.batch_size):
+                postings += self.search.postings(user_id, chat_id, message_id, content)
+                if len(postings) >= self.archive.batch_size:
+                    SearchPosting.objects.bulk_create(postings)
+                    postings = []
+            SearchPosting.objects.bulk_create(postings)
+        except Exception as e:
+            logger.warning("Search indexing failed for restored chat %s: %s", chat_id, e)
+        finally:
+            connections.close_all()
 
     def get_chat_history(self, chat, limit=10):
-        return list(chat.messages.all().order_by("created_at"))[-limit:]
+        # Fetch only the tail (served by the (chat, created_at) index)
+        messages = list(chat.messages.order_by("-created_at", "-id")[:limit])
+        messages.reverse()
+        return messages
+
+    def get_chat_history_by_tokens(
+        self, chat, max_tokens, batch_size=20, latest_is_prompt=False
+    ):
+        # Walk back from the newest message until the token budget is spent.
+        # Replies still streaming (or orphaned by a crashed worker) are left out.
+        # With latest_is_prompt the newest message is the current turn, already
+        # counted by the caller, and is kept without charging it again.
+        # Batches are keyset pages on (created_at, id) of the needed columns
+        # only; rows have .id, .role and .content like Message instances.
+        messages = []
+        used = 0
+        queryset = (
+            chat.messages.exclude(status=Message.STREAMING)
+            .order_by("-created_at", "-id")
+            .values_list("id", "role", "content", "created_at", named=True)
+        )
+        last = None
+        while True:
+            page = queryset
+            if last is not None:
+                page = page.filter(
+                    Q(created_at__lt=last.created_at)
+                    | Q(created_at=last.created_at, id__lt=last.id)
+                )
+            batch = list(page[:batch_size])
+            for msg in batch:
+                if latest_is_prompt and not messages:
+                    messages.append(msg)
+                    continue
+                tokens = count_message_tokens(msg.content)
+                if used + tokens > max_tokens:
+                    messages.reverse()
+                    return messages
+                used += tokens
+                messages.append(msg)
+            if len(batch) < batch_size:
+                break
+            last = batch[-1]
+        messages.reverse()
+        return messages
+
+    def update_chat_title(self, chat, title_text=None):
+        if not title_text:
+            return
+        chat.title = title_text[:50] + ("..." if len(title_text) > 50 else "")
+        chat.save()
+        self.index_chat(chat)
+        self.search.set_title(chat)
+
+    def rename_chat(self, chat, title):
+        chat.title = title
+        chat.save()
+        self.index_chat(chat)
+        self.search.set_title(chat)
+
+    def build_prompt_messages(
+        self, system_prompt, chat_history, full_prompt, summary=None, excerpts=None
+    ):
+        messages = [{"role": "system", "content": system_prompt}]
+        if summary:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{summary}",
+                }
+            )
+        if excerpts:
+            messages.append({"role": "system", "content": excerpts})
+        # Exclude the last message, it is replaced by the full prompt below
+        messages.extend(
+            [{"role": msg.role, "content": msg.content} for msg in chat_history[:-1]]
+        )
+        messages.append({"role": "user", "content": full_prompt})
+        return messages
+
+    def format_excerpts(self, chunks):
+        if not chunks:
+            return None
+        parts = ["Excerpts from files uploaded in this conversation:"]
+        for chunk in chunks:
+            parts.append(
+                f"[{chunk['file_name']}, part {chunk['ordinal'] + 1}]\n{chunk['text']}"
+            )
+        return "\n\n".join(parts)
+
+    def build_context(self, chat, system_prompt, full_prompt, query=None):
+        # Fit system prompt + summary + document excerpts + history + current
+        # prompt into the budget; excerpts are the uploaded chunks closest to
+        # `query` (the user's prompt)
+        full_prompt = truncate_to_tokens(full_prompt, settings.CONTEXT_PROMPT_TOKENS)
+        used = count_message_tokens(system_prompt) + count_message_tokens(full_prompt)
+        if chat.summary:
+            used += count_message_tokens(chat.summary)
+        excerpts = self.format_excerpts(
+            self.documents.search(chat.id, query or "", settings.RAG_CONTEXT_TOKENS)
+        )
+        if excerpts:
+            used += count_message_tokens(excerpts)
+        history_budget = max(0, settings.CONTEXT_TOKEN_BUDGET - used)
+
+        # The history ends with the user message saved for this turn, which
+        # build_prompt_messages replaces with full_prompt (already in `used`)
+        chat_history = self.get_chat_history_by_tokens(
+            chat, history_budget, latest_is_prompt=True
+        )
+
+        # Newest message that no longer fits the window
+        evicted = chat.messages.order_by("-created_at", "-id")
+        if chat_history:
+            evicted = evicted.filter(id__lt=chat_history[0].id)
+        last_evicted_id = evicted.values_list("id", flat=True).first()
+
+        summary = None
+        if last_evicted_id is not None:
+            summary = chat.summary
+            if last_evicted_id > (chat.summary_message_id or 0):
+                self.schedule_summary_refresh(chat.id, last_evicted_id)
+
+        return self.build_prompt_messages(
+            system_prompt, chat_history, full_prompt, summary=summary, excerpts=excerpts
+        )
+
+    def schedule_summary_refresh(self, chat_id, upto_message_id):
+        # One refresh per chat at a time, across all workers
+        lock_key = f"chat_summary_lock:{chat_id}"
+        if not cache.add(lock_key, 1, timeout=settings.SUMMARY_LOCK_TIMEOUT):
+            return
+        summary_executor.submit(
+            self.refresh_summary, chat_id, upto_message_id, lock_key
+        )
+
+    def refresh_summary(self, chat_id, upto_message_id, lock_key=None):
+        try:
+            chat = Chat.objects.get(id=chat_id)
+            start_id = chat.summary_message_id or 0
+            if upto_message_id <= start_id:
+                return
+
+            # Oldest unsummarized messages first, bounded by the summary input
+            # budget; whatever does not fit is picked up by the next round
+            new_messages = []
+            used = count_message_tokens(chat.summary)
+            for msg in chat.messages.filter(
+                id__gt=start_id, id__lte=upto_message_id
+            ).order_by("created_at", "id")[: settings.SUMMARY_MAX_MESSAGES]:
+                used += count_message_tokens(msg.content)
+                if used > settings.SUMMARY_INPUT_TOKENS and new_messages:
+                    break
+                new_messages.append(msg)
+            if not new_messages:
+                Chat.objects.filter(id=chat_id).update(summary_message_id=upto_message_id)
+                return
+            summarized_id = max(msg.id for msg in new_messages)
+
+            transcript = "\n".join(
+                f"{msg.role}: {truncate_to_tokens(msg.content, settings.SUMMARY_INPUT_TOKENS)}"
+                for msg in new_messages
+            )
+            summary = self.ai_manager.complete(
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {
+                        "role": "user",
+                        "content": f"Existing summary:\n{chat.summary or '(none)'}"
+                        f"\n\nNew messages:\n{transcript}",
+                    },
+                ],
+                max_tokens=settings.SUMMARY_MAX_TOKENS,
+            ).strip()
+
+            # update() keeps Chat.updated_at (sidebar order) untouched
+            Chat.objects.filter(id=chat_id).update(
+                summary=summary, summary_message_id=summarized_id
+            )
+            more = summarized_id < upto_message_id
+        except Exception as e:
+            logger.warning("Summary refresh failed for chat %s: %s", chat_id, e)
+            more = False
+        finally:
+            if lock_key:
+                cache.delete(lock_key)
+            connections.close_all()
+        if more:
+            self.schedule_summary_refresh(chat_id, upto_message_id)
 
-    # def update_chat_title(self, chat, title_text=None):
-    #     if not title_text:
-    #         return
-    #     chat.title = title_text[:50] + ("..." if len(title_text) > 50 else "")
-    #     chat.save()
+    def get_cached_response(self, chat, messages):
+        if not chat.response_cache_enabled:
+            return None
+        return self.response_cache.lookup(
+            self.ai_manager.default_model, messages, chat.user_id
+        )
+
+    def cache_response(self, chat, messages, response):
+        if chat.response_cache_enabled:
+            self.response_cache.store(
+                self.ai_manager.default_model, messages, response, chat.user_id
+            )
+
+    def start_generation(self, chat, turn, messages, lease=None):
+        # Answers `turn` (the user message id) in the background; clients
+        # follow it through self.generations. `lease` is the rate limiter
+        # slot, settled with the tokens used once the generation ends.
+        self.generations.start(chat.id, turn)
+        if settings.GENERATION_QUEUE:
+            self.generation_queue.enqueue(
+                chat.user_id,
+                self.ai_manager.default_model,
+                {
+                    "chat_id": chat.id,
+                    "turn": turn,
+                    "messages": messages,
+                    "lease": lease,
+                    "user_id": chat.user_id,
+                },
+            )
+        else:
+            generation_executor.submit(
+                self.run_generation, chat.id, turn, messages, lease, chat.user_id
+            )
+
+    def fail_generation(self, chat_id, turn, error, lease=None, user_id=None):
+        # For a queued job that never ran or lost its worker: settle the
+        # lease and end the stream; an orphaned reply row is expired by
+        # expire_orphaned_replies once the stream's text key is gone
+        self.settle_generation(user_id, lease, None)
+        self.generations.finish(chat_id, turn, {"type": "error", "content": error})
+
+    def settle_generation(self, user_id, lease, reply):
+        # The stream slot is freed even when the chat was deleted meanwhile,
+        # so callers pass the owner rather than the chat
+        if lease is None or user_id is None:
+            return
+        used = reply is not None and reply.completion_tokens is not None
+        self.limiter.settle(
+            user_id,
+            lease,
+            reply.prompt_tokens if used else 0,
+            reply.completion_tokens if used else 0,
+        )
+
+    def begin_reply(self, chat):
+        # The assistant row exists before the first token, so a crash or a
+        # dropped worker keeps whatever was last checkpointed
+        message = Message.objects.create(
+            chat=chat, role="assistant", content="", status=Message.STREAMING
+        )
+        self.set_message_marker(chat, message.id)
+        return message
+
+    def checkpoint_reply(self, message, content):
+        Message.objects.filter(id=message.id).update(content=content)
+
+    def finish_reply(
+        self, chat, message, content, status, messages, started, first_token_at
+    ):
+        # Final commit with token counts and timings; empty replies are dropped
+        if not content:
+            message.delete()
+            self.message_markers.delete(chat.id)
+            return
+        message.content = content
+        message.status = status
+        message.prompt_tokens = sum(
+            count_message_tokens(item["content"]) for item in messages
+        )
+        message.completion_tokens = count_tokens(content)
+        if first_token_at is not None:
+            message.ttft_ms = int((first_token_at - started) * 1000)
+        message.latency_ms = int((time.monotonic() - started) * 1000)
+        message.save(
+            update_fields=[
+                "content",
+                "status",
+                "prompt_tokens",
+                "completion_tokens",
+                "ttft_ms",
+                "latency_ms",
+            ]
+        )
+        self.search.add_message(chat, message)
+        self.conversation_cache.append(chat.id, "assistant", content)
+        self.touch_chat(chat)
+        self.record_generation(message)
+
+    def record_generation(self, message):
+        model = self.ai_manager.default_model
+        latency = message.latency_ms / 1000
+        metrics.observe("webai_generation_seconds", latency, model=model)
+        metrics.observe("webai_prompt_tokens", message.prompt_tokens, model=model)
+        metrics.observe("webai_completion_tokens", message.completion_tokens, model=model)
+        if message.ttft_ms is not None:
+            ttft = message.ttft_ms / 1000
+            metrics.observe("webai_ttft_seconds", ttft, model=model)
+            if latency > ttft:
+                metrics.observe(
+                    "webai_tokens_per_second",
+                    message.completion_tokens / (latency - ttft),
+                    model=model,
+                )
+
+    def run_generation(self, chat_id, turn, messages, lease=None, user_id=None):
+        final = {"type": "done"}
+        chat = None
+        stream = None
+        buffer = TokenBuffer()
+        reply = None
+        started = time.monotonic()
+        first_token_at = None
+        try:
+            chat = Chat.objects.get(id=chat_id)
+
+            # Replay a cached answer in the same event format
+            cached_response = self.get_cached_response(chat, messages)
+            if cached_response is not None:
+                for content in iter_replay_chunks(cached_response, buffer.flush_size):
+                    self.generations.publish(
+                        chat_id, turn, {"type": "content", "content": content}
+                    )
+                self.create_message(chat, "assistant", cached_response)
+                return
+
+            reply = self.begin_reply(chat)
+            checked_at = checkpoint_at = time.monotonic()
+            stream = iter_timed(self.ai_manager.stream_chat(messages), buffer.wait_time)
+            for content in stream:
+                if content is None:
+                    # Flush deadline passed with no new chunk
+                    content = buffer.take()
+                else:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                    content = buffer.add(content)
+                if content:
+                    self.generations.publish(
+                        chat_id, turn, {"type": "content", "content": content}
+                    )
+                    # Batched DB checkpoint; readers get newer text from Redis
+                    if (
+                        time.monotonic() - checkpoint_at
+                        > settings.GENERATION_CHECKPOINT_INTERVAL
+                    ):
+                        checkpoint_at = time.monotonic()
+                        self.checkpoint_reply(reply, buffer.text())
+                # The stop button cancels through Redis, checked periodically
+                if time.monotonic() - checked_at > settings.GENERATION_CANCEL_CHECK:
+                    checked_at = time.monotonic()
+                    if self.generations.cancelled(chat_id, turn):
+                        final = {"type": "cancelled"}
+                        return
+
+            response = buffer.text()
+            if response:
+                self.cache_response(chat, messages, response)
+        except Exception as e:
+            final = {"type": "error", "content": str(e)}
+        finally:
+            if stream is not None:
+                stream.close()
+            try:
+                # Unflushed tail goes out ahead of the final event
+                content = buffer.take()
+                if content:
+                    self.generations.publish(
+                        chat_id, turn, {"type": "content", "content": content}
+                    )
+            except RedisError as e:
+                logger.warning("Generation %s/%s publish failed: %s", chat_id, turn, e)
+            if reply is not None:
+                try:
+                    self.finish_reply(
+                        chat,
+                        reply,
+                        buffer.text(),
+                        REPLY_STATUS.get(final["type"], Message.FAILED),
+                        messages,
+                        started,
+                        first_token_at,
+                    )
+                except Exception as e:
+                    logger.warning("Generation %s/%s save failed: %s", chat_id, turn, e)
+                    final = {"type": "error", "content": str(e)}
+            self.settle_generation(user_id, lease, reply)
+            try:
+                self.generations.finish(chat_id, turn, final)
+            except RedisError as e:
+                logger.warning("Generation %s/%s finish failed: %s", chat_id, turn, e)
+            connections.close_all()
+
+    # Async variants for the ASGI stream view
+    async def acreate_message(self, chat, role, content):
+        message = await Message.objects.acreate(chat=chat, role=role, content=content)
+        await sync_to_async(self.search.add_message)(chat, message)
+        await sync_to_async(self.conversation_cache.append)(chat.id, role, content)
+        await sync_to_async(self.set_message_marker)(chat, message.id)
+        await sync_to_async(self.touch_chat)(chat)
+        return message
+
+    async def aget_chat_history(self, chat, limit=10):
+        messages = [
+            msg async for msg in chat.messages.order_by("-created_at", "-id")[:limit]
+        ]
+        messages.reverse()
+        return messages
+
+    async def aprocess_file(self, uploaded_file):
+        return await sync_to_async(self.process_file)(uploaded_file)
+
+    async def asave_file(self, chat_id, uploaded_file, message=None):
+        return await sync_to_async(self.save_file)(chat_id, uploaded_file, message)
+
+    async def aqueue_file_save(self, chat_id, uploaded_file, message=None):
+        return await sync_to_async(self.queue_file_save)(chat_id, uploaded_file, message)
+
+    async def arestore_chat(self, chat):
+        return await sync_to_async(self.restore_chat)(chat)
+
+    async def aschedule_document_index(self, chat, attachment):
+        return await sync_to_async(self.schedule_document_index)(chat, attachment)
+
+    async def aupdate_chat_title(self, chat, title_text=None):
+        return await sync_to_async(self.update_chat_title)(chat, title_text)
+
+    async def aget_cached_response(self, chat, messages):
+        return await sync_to_async(self.get_cached_response)(chat, messages)
+
+    async def acache_response(self, chat, messages, response):
+        return await sync_to_async(self.cache_response)(chat, messages, response)
+
+    async def abuild_context(self, chat, system_prompt, full_prompt, query=None):
+        return await sync_to_async(self.build_context)(
+            chat, system_prompt, full_prompt, query
+        )
+
+    async def astart_generation(self, chat, turn, messages, lease=None):
+        if settings.GENERATION_QUEUE:
+            return await sync_to_async(self.start_generation)(
+                chat, turn, messages, lease
+            )
+
+        # Runs as a task on the server's event loop, not tied to the request.
+        # A fresh context detaches it from the request's sync_to_async
+        # executor, which shuts down once the response has been returned.
+        await sync_to_async(self.generations.start)(chat.id, turn)
+        task = asyncio.create_task(
+            self.arun_generation(chat.id, turn, messages, lease, chat.user_id),
+            context=contextvars.Context(),
+        )
+        generation_tasks.add(task)
+        task.add_done_callback(generation_tasks.discard)
+
+    async def abegin_reply(self, chat):
+        return await sync_to_async(self.begin_reply)(chat)
+
+    async def acheckpoint_reply(self, message, content):
+        await Message.objects.filter(id=message.id).aupdate(content=content)
+
+    async def afinish_reply(self, *args):
+        return await sync_to_async(self.finish_reply)(*args)
+
+    async def arun_generation(self, chat_id, turn, messages, lease=None, user_id=None):
+        final = {"type": "done"}
+        chat = None
+        stream = None
+        buffer = TokenBuffer()
+        reply = None
+        started = time.monotonic()
+        first_token_at = None
+        try:
+            chat = await Chat.objects.aget(id=chat_id)
+
+            cached_response = await self.aget_cached_response(chat, messages)
+            if cached_response is not None:
+                for content in iter_replay_chunks(cached_response, buffer.flush_size):
+                    await self.generations.apublish(
+                        chat_id, turn, {"type": "content", "content": content}
+                    )
+                await self.acreate_message(chat, "assistant", cached_response)
+                return
+
+            reply = await self.abegin_reply(chat)
+            checked_at = checkpoint_at = time.monotonic()
+            stream = aiter_timed(
+                self.ai_manager.astream_chat(messages), buffer.wait_time
+            )
+            async for content in stream:
+                if content is None:
+                    content = buffer.take()
+                else:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                    content = buffer.add(content)
+                if content:
+                    await self.generations.apublish(
+                        chat_id, turn, {"type": "content", "content": content}
+                    )
+                    if (
+                        time.monotonic() - checkpoint_at
+                        > settings.GENERATION_CHECKPOINT_INTERVAL
+                    ):
+                        checkpoint_at = time.monotonic()
+                        await self.acheckpoint_reply(reply, buffer.text())
+                if time.monotonic() - checked_at > settings.GENERATION_CANCEL_CHECK:
+                    checked_at = time.monotonic()
+                    if await self.generations.acancelled(chat_id, turn):
+                        final = {"type": "cancelled"}
+                        return
+
+            response = buffer.text()
+            if response:
+                await self.acache_response(chat, messages, response)
+        except Exception as e:
+            final = {"type": "error", "content": str(e)}
+        finally:
+            if stream is not None:
+                await stream.aclose()
+            try:
+                content = buffer.take()
+                if content:
+                    await self.generations.apublish(
+                        chat_id, turn, {"type": "content", "content": content}
+                    )
+            except RedisError as e:
+                logger.warning("Generation %s/%s publish failed: %s", chat_id, turn, e)
+            if reply is not None:
+                try:
+                    await self.afinish_reply(
+                        chat,
+                        reply,
+                        buffer.text(),
+                        REPLY_STATUS.get(final["type"], Message.FAILED),
+                        messages,
+                        started,
+                        first_token_at,
+                    )
+                except Exception as e:
+                    logger.warning("Generation %s/%s save failed: %s", chat_id, turn, e)
+                    final = {"type": "error", "content": str(e)}
+            await sync_to_async(self.settle_generation)(user_id, lease, reply)
+            try:
+                await self.generations.afinish(chat_id, turn, final)
+            except RedisError as e:
+                logger.warning("Generation %s/%s finish failed: %s", chat_id, turn, e)
 
     # def generate_response(self, user):
     #     messages = [{"role": "user", "content": user}]
@@ -1,3 +1,224 @@
-from django.test import TestCase
+# Standard library
+import asyncio
+import json
+import threading
+from unittest import mock
 
-# Create your tests here.
+# Django / third-party
+import fakeredis
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+# Local app imports
+from users.models import CustomUser
+from .limits import RateLimited
+from .models import Attachment, Chat, Message
+from .services import ChatService, TokenBuffer, aiter_timed, iter_timed
+from .views import byte_range, sse_content, sse_frames
+
+
+# Streamed text is flushed on the GENERATION_FLUSH_INTERVAL deadline even
+# when the LLM stalls, and SSE frames batch it as documented
+class TokenFlushTests(SimpleTestCase):
+    def test_pending_text_flushed_on_deadline_without_next_chunk(self):
+        buffer = TokenBuffer(flush_size=1000, flush_interval=0.2)
+        resume = threading.Event()
+
+        def chunks():
+            yield "a"
+            yield "b"
+            # Stalls until "b" has gone out on the deadline alone
+            resume.wait(5)
+            yield "c"
+
+        flushed, ticks = [], 0
+        for content in iter_timed(chunks(), buffer.wait_time):
+            if content is None:
+                ticks += 1
+                content = buffer.take()
+            else:
+                content = buffer.add(content)
+            if content:
+                flushed.append(content)
+            if flushed == ["a", "b"]:
+                resume.set()
+        flushed.append(buffer.take())
+
+        self.assertGreaterEqual(ticks, 1)
+        self.assertEqual(flushed[:2], ["a", "b"])
+        self.assertEqual("".join(flushed), "abc")
+
+    def test_async_pending_text_flushed_on_deadline_without_next_chunk(self):
+        async def run():
+            buffer = TokenBuffer(flush_size=1000, flush_interval=0.2)
+            resume = asyncio.Event()
+
+            async def chunks():
+                yield "a"
+                yield "b"
+                await asyncio.wait_for(resume.wait(), 5)
+                yield "c"
+
+            flushed = []
+            async for content in aiter_timed(chunks(), buffer.wait_time):
+                content = buffer.take() if content is None else buffer.add(content)
+                if content:
+                    flushed.append(content)
+                if flushed == ["a", "b"]:
+                    resume.set()
+            flushed.append(buffer.take())
+            return flushed
+
+        flushed = asyncio.run(run())
+        self.assertEqual(flushed[:2], ["a", "b"])
+        self.assertEqual("".join(flushed), "abc")
+
+    def test_nothing_pending_waits_indefinitely(self):
+        buffer = TokenBuffer(flush_size=1000, flush_interval=0.2)
+        self.assertIsNone(buffer.wait_time())
+        self.assertEqual(buffer.add("a"), "a")
+        self.assertIsNone(buffer.wait_time())
+        self.assertEqual(buffer.add("b"), "")
+        self.assertLessEqual(buffer.wait_time(), 0.2)
+
+    @override_settings(SSE_COMPACT=True)
+    def test_compact_content_frame(self):
+        self.assertEqual(
+            sse_content("one\ntwo", "5-1"), "id: 5-1\nevent: t\ndata: one\ndata: two\n\n"
+        )
+
+    @override_settings(SSE_COMPACT=False)
+    def test_json_content_frame(self):
+        frame = sse_content("one\ntwo", "5-1")
+        self.assertTrue(frame.startswith("id: 5-1\ndata: "))
+        self.assertEqual(
+            json.loads(frame.split("data: ", 1)[1]), {"type": "content", "content": "one\ntwo"}
+        )
+
+    @override_settings(SSE_COMPACT=True)
+    def test_frames_merge_content_up_to_final_event(self):
+        events = [
+            ("5-1", {"type": "content", "content": "a"}),
+            ("5-2", {"type": "content", "content": "b"}),
+            ("5-3", {"type": "done"}),
+            ("5-4", {"type": "content", "content": "late"}),
+        ]
+        frames, final = sse_frames(events)
+        self.assertTrue(final)
+        self.assertEqual(
+            frames,
+            "id: 5-2\nevent: t\ndata: ab\n\n" + 'id: 5-3\ndata: {"type": "done"}\n\n',
+        )
+
+    @override_settings(SSE_COMPACT=True)
+    def test_frames_without_final_event(self):
+        frames, final = sse_frames([("5-1", {"type": "content", "content": "a"})])
+        self.assertFalse(final)
+        self.assertEqual(frames, "id: 5-1\nevent: t\ndata: a\n\n")
+
+
+# Stream slots taken by the limiter's ACQUIRE script are freed by SETTLE
+# whichever way a generation ends (Redis is an in-process fakeredis)
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_CONCURRENT_STREAMS=1)
+class GenerationLeaseTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        for module in ("cache", "jobs", "limits", "metrics"):
+            patcher = mock.patch(
+                f"chat.{module}.get_redis_connection", return_value=self.redis
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.service = ChatService()
+        self.limiter = self.service.limiter
+        self.user = CustomUser.objects.create_user("lease", password="lease")
+        self.messages = [{"role": "user", "content": "hello"}]
+
+    def active_leases(self):
+        return self.redis.zcard(self.limiter.keys(self.user.id)[1])
+
+    def test_lease_blocks_a_second_stream(self):
+        self.limiter.acquire(self.user.id)
+        with self.assertRaises(RateLimited) as raised:
+            self.limiter.acquire(self.user.id)
+        self.assertEqual(raised.exception.reason, "streams")
+
+    def test_lease_released_when_the_chat_is_gone(self):
+        chat = Chat.objects.create(user=self.user, title="Deleted")
+        lease = self.limiter.acquire(self.user.id)
+        chat.delete()
+
+        self.service.run_generation(chat.id, "1", self.messages, lease, self.user.id)
+
+        self.assertEqual(self.active_leases(), 0)
+        self.limiter.acquire(self.user.id)
+
+    def test_lease_released_after_failed_generation(self):
+        chat = Chat.objects.create(user=self.user, title="Failing")
+        lease = self.limiter.acquire(self.user.id)
+
+        def broken_stream(messages):
+            raise RuntimeError("backend down")
+            yield
+
+        with mock.patch.object(self.service.ai_manager, "stream_chat", broken_stream):
+            self.service.run_generation(chat.id, "1", self.messages, lease, self.user.id)
+
+        self.assertEqual(self.active_leases(), 0)
+        self.assertFalse(Message.objects.filter(chat=chat, role="assistant").exists())
+        (usage,) = self.limiter.usage(self.user.id).values()
+        self.assertEqual(usage, {"prompt": 0, "completion": 0, "requests": 1})
+
+    def test_lease_released_for_a_job_that_never_ran(self):
+        lease = self.limiter.acquire(self.user.id)
+        self.service.fail_generation(0, "1", "Timed out", lease, self.user.id)
+        self.assertEqual(self.active_leases(), 0)
+
+
+# Range header parsing and the 416 answer of attachment downloads
+class ByteRangeTests(SimpleTestCase):
+    def test_suffix_range(self):
+        self.assertEqual(byte_range("bytes=-4", 10), (6, 9))
+        self.assertEqual(byte_range("bytes=-40", 10), (0, 9))
+
+    def test_empty_suffix_is_unsatisfiable(self):
+        with self.assertRaises(ValueError):
+            byte_range("bytes=-0", 10)
+        with self.assertRaises(ValueError):
+            byte_range("bytes=-4", 0)
+
+    def test_open_and_clamped_ranges(self):
+        self.assertEqual(byte_range("bytes=4-", 10), (4, 9))
+        self.assertEqual(byte_range("bytes=2-99", 10), (2, 9))
+
+    def test_start_past_end_is_unsatisfiable(self):
+        with self.assertRaises(ValueError):
+            byte_range("bytes=10-", 10)
+        with self.assertRaises(ValueError):
+            byte_range("bytes=5-2", 10)
+
+    def test_absent_or_multiple_ranges_send_the_whole_file(self):
+        self.assertIsNone(byte_range(None, 10))
+        self.assertIsNone(byte_range("bytes=-", 10))
+        self.assertIsNone(byte_range("bytes=0-1,4-5", 10))
+
+
+class AttachmentRangeTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user("ranges", password="ranges")
+        chat = Chat.objects.create(user=user, title="Ranges")
+        attachment = Attachment.objects.create(
+            chat=chat,
+            file_name="notes.txt",
+            storage_key="objects/ab/abc.txt",
+            sha256="abc",
+            size=10,
+            content_type="text/plain",
+        )
+        self.url = reverse("download_attachment", args=[chat.id, attachment.id])
+        self.client.force_login(user)
+
+    def test_out_of_range_request_answers_416(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=10-"})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
@@ -0,0 +1,50 @@
+# Standard library
+from functools import lru_cache
+
+# Django / third-party
+from django.conf import settings
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# Fallback estimate when no local tokenizer is available.
+# Llama-family tokenizers average roughly 4 characters per token on English text.
+CHARS_PER_TOKEN = 4
+
+# Per-message overhead for role/formatting tokens in the chat template
+MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(settings.TOKENIZER_ENCODING)
+    except Exception:
+        # Encoding files could not be loaded (e.g. offline without a cache)
+        return None
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def count_message_tokens(content):
+    return count_tokens(content) + MESSAGE_OVERHEAD
+
+
+def truncate_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[: max_tokens * CHARS_PER_TOKEN]
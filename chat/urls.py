@@ -6,17 +6,61 @@ from django.views.generic import RedirectView
 from .views import (
     ChatView,
     ChatStreamView,
+    AsyncChatStreamView,
+    cancel_generation,
+    chat_attachments,
     create_chat,
+    chat_list,
+    chat_messages,
     delete_chat,
+    download_attachment,
+    export_chats,
+    search_chats,
     update_chat_title,
+    update_response_cache,
 )
 
 urlpatterns = [
     path("", RedirectView.as_view(url="new/", permanent=True)),
     path("new/", ChatView.as_view(), name="new_chat"),
     path("create/", create_chat, name="create_chat"),
+    path("list/", chat_list, name="chat_list"),
+    path("search/", search_chats, name="search_chats"),
+    path("export/", export_chats, name="export_chats"),
     path("<int:chat_id>/", ChatView.as_view(), name="chat_detail"),
+    path("<int:chat_id>/messages/", chat_messages, name="chat_messages"),
     path("<int:chat_id>/stream/", ChatStreamView.as_view(), name="chat_stream"),
+    path(
+        "<int:chat_id>/stream/<int:turn>/",
+        ChatStreamView.as_view(),
+        name="chat_stream_resume",
+    ),
+    path(
+        "<int:chat_id>/stream/<int:turn>/cancel/",
+        cancel_generation,
+        name="cancel_generation",
+    ),
+    path(
+        "<int:chat_id>/astream/",
+        AsyncChatStreamView.as_view(),
+        name="chat_stream_async",
+    ),
+    path(
+        "<int:chat_id>/astream/<int:turn>/",
+        AsyncChatStreamView.as_view(),
+        name="chat_stream_async_resume",
+    ),
+    path("<int:chat_id>/attachments/", chat_attachments, name="chat_attachments"),
+    path(
+        "<int:chat_id>/attachments/<int:attachment_id>/",
+        download_attachment,
+        name="download_attachment",
+    ),
     path("<int:chat_id>/delete/", delete_chat, name="delete_chat"),
     path("<int:chat_id>/update-title/", update_chat_title, name="update_chat_title"),
+    path(
+        "<int:chat_id>/response-cache/",
+        update_response_cache,
+        name="update_response_cache",
+    ),
 ]
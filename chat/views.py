@@ -1,27 +1,158 @@
 # Standard library
+import hmac
+import re
 import time
 import json
 
 # Django / third-party
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import StreamingHttpResponse, JsonResponse
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.http import (
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+    JsonResponse,
+)
 from django.contrib.auth.decorators import login_required
 from django.views import View
+from django.views.decorators.http import condition
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header
 from django.utils.decorators import method_decorator
-from groq import Groq  # Groq client
 from django.conf import settings
-from django.core.cache import cache
+from asgiref.sync import sync_to_async
 
 
 # Local app imports
-from .models import Chat, Message
+from .exports import ChatExporter, gzip_stream
+from .limits import RateLimited, RateLimiter
+from .metrics import metrics
+from .models import Attachment, Chat, Message
 from .services import ChatService
 
-# Initialize the Chat service.
+# Initialize the Chat service (owns the pooled LLM client).
 chat_service = ChatService()
 
-# Initialize the Groq client.
-groq_client = Groq()
+
+# Events that end a generation stream
+FINAL_EVENTS = {"done", "error", "cancelled"}
+STREAM_ID_RE = re.compile(r"^\d+-\d+$")
+
+
+# Server-sent event frame (id: is the Redis stream entry id, for resuming)
+def sse_event(payload, event_id=None):
+    frame = f"data: {json.dumps(payload)}\n\n"
+    return f"id: {event_id}\n{frame}" if event_id else frame
+
+
+# Content frame; with SSE_COMPACT the text goes raw as an "event: t" frame
+# (one data: line per text line) instead of a JSON object
+def sse_content(text, event_id=None):
+    if not settings.SSE_COMPACT:
+        return sse_event({"type": "content", "content": text}, event_id)
+    lines = "".join(f"data: {line}\n" for line in text.split("\n"))
+    frame = f"event: t\n{lines}\n"
+    return f"id: {event_id}\n{frame}" if event_id else frame
+
+
+# All events of one read as a single write: consecutive content events are
+# merged into one frame carrying the last entry id. Returns (frames, final).
+def sse_frames(events):
+    frames = []
+    content, content_id = [], None
+    for event_id, payload in events:
+        if payload["type"] == "content":
+            content.append(payload["content"])
+            content_id = event_id
+            continue
+        if content:
+            frames.append(sse_content("".join(content), content_id))
+            content = []
+        frames.append(sse_event(payload, event_id))
+        if payload["type"] in FINAL_EVENTS:
+            return "".join(frames), True
+    if content:
+        frames.append(sse_content("".join(content), content_id))
+    return "".join(frames), False
+
+
+# Resume point sent by a reconnecting client (header, or query for fetch())
+def last_event_id(request):
+    value = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    return value if value and STREAM_ID_RE.match(value) else "0-0"
+
+
+# 429 for a request over a per-user limit (see chat/limits.py)
+def rate_limited_response(error):
+    response = JsonResponse(
+        {
+            "error": RateLimiter.MESSAGES[error.reason],
+            "reason": error.reason,
+            "retry_after": error.retry_after,
+        },
+        status=429,
+    )
+    response["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def sse_response(stream):
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# ETag for a message poll: (chat, since, last message id) from the cached
+# marker, plus the length of a reply still streaming, so an idle poll is
+# answered with a 304 without touching the DB
+def message_poll_etag(request, chat_id):
+    since = request.GET.get("since", "0")
+    marker = chat_service.get_message_marker(chat_id)
+    if not since.isdigit() or marker is None or marker[0] != request.user.id:
+        return None
+    etag = f"{chat_id}.{since}.{marker[1]}"
+    progress = chat_service.generations.progress(chat_id)
+    return f"{etag}.{progress[0]}.{progress[1]}" if progress else etag
+
+
+# Function Poll Messages (only messages newer than ?since=<message id>, at
+# most MESSAGE_POLL_LIMIT per response: poll again from last_id while
+# has_more is set)
+@login_required
+@condition(etag_func=message_poll_etag)
+def chat_messages(request, chat_id):
+    if request.method == "GET":
+        since = request.GET.get("since", "0")
+        if not since.isdigit():
+            return JsonResponse({"error": "Invalid since"}, status=400)
+
+        marker = chat_service.get_message_marker(chat_id)
+        if marker is None or marker[0] != request.user.id:
+            return JsonResponse({"error": "Chat not found"}, status=404)
+
+        messages = chat_service.get_messages_since(chat_id, int(since))
+        if not messages:
+            # An archived chat has no rows until restored, as on open
+            chat = Chat.objects.filter(id=chat_id, archived_at__isnull=False).first()
+            if chat is not None and chat_service.restore_chat(chat):
+                messages = chat_service.get_messages_since(chat_id, int(since))
+        # Pass back as ?since= on the next poll; a reply still streaming is
+        # sent again on every poll until it is final
+        last_id = messages[-1]["id"] if messages else int(since)
+        streaming = [m["id"] for m in messages if m["status"] == Message.STREAMING]
+        if streaming:
+            last_id = streaming[0] - 1
+        response = JsonResponse(
+            {
+                "messages": messages,
+                "last_id": last_id,
+                "has_more": len(messages) >= settings.MESSAGE_POLL_LIMIT,
+            }
+        )
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return JsonResponse({"error": "Method not allowed"}, status=405)
 
 
 # Chat Views
@@ -31,18 +162,15 @@ class ChatView(View):
 
     def get(self, request, chat_id=None):
         # Handle AJAX requests for message updates
+        # (same delta/ETag handling and paging as chat_messages; no ?since=
+        # starts from the first message)
         if request.headers.get("X-Requested-With") == "XMLHttpRequest" and chat_id:
-            try:
-                chat = Chat.objects.get(id=chat_id, user=request.user)
-                messages = list(
-                    chat.messages.all().order_by("created_at").values("role", "content")
-                )
-                return JsonResponse({"messages": messages})
-            except Chat.DoesNotExist:
-                return JsonResponse({"error": "Chat not found"}, status=404)
+            return chat_messages(request, chat_id=chat_id)
 
-        chats = Chat.objects.filter(user=request.user).order_by("-updated_at")
+        # First sidebar page (keyset paginated, see chat_list)
+        chats, next_cursor = chat_service.list_chats(request.user.id)
         is_new_chat = request.path == "/chat/new/"
+        stream_endpoint = "astream" if settings.ASYNC_STREAM else "stream"
 
         # Handle new chat
         if is_new_chat:
@@ -54,7 +182,9 @@ class ChatView(View):
                     "current_chat": {"id": temp_id, "title": "New Chat"},
                     "conversation": [],
                     "chats": chats,
+                    "next_cursor": next_cursor,
                     "is_new_chat": True,
+                    "stream_endpoint": stream_endpoint,
                 },
             )
 
@@ -62,23 +192,11 @@ class ChatView(View):
         if chat_id:
             try:
                 chat = Chat.objects.get(id=chat_id, user=request.user)
+                # Archived chats are restored from object storage on open
+                chat_service.restore_chat(chat)
 
-                # Caching chat conversation
-                cache_key = f"chat_conversation:{chat_id}"
-                conversation = cache.get(cache_key)
-
-                if conversation:
-                    # print hit cache
-                    print(f"Cache HIT: {cache_key}")
-                else:
-                    # print miss cache
-                    print(f"Cache MISS: {cache_key}")
-                    messages = chat.messages.all().order_by("created_at")
-                    conversation = [
-                        {"role": msg.role, "text": msg.content} for msg in messages
-                    ]
-                    # simpan ke cache (misal 5 menit)
-                    cache.set(cache_key, conversation, timeout=300)
+                # Write-through conversation cache (see ChatService)
+                conversation = chat_service.get_conversation(chat)
 
                 return render(
                     request,
@@ -87,7 +205,11 @@ class ChatView(View):
                         "current_chat": chat,
                         "conversation": conversation,
                         "chats": chats,
+                        "next_cursor": next_cursor,
                         "is_new_chat": False,
+                        "stream_endpoint": stream_endpoint,
+                        # Lets a reloaded page re-attach to an in-flight answer
+                        "active_turn": chat_service.generations.active(chat.id),
                     },
                 )
             except Chat.DoesNotExist:
@@ -98,30 +220,46 @@ class ChatView(View):
 
 
 # Chat Stream View / Chat Detail
+# POST starts a generation; GET attaches to one (the active turn by default)
+# and replays it from Last-Event-ID before tailing live output
 @method_decorator(login_required, name="dispatch")
 class ChatStreamView(View):
     def post(self, request, chat_id):
+        chat = get_object_or_404(Chat, id=chat_id, user=request.user)
+        # Per-user limits are checked before anything is saved or sent
         try:
-            chat = get_object_or_404(Chat, id=chat_id, user=request.user)
+            lease = chat_service.limiter.acquire(request.user.id)
+        except RateLimited as e:
+            return rate_limited_response(e)
+
+        try:
+            chat_service.restore_chat(chat)
             prompt_text = request.POST.get("prompt", "").strip()
             uploaded_file = request.FILES.get("file")
 
             # Process file if present
-            file_content = chat_service.process_file(uploaded_file)
+            _, file_content = chat_service.process_file(uploaded_file)
 
             # Create user message - only show file name if file was uploaded
             user_message = prompt_text
             if uploaded_file:
-                chat_service.save_file(chat.id, uploaded_file)
                 file_indicator = f"\n[Uploaded file: {uploaded_file.name}]"
                 user_message += file_indicator
 
-            chat_service.create_message(chat, "user", user_message)
+            message = chat_service.create_message(chat, "user", user_message)
+            if uploaded_file:
+                attachment = chat_service.queue_file_save(chat.id, uploaded_file, message)
 
-            # For the LLM, combine prompt with actual file content
+            # Documents are indexed in the background and reach the LLM as
+            # retrieved excerpts; until their chunks are retrievable (and
+            # without retrieval) the upload's excerpt is inlined
             full_prompt = prompt_text
             if file_content:
-                full_prompt += f"\n\nFile content:\n{file_content}"
+                inline = True
+                if chat_service.documents.enabled:
+                    inline = chat_service.schedule_document_index(chat, attachment)
+                if inline:
+                    full_prompt += f"\n\nFile content:\n{file_content}"
 
             # Update chat title if needed
             if chat.title == "New Chat" and prompt_text:
@@ -129,50 +267,154 @@ class ChatStreamView(View):
 
             # Get system prompt and prepare messages for LLM
             system_prompt = request.session.get("system_prompt", settings.SYSTEM_PROMPT)
-            messages = [{"role": "system", "content": system_prompt}]
-            chat_history = chat_service.get_chat_history(chat)
-            messages.extend(
-                [
-                    {"role": msg.role, "content": msg.content}
-                    for msg in chat_history[:-1]
-                ]
-            )  # Exclude the last message
-
-            # Add the last message with full content for LLM
-            messages.append({"role": "user", "content": full_prompt})
+            messages = chat_service.build_context(
+                chat, system_prompt, full_prompt, query=prompt_text
+            )
 
-            # Stream response
-            return self.stream_response(chat, messages)
+            # Generate in the background (keyed by the user message) and stream it
+            chat_service.start_generation(chat, message.id, messages, lease)
+            return self.stream_response(chat, message.id)
 
         except Exception as e:
+            chat_service.limiter.release(request.user.id, lease)
             return JsonResponse({"error": str(e)}, status=500)
 
-    def stream_response(self, chat, messages):
+    def get(self, request, chat_id, turn=None):
+        chat = get_object_or_404(Chat, id=chat_id, user=request.user)
+        turn = turn or chat_service.generations.active(chat.id)
+        if not turn:
+            return JsonResponse({"error": "No active generation"}, status=404)
+        return self.stream_response(chat, turn, last_event_id(request))
+
+    def stream_response(self, chat, turn, last_id="0-0"):
         def event_stream():
+            cursor = last_id
             try:
-                accumulated_response = ""
-                stream = chat_service.ai_manager.get_chat_completion(messages)
+                while True:
+                    events = chat_service.generations.read(chat.id, turn, cursor)
+                    if events is None:
+                        yield sse_event({"type": "error", "content": "Generation not found"})
+                        return
+                    if not events:
+                        # Comment frame keeps proxies from timing out idle streams
+                        yield ": keep-alive\n\n"
+                        continue
+                    cursor = events[-1][0]
+                    frames, final = sse_frames(events)
+                    yield frames
+                    if final:
+                        return
+
+            except Exception as e:
+                yield sse_event({"type": "error", "content": str(e)})
 
-                for chunk in stream:
-                    content = chunk.choices[0].delta.content
+        return sse_response(event_stream())
 
-                    if content:
-                        accumulated_response += content
-                        yield f"data: {json.dumps({'type': 'content', 'content': content})}\n\n"
 
-                if accumulated_response:
-                    chat_service.create_message(chat, "assistant", accumulated_response)
-                    yield f"data: {json.dumps({'type': 'done'})}\n\n"
+# Async Chat Stream View (served through webai/asgi.py)
+@method_decorator(login_required, name="post")
+@method_decorator(login_required, name="get")
+class AsyncChatStreamView(View):
+    async def post(self, request, chat_id):
+        user = await request.auser()
+        chat = await aget_object_or_404(Chat, id=chat_id, user=user)
+        try:
+            lease = await chat_service.limiter.aacquire(user.id)
+        except RateLimited as e:
+            return rate_limited_response(e)
+
+        try:
+            await chat_service.arestore_chat(chat)
+            prompt_text = request.POST.get("prompt", "").strip()
+            uploaded_file = request.FILES.get("file")
+
+            # Process file if present
+            _, file_content = await chat_service.aprocess_file(uploaded_file)
+
+            # Create user message - only show file name if file was uploaded
+            user_message = prompt_text
+            if uploaded_file:
+                user_message += f"\n[Uploaded file: {uploaded_file.name}]"
+
+            message = await chat_service.acreate_message(chat, "user", user_message)
+            if uploaded_file:
+                attachment = await chat_service.aqueue_file_save(
+                    chat.id, uploaded_file, message
+                )
+
+            # Documents are indexed in the background and reach the LLM as
+            # retrieved excerpts; until their chunks are retrievable (and
+            # without retrieval) the upload's excerpt is inlined
+            full_prompt = prompt_text
+            if file_content:
+                inline = True
+                if chat_service.documents.enabled:
+                    inline = await chat_service.aschedule_document_index(
+                        chat, attachment
+                    )
+                if inline:
+                    full_prompt += f"\n\nFile content:\n{file_content}"
+
+            # Update chat title if needed
+            if chat.title == "New Chat" and prompt_text:
+                await chat_service.aupdate_chat_title(chat, prompt_text)
+
+            # Get system prompt and prepare messages for LLM
+            system_prompt = await request.session.aget(
+                "system_prompt", settings.SYSTEM_PROMPT
+            )
+            messages = await chat_service.abuild_context(
+                chat, system_prompt, full_prompt, query=prompt_text
+            )
+
+            # Generate as a loop task (keyed by the user message) and stream it
+            await chat_service.astart_generation(chat, message.id, messages, lease)
+            return self.stream_response(chat, message.id)
+
+        except Exception as e:
+            await sync_to_async(chat_service.limiter.release)(user.id, lease)
+            return JsonResponse({"error": str(e)}, status=500)
+
+    async def get(self, request, chat_id, turn=None):
+        user = await request.auser()
+        chat = await aget_object_or_404(Chat, id=chat_id, user=user)
+        turn = turn or await sync_to_async(chat_service.generations.active)(chat.id)
+        if not turn:
+            return JsonResponse({"error": "No active generation"}, status=404)
+        return self.stream_response(chat, turn, last_event_id(request))
+
+    def stream_response(self, chat, turn, last_id="0-0"):
+        async def event_stream():
+            cursor = last_id
+            try:
+                while True:
+                    events = await chat_service.generations.aread(chat.id, turn, cursor)
+                    if events is None:
+                        yield sse_event({"type": "error", "content": "Generation not found"})
+                        return
+                    if not events:
+                        yield ": keep-alive\n\n"
+                        continue
+                    cursor = events[-1][0]
+                    frames, final = sse_frames(events)
+                    yield frames
+                    if final:
+                        return
 
             except Exception as e:
-                yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+                yield sse_event({"type": "error", "content": str(e)})
 
-        response = StreamingHttpResponse(
-            event_stream(), content_type="text/event-stream"
-        )
-        response["Cache-Control"] = "no-cache"
-        response["X-Accel-Buffering"] = "no"
-        return response
+        return sse_response(event_stream())
+
+
+# Function Cancel Generation (stop button; the generation runs detached)
+@login_required
+def cancel_generation(request, chat_id, turn):
+    if request.method == "POST":
+        chat = get_object_or_404(Chat, id=chat_id, user=request.user)
+        chat_service.generations.cancel(chat.id, turn)
+        return JsonResponse({"success": True})
+    return JsonResponse({"error": "Method not allowed"}, status=405)
 
 
 # Function Create Chat
@@ -194,13 +436,16 @@ def create_chat(request):
                 title=message[:30] + "..." if len(message) > 30 else message,
             )
 
+            chat_service.search.set_title(chat)
+
             # Create initial message
-            Message.objects.create(chat=chat, content=message.strip(), role="user")
+            chat_service.create_message(chat, "user", message.strip())
 
             return JsonResponse(
                 {
                     "success": True,
                     "chat_id": chat.id,
+                    "title": chat.title,
                     "redirect_url": f"/chat/{chat.id}/",
                 }
             )
@@ -213,13 +458,74 @@ def create_chat(request):
     )
 
 
+# Function List Chats (sidebar infinite scroll)
+@login_required
+def chat_list(request):
+    if request.method == "GET":
+        try:
+            limit = int(request.GET.get("limit") or 0) or None
+            chats, next_cursor = chat_service.list_chats(
+                request.user.id, request.GET.get("cursor") or None, limit
+            )
+        except (ValueError, OverflowError):
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+        return JsonResponse(
+            {
+                "chats": [{"id": chat["id"], "title": chat["title"]} for chat in chats],
+                "next_cursor": next_cursor,
+            }
+        )
+    return JsonResponse({"error": "Method not allowed"}, status=405)
+
+
+# Function Search Chats (titles and messages; ranked, highlighted, paged)
+@login_required
+def search_chats(request):
+    if request.method == "GET":
+        query = request.GET.get("q", "").strip()
+        if not query:
+            return JsonResponse({"error": "Query is required"}, status=400)
+        try:
+            page = max(1, int(request.GET.get("page") or 1))
+        except ValueError:
+            return JsonResponse({"error": "Invalid page"}, status=400)
+        results, total = chat_service.search.search(request.user.id, query, page)
+        return JsonResponse(
+            {
+                "query": query,
+                "results": results,
+                "total": total,
+                "page": page,
+                "has_next": page * chat_service.search.page_size < total,
+            }
+        )
+    return JsonResponse({"error": "Method not allowed"}, status=405)
+
+
+# Function Export Chats (the user's whole history as gzipped NDJSON)
+@login_required
+def export_chats(request):
+    if request.method == "GET":
+        exporter = ChatExporter(chat_service.archive)
+        response = StreamingHttpResponse(
+            gzip_stream(exporter.lines(request.user.id)),
+            content_type="application/gzip",
+        )
+        response["Content-Disposition"] = content_disposition_header(
+            True, f"chats-{request.user.username}.ndjson.gz"
+        )
+        patch_cache_control(response, private=True, no_store=True)
+        return response
+    return JsonResponse({"error": "Method not allowed"}, status=405)
+
+
 # Function Delete Chat
 @login_required
 def delete_chat(request, chat_id):
     if request.method == "POST":
         try:
             chat = get_object_or_404(Chat, id=chat_id, user=request.user)
-            chat.delete()
+            chat_service.delete_chat(chat)
             return JsonResponse({"status": "success"})
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
@@ -234,8 +540,169 @@ def update_chat_title(request, chat_id):
         data = json.loads(request.body)
         new_title = data.get("title", "").strip()
         if new_title:
-            chat.title = new_title
-            chat.save()
+            chat_service.rename_chat(chat, new_title)
             return JsonResponse({"success": True})
         return JsonResponse({"error": "Title is required"}, status=400)
     return JsonResponse({"error": "Method not allowed"}, status=405)
+
+
+# Function Update Response Cache Opt-out
+@login_required
+def update_response_cache(request, chat_id):
+    if request.method == "POST":
+        chat = get_object_or_404(Chat, id=chat_id, user=request.user)
+        data = json.loads(request.body)
+        chat.response_cache_enabled = bool(data.get("enabled", True))
+        chat.save(update_fields=["response_cache_enabled"])
+        return JsonResponse(
+            {"success": True, "enabled": chat.response_cache_enabled}
+        )
+    return JsonResponse({"error": "Method not allowed"}, status=405)
+
+
+# Single byte range of a Range header as inclusive (start, end); None when
+# absent or not a single range (the whole file is sent), ValueError when
+# it cannot be satisfied
+BYTE_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def byte_range(header, size):
+    match = BYTE_RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        if int(last) == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, size - int(last)), size - 1
+    start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+# Function List Attachments
+@login_required
+def chat_attachments(request, chat_id):
+    if request.method == "GET":
+        chat = get_object_or_404(Chat, id=chat_id, user=request.user)
+        return JsonResponse(
+            {
+                "attachments": [
+                    {
+                        "id": attachment.id,
+                        "file_name": attachment.file_name,
+                        "size": attachment.size,
+                        "content_type": attachment.content_type,
+                        "sha256": attachment.sha256,
+                        "message_id": attachment.message_id,
+                        "status": chat_service.attachment_status(attachment),
+                        "created_at": attachment.created_at.isoformat(),
+                        "url": reverse(
+                            "download_attachment", args=[chat.id, attachment.id]
+                        ),
+                    }
+                    for attachment in chat_service.list_attachments(chat)
+                ]
+            }
+        )
+    return JsonResponse({"error": "Method not allowed"}, status=405)
+
+
+# Function Download Attachment: a presigned object storage URL with
+# ATTACHMENT_REDIRECT, otherwise streamed in chunks with Range support
+@login_required
+def download_attachment(request, chat_id, attachment_id):
+    if request.method not in ("GET", "HEAD"):
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    attachment = get_object_or_404(
+        Attachment.objects.select_related("upload"),
+        id=attachment_id,
+        chat_id=chat_id,
+        chat__user=request.user,
+    )
+    status = chat_service.attachment_status(attachment)
+    if status == "failed":
+        return JsonResponse({"error": "File could not be stored"}, status=404)
+    if settings.ATTACHMENT_REDIRECT and status == "stored":
+        response = HttpResponseRedirect(chat_service.attachment_url(attachment))
+        response["Cache-Control"] = "private, no-store"
+        return response
+
+    # Objects are content-addressed, so the hash is a strong validator
+    etag = f'"{attachment.sha256}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response["ETag"] = etag
+        return response
+
+    size = attachment.size
+    if_range = request.headers.get("If-Range")
+    try:
+        requested = (
+            byte_range(request.headers.get("Range"), size)
+            if if_range is None or if_range == etag
+            else None
+        )
+    except ValueError:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    start, end = requested or (0, size - 1)
+
+    if request.method == "HEAD" or size == 0:
+        body = []
+    else:
+        try:
+            body = chat_service.open_attachment(attachment, start, end)
+        except Exception as e:
+            if status == "pending":
+                response = JsonResponse({"error": "Upload still in progress"}, status=409)
+                response["Retry-After"] = "5"
+                return response
+            return JsonResponse({"error": str(e)}, status=404)
+
+    response = StreamingHttpResponse(
+        body, status=206 if requested else 200, content_type=attachment.content_type
+    )
+    response["Content-Length"] = str(end - start + 1)
+    if requested:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Content-Disposition"] = content_disposition_header(
+        True, attachment.file_name
+    )
+    response["Cache-Control"] = "private, max-age=3600"
+    return response
+
+
+# Function Metrics (Prometheus scrape endpoint; bearer METRICS_TOKEN, or
+# open only with METRICS_PUBLIC)
+def metrics_view(request):
+    if request.method == "GET":
+        if not settings.METRICS_TOKEN and not settings.METRICS_PUBLIC:
+            return JsonResponse({"error": "Metrics are not enabled"}, status=404)
+        if settings.METRICS_TOKEN and not hmac.compare_digest(
+            request.headers.get("Authorization", "").encode(),
+            f"Bearer {settings.METRICS_TOKEN}".encode(),
+        ):
+            return JsonResponse({"error": "Unauthorized"}, status=401)
+        # The queue gauges are left out while Redis is unavailable
+        gauges = {}
+        queue = chat_service.generation_queue.stats()
+        if queue is not None:
+            gauges = {
+                "webai_generation_queue_jobs": (
+                    "Generation jobs waiting for a worker",
+                    {"": queue["queued"]},
+                ),
+                "webai_generation_queue_users": (
+                    "Users with generation jobs waiting",
+                    {"": queue["waiting_users"]},
+                ),
+            }
+        body = metrics.render(gauges)
+        return HttpResponse(body, content_type="text/plain; version=0.0.4")
+    return JsonResponse({"error": "Method not allowed"}, status=405)
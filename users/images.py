@@ -0,0 +1,163 @@
+# Profile image thumbnails and the local cache used to serve them.
+# Thumbnails are rendered once at upload time and stored next to the
+# original under names derived from it, so every stored object is immutable.
+
+# Standard library
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import tempfile
+from pathlib import Path
+
+# Django / third-party
+from django.conf import settings
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+# Local app imports
+from .models import profile_images
+
+logger = logging.getLogger(__name__)
+
+# format setting -> (Pillow format, file extension, content type)
+THUMBNAIL_FORMATS = {
+    "webp": ("WEBP", "webp", "image/webp"),
+    "avif": ("AVIF", "avif", "image/avif"),
+}
+# Older mimetypes tables lack these; object storage uses them for ContentType
+for _, ext, mime in THUMBNAIL_FORMATS.values():
+    mimetypes.add_type(mime, f".{ext}")
+
+
+# Function Thumbnail Name
+def thumbnail_name(name, size):
+    _, ext, _ = THUMBNAIL_FORMATS[settings.PROFILE_IMAGE_FORMAT]
+    return f"thumbs/{Path(name).stem}-{size}.{ext}"
+
+
+# Function Content Type
+def content_type(name):
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+# Function Make Thumbnails
+def make_thumbnails(name, upload):
+    # Square center crops in each PROFILE_IMAGE_SIZES size; returns {size: name}
+    pil_format, _, _ = THUMBNAIL_FORMATS[settings.PROFILE_IMAGE_FORMAT]
+    upload.seek(0)
+    with Image.open(upload) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        thumbnails = {}
+        for size in sorted(settings.PROFILE_IMAGE_SIZES):
+            thumb = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            thumb.save(buffer, pil_format, quality=settings.PROFILE_IMAGE_QUALITY)
+            buffer.seek(0)
+            thumbnails[str(size)] = profile_images.save(thumbnail_name(name, size), buffer)
+    upload.seek(0)
+    return thumbnails
+
+
+# Function Save Profile Image Thumbnails
+def save_profile_image_thumbnails(user, upload):
+    # Called after the user (and so the original image) was saved
+    try:
+        thumbnails = make_thumbnails(user.profile_image.name, upload)
+    except (OSError, ValueError) as e:
+        # The original is still served, just without resizing
+        logger.warning("Thumbnails for %s failed: %s", user.profile_image.name, e)
+        thumbnails = {}
+    user.profile_image_updated_at = timezone.now()
+    user.profile_image_thumbnails = thumbnails
+    user.save(update_fields=["profile_image_updated_at", "profile_image_thumbnails"])
+
+
+# Function Pick Image Variant
+def profile_image_variant(user, size):
+    # Smallest thumbnail at least `size` pixels wide (largest if none is),
+    # falling back to the original for images uploaded before thumbnails
+    thumbnails = sorted(
+        (int(width), name) for width, name in user.profile_image_thumbnails.items()
+    )
+    if not thumbnails:
+        return user.profile_image.name
+    for width, name in thumbnails:
+        if width >= size:
+            return name
+    return thumbnails[-1][1]
+
+
+# Local disk copies of profile images (hot avatars skip object storage)
+class ProfileImageCache:
+    # Disk tier is pruned every N writes
+    PRUNE_EVERY = 100
+
+    def __init__(self):
+        self.disk_dir = (
+            Path(settings.PROFILE_IMAGE_CACHE_DIR)
+            if settings.PROFILE_IMAGE_CACHE_DIR
+            else None
+        )
+        self.disk_max_bytes = settings.PROFILE_IMAGE_CACHE_MAX_BYTES
+        self.disk_writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, name):
+        digest = hashlib.sha256(name.encode()).hexdigest()
+        return self.disk_dir / digest[:2] / f"{digest}{Path(name).suffix}"
+
+    def open(self, name):
+        # Binary file object for `name`, from disk when cached; stored
+        # objects never change, so a cached copy is never stale
+        if not self.disk_dir:
+            return profile_images.open(name, "rb")
+
+        path = self.path(name)
+        try:
+            handle = path.open("rb")
+            os.utime(path)
+            self.hits += 1
+            return handle
+        except OSError:
+            self.misses += 1
+
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = tempfile.NamedTemporaryFile(dir=path.parent, delete=False)
+        except OSError as e:
+            logger.warning("Profile image cache write failed: %s", e)
+            return profile_images.open(name, "rb")
+        try:
+            with tmp, profile_images.open(name, "rb") as source:
+                for chunk in source.chunks():
+                    tmp.write(chunk)
+            os.replace(tmp.name, path)
+        except BaseException:
+            Path(tmp.name).unlink(missing_ok=True)
+            raise
+
+        self.disk_writes += 1
+        if self.disk_writes % self.PRUNE_EVERY == 0:
+            self.prune()
+        return path.open("rb")
+
+    def prune(self):
+        entries = []
+        total = 0
+        for path in self.disk_dir.glob("*/*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.disk_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
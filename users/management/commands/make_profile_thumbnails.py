@@ -0,0 +1,32 @@
+# Django / third-party
+from django.core.management.base import BaseCommand
+
+# Local app imports
+from users.images import save_profile_image_thumbnails
+from users.models import CustomUser, profile_images
+
+
+# Render thumbnails for images uploaded before they were generated at upload
+class Command(BaseCommand):
+    help = "Generate missing profile image thumbnails."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = (
+            CustomUser.objects.exclude(profile_image="")
+            .exclude(profile_image__isnull=True)
+            .filter(profile_image_updated_at__isnull=True)
+            .order_by("id")[: options["limit"]]
+        )
+        done = 0
+        for user in users:
+            try:
+                with profile_images.open(user.profile_image.name, "rb") as original:
+                    save_profile_image_thumbnails(user, original)
+            except Exception as e:
+                self.stderr.write(f"{user.username}: {e}")
+                continue
+            done += 1
+        self.stdout.write(f"Generated thumbnails for {done} users.")
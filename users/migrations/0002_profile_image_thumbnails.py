@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_image_thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_image_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
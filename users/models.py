@@ -1,5 +1,6 @@
 # Standard library
 import uuid
+from pathlib import Path
 
 # Django / third-party
 from django.db import models
@@ -26,6 +27,14 @@ class CustomUser(AbstractUser):
         null=True,
         storage=profile_images,
     )
+    # Set whenever a new image is uploaded; thumbnails maps size -> object name
+    profile_image_updated_at = models.DateTimeField(blank=True, null=True)
+    profile_image_thumbnails = models.JSONField(default=dict, blank=True)
+
+    @property
+    def profile_image_version(self):
+        # Stored names are random, so the stem changes with every upload
+        return Path(self.profile_image.name).stem if self.profile_image else ""
 
     def __str__(self):
         return self.email
@@ -1,3 +1,6 @@
+# Standard library
+import logging
+
 # Django / third-party
 from django.conf import settings
 from django.contrib import messages
@@ -6,44 +9,85 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LogoutView as DjangoLogoutView
 from django.db import transaction
-from django.http import HttpResponse, Http404
-from django.shortcuts import render, redirect, get_object_or_404
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, Http404
+from django.shortcuts import render, redirect
 from django.urls import reverse_lazy
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date
 from django.views import View
 from django.views.decorators.csrf import csrf_protect
 
-# Third-party storage
-from storages.backends.s3boto3 import S3Boto3Storage
-
-# Local apps
-from .models import CustomUser
-
-# S3 storage instance
-storage = S3Boto3Storage(bucket_name=settings.BUCKET_PROFILE_IMAGES)
-
-
 # Local app imports
+from chat.metrics import metrics
 from .forms import CustomUserCreationForm, CustomUserChangeForm, PasswordChangeForm
+from .images import (
+    ProfileImageCache,
+    content_type,
+    profile_image_variant,
+    save_profile_image_thumbnails,
+)
+from .models import profile_images
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+# Local disk tier for hot avatars (one per process)
+profile_image_cache = ProfileImageCache()
+metrics.track_cache("profile_image", profile_image_cache)
+
+
+# Function Profile Image
 @login_required
 def user_profile_image(request, username):
-    user = get_object_or_404(CustomUser, username=username)
-    
-    if user != request.user:
+    # Only the owner may see their image, so no lookup is needed
+    if username != request.user.username:
         return HttpResponse("Unauthorized", status=403)
 
+    user = request.user
     if not user.profile_image:
         raise Http404("No image found")
-    
+
     try:
-        file_content = storage.open(user.profile_image.name).read()
-        content_type = 'image/jpeg'  # sesuaikan tipe file
-        return HttpResponse(file_content, content_type=content_type)
-    except Exception:
-        raise Http404("Image not found")
+        size = int(request.GET.get("size", max(settings.PROFILE_IMAGE_SIZES)))
+    except ValueError:
+        size = max(settings.PROFILE_IMAGE_SIZES)
+    name = profile_image_variant(user, size)
+
+    if settings.PROFILE_IMAGE_REDIRECT:
+        # Presigned object storage URL (or AWS_S3_CUSTOM_DOMAIN / CDN); the
+        # redirect is cached for half the signature lifetime
+        response = HttpResponseRedirect(profile_images.url(name))
+        max_age = profile_images.querystring_expire // 2
+        response["Cache-Control"] = f"private, max-age={max_age}"
+        return response
+
+    # Stored objects are immutable (random names), so the name is the ETag.
+    # URLs carrying the current ?v= can be cached for long; bare URLs must
+    # revalidate, which costs a 304 but no object storage round trip.
+    etag = f'"{name}"'
+    last_modified = user.profile_image_updated_at or user.date_joined
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp())
+    )
+    if response is None:
+        try:
+            response = FileResponse(
+                profile_image_cache.open(name), content_type=content_type(name)
+            )
+        except Exception as e:
+            logger.warning("Profile image %s unavailable: %s", name, e)
+            raise Http404("Image not found")
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified.timestamp())
+    if request.GET.get("v") == user.profile_image_version:
+        response["Cache-Control"] = (
+            f"private, max-age={settings.PROFILE_IMAGE_MAX_AGE}, immutable"
+        )
+    else:
+        response["Cache-Control"] = "private, no-cache"
+    return response
 
 
 # Registration View
@@ -61,13 +105,14 @@ class UserRegistrationView(View):
             return redirect("chat")
 
         form = CustomUserCreationForm(request.POST, request.FILES)
-        print(request.POST)
 
         if form.is_valid():
             with transaction.atomic():
                 user = form.save(commit=False)
 
                 user.save()
+                if "profile_image" in request.FILES:
+                    save_profile_image_thumbnails(user, request.FILES["profile_image"])
 
                 login(request, user)
 
@@ -109,7 +154,6 @@ class UserProfileView(LoginRequiredMixin, View):
 
     def post(self, request):
         action = request.POST.get("action")
-        print(request.POST)
         if action == "update_profile":
             user_form = CustomUserChangeForm(
                 request.POST, request.FILES, instance=request.user
@@ -118,6 +162,8 @@ class UserProfileView(LoginRequiredMixin, View):
                 user = user_form.save(commit=False)
 
                 user.save()
+                if "profile_image" in request.FILES:
+                    save_profile_image_thumbnails(user, request.FILES["profile_image"])
 
                 messages.success(request, "Profile updated successfully!")
             else:
@@ -1,5 +1,6 @@
 from pathlib import Path
 from dotenv import load_dotenv
+import json
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -27,6 +28,98 @@ AI_MODEL = os.environ["AI_MODEL"]
 
 SYSTEM_PROMPT = os.environ["SYSTEM_PROMPT"]
 
+# Shared LLM HTTP client: endpoint override, pool limits, HTTP/2 and timeouts
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "")
+LLM_HTTP2 = os.environ.get("LLM_HTTP2", "True") == "True"
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "60"))
+LLM_WRITE_TIMEOUT = float(os.environ.get("LLM_WRITE_TIMEOUT", "10"))
+LLM_POOL_TIMEOUT = float(os.environ.get("LLM_POOL_TIMEOUT", "5"))
+# SDK-level retries per request; the router already retries and fails over
+# (LLM_FAILOVER_ATTEMPTS), so anything above 0 multiplies the attempts
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "0"))
+
+# LLM backends, as a JSON list of {"name", "kind": groq|openai|local, "base_url",
+# "api_key_env", "models": {our name: provider name} or [names], "max_retries"}.
+# Defaults to Groq alone (GROQ_API_KEY, LLM_BASE_URL).
+LLM_BACKENDS = json.loads(os.environ.get("LLM_BACKENDS", "[]")) or [
+    {"name": "groq", "kind": "groq"}
+]
+# Per-model routing, as JSON {model: {"backends": [names], "strategy":
+# "latency"|"ordered", "hedge_after": seconds}}; unlisted models use every
+# backend that serves them
+LLM_ROUTES = json.loads(os.environ.get("LLM_ROUTES", "{}"))
+# Start a duplicate request on the next backend after this many seconds
+# without a first token (0 disables hedging)
+LLM_HEDGE_AFTER = float(os.environ.get("LLM_HEDGE_AFTER", "0"))
+LLM_BACKEND_COOLDOWN = float(os.environ.get("LLM_BACKEND_COOLDOWN", "30"))
+LLM_FAILOVER_ATTEMPTS = int(os.environ.get("LLM_FAILOVER_ATTEMPTS", "3"))
+# Retrying a backend that just failed waits for its Retry-After, or for
+# LLM_RETRY_BACKOFF doubled per failure; longer than LLM_RETRY_MAX_WAIT gives up
+LLM_RETRY_BACKOFF = float(os.environ.get("LLM_RETRY_BACKOFF", "0.5"))
+LLM_RETRY_MAX_WAIT = float(os.environ.get("LLM_RETRY_MAX_WAIT", "8"))
+LLM_LATENCY_ALPHA = float(os.environ.get("LLM_LATENCY_ALPHA", "0.2"))
+
+# Background generations published to Redis Streams (resumable SSE):
+# worker threads, buffer lifetime (s), XREAD block (ms), cancel poll (s)
+GENERATION_WORKERS = int(os.environ.get("GENERATION_WORKERS", "64"))
+GENERATION_STREAM_TIMEOUT = int(os.environ.get("GENERATION_STREAM_TIMEOUT", "600"))
+GENERATION_BLOCK_MS = int(os.environ.get("GENERATION_BLOCK_MS", "15000"))
+GENERATION_CANCEL_CHECK = float(os.environ.get("GENERATION_CANCEL_CHECK", "0.5"))
+
+# Token coalescing: streamed chunks are published once GENERATION_FLUSH_SIZE
+# characters are pending or GENERATION_FLUSH_INTERVAL seconds passed since the
+# last publish (a deadline: pending text goes out even if the model stalls).
+# SSE_COMPACT sends content as raw-text "event: t" frames
+# instead of JSON.
+GENERATION_FLUSH_SIZE = int(os.environ.get("GENERATION_FLUSH_SIZE", "1024"))
+GENERATION_FLUSH_INTERVAL = float(os.environ.get("GENERATION_FLUSH_INTERVAL", "0.02"))
+SSE_COMPACT = os.environ.get("SSE_COMPACT", "False") == "True"
+
+# Streaming assistant replies are saved up front and checkpointed to the DB
+# at most every GENERATION_CHECKPOINT_INTERVAL seconds while generating
+GENERATION_CHECKPOINT_INTERVAL = float(
+    os.environ.get("GENERATION_CHECKPOINT_INTERVAL", "2")
+)
+
+# Generation job queue: web requests enqueue, `manage.py run_generation_workers`
+# runs them (GENERATION_WORKERS threads per process). False runs generations
+# inside the web process instead. Concurrency limits per user and per model
+# (0 = unlimited; GENERATION_MODEL_LIMITS is JSON {model: limit}). Workers
+# renew a running job's GENERATION_JOB_LEASE every third of it; a job whose
+# lease runs out (its worker died) is failed by another worker.
+GENERATION_QUEUE = os.environ.get("GENERATION_QUEUE", "True") == "True"
+GENERATION_USER_CONCURRENCY = int(os.environ.get("GENERATION_USER_CONCURRENCY", "2"))
+GENERATION_MODEL_CONCURRENCY = int(os.environ.get("GENERATION_MODEL_CONCURRENCY", "0"))
+GENERATION_MODEL_LIMITS = json.loads(os.environ.get("GENERATION_MODEL_LIMITS", "{}"))
+GENERATION_JOB_LEASE = int(os.environ.get("GENERATION_JOB_LEASE", "300"))
+
+# Per-user generation limits, checked in Redis before the LLM call (0 = off):
+# requests per minute, concurrent streams (slots held for at most
+# RATE_LIMIT_STREAM_LEASE seconds) and LLM tokens per rolling day
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "True") == "True"
+RATE_LIMIT_REQUESTS_PER_MINUTE = int(
+    os.environ.get("RATE_LIMIT_REQUESTS_PER_MINUTE", "20")
+)
+RATE_LIMIT_CONCURRENT_STREAMS = int(os.environ.get("RATE_LIMIT_CONCURRENT_STREAMS", "3"))
+RATE_LIMIT_TOKENS_PER_DAY = int(os.environ.get("RATE_LIMIT_TOKENS_PER_DAY", "500000"))
+RATE_LIMIT_STREAM_LEASE = int(os.environ.get("RATE_LIMIT_STREAM_LEASE", "600"))
+
+# Metrics (/metrics, Prometheus text format): per-process observations are
+# flushed to Redis every METRICS_FLUSH_INTERVAL seconds. Scrapes need
+# METRICS_TOKEN as a bearer token; without a token the endpoint is closed
+# unless METRICS_PUBLIC opts out (only behind a network that keeps it internal)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "True") == "True"
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_PUBLIC = os.environ.get("METRICS_PUBLIC", "False") == "True"
+
+# Serve chat streams from the async view (requires running webai.asgi)
+ASYNC_STREAM = os.environ.get("ASYNC_STREAM", "False") == "True"
+
 AUTH_USER_MODEL = "users.CustomUser"
 
 LOGIN_URL = "login"  # Name of our login URL pattern
@@ -53,6 +146,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "chat.middleware.MetricsMiddleware",
 ]
 
 ROOT_URLCONF = "webai.urls"
@@ -96,6 +190,22 @@ AWS_S3_ENDPOINT_URL = (
 )
 BUCKET_PROFILE_IMAGES = "profileimages"
 BUCKET_CHAT_UPLOADS = "chatuploads"
+BUCKET_CHAT_ARCHIVES = "chatarchives"
+
+# Profile images: thumbnail sizes (px) and format rendered at upload time,
+# browser cache lifetime for versioned URLs, local disk tier for hot avatars
+# and an opt-in redirect to presigned object storage URLs
+PROFILE_IMAGE_SIZES = [
+    int(size) for size in os.environ.get("PROFILE_IMAGE_SIZES", "64,128,256").split(",")
+]
+PROFILE_IMAGE_FORMAT = os.environ.get("PROFILE_IMAGE_FORMAT", "webp")
+PROFILE_IMAGE_QUALITY = int(os.environ.get("PROFILE_IMAGE_QUALITY", "80"))
+PROFILE_IMAGE_MAX_AGE = int(os.environ.get("PROFILE_IMAGE_MAX_AGE", str(30 * 86400)))
+PROFILE_IMAGE_CACHE_DIR = os.environ.get(
+    "PROFILE_IMAGE_CACHE_DIR", str(BASE_DIR / "data" / "profile_image_cache")
+)
+PROFILE_IMAGE_CACHE_MAX_BYTES = int(os.environ.get("PROFILE_IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+PROFILE_IMAGE_REDIRECT = os.environ.get("PROFILE_IMAGE_REDIRECT", "False") == "True"
 
 CACHES = {
     "default": {
@@ -112,6 +222,122 @@ CACHES = {
     }
 }
 
+# Conversation cache: max messages kept per chat list and idle TTL (seconds)
+CONVERSATION_CACHE_SIZE = int(os.environ.get("CONVERSATION_CACHE_SIZE", "1000"))
+CONVERSATION_CACHE_TIMEOUT = int(os.environ.get("CONVERSATION_CACHE_TIMEOUT", "86400"))
+
+# Sidebar chat list: keyset page sizes and the per-user recent-chats index
+SIDEBAR_PAGE_SIZE = int(os.environ.get("SIDEBAR_PAGE_SIZE", "30"))
+SIDEBAR_PAGE_MAX = int(os.environ.get("SIDEBAR_PAGE_MAX", "100"))
+RECENT_CHATS_SIZE = int(os.environ.get("RECENT_CHATS_SIZE", "100"))
+RECENT_CHATS_TIMEOUT = int(os.environ.get("RECENT_CHATS_TIMEOUT", "86400"))
+
+# Full-text search over chat titles and messages: page size, ranked results
+# kept per query, query terms used, snippet length and how long per-user
+# corpus stats (for IDF) are cached
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", "500"))
+SEARCH_MAX_TERMS = int(os.environ.get("SEARCH_MAX_TERMS", "8"))
+SEARCH_SNIPPET_CHARS = int(os.environ.get("SEARCH_SNIPPET_CHARS", "200"))
+SEARCH_STATS_TIMEOUT = int(os.environ.get("SEARCH_STATS_TIMEOUT", "3600"))
+
+# Incremental message polling: page size and the cached last-message marker
+MESSAGE_POLL_LIMIT = int(os.environ.get("MESSAGE_POLL_LIMIT", "200"))
+MESSAGE_MARKER_TIMEOUT = int(os.environ.get("MESSAGE_MARKER_TIMEOUT", "86400"))
+
+# Prompt context window (tokens) and rolling summaries of evicted turns
+TOKENIZER_ENCODING = os.environ.get("TOKENIZER_ENCODING", "cl100k_base")
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_PROMPT_TOKENS = int(os.environ.get("CONTEXT_PROMPT_TOKENS", "4000"))
+SUMMARY_MAX_TOKENS = int(os.environ.get("SUMMARY_MAX_TOKENS", "400"))
+SUMMARY_INPUT_TOKENS = int(os.environ.get("SUMMARY_INPUT_TOKENS", "4000"))
+SUMMARY_MAX_MESSAGES = int(os.environ.get("SUMMARY_MAX_MESSAGES", "200"))
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", "2"))
+SUMMARY_LOCK_TIMEOUT = int(os.environ.get("SUMMARY_LOCK_TIMEOUT", "120"))
+
+# Upload text extraction: character budget, per-file timeout (seconds, checked
+# between pages, so one slow page can overrun it) and process pool for large
+# PDFs (UPLOAD_EXTRACT_WORKERS=1 disables the pool)
+UPLOAD_MAX_CHARS = int(os.environ.get("UPLOAD_MAX_CHARS", "20000"))
+UPLOAD_EXTRACT_TIMEOUT = float(os.environ.get("UPLOAD_EXTRACT_TIMEOUT", "10"))
+UPLOAD_EXTRACT_WORKERS = int(os.environ.get("UPLOAD_EXTRACT_WORKERS", "1"))
+UPLOAD_PARALLEL_MIN_PAGES = int(os.environ.get("UPLOAD_PARALLEL_MIN_PAGES", "50"))
+
+# Extracted upload text cache (keyed by SHA-256): Redis byte budget with LRU
+# eviction, per-entry size cap, TTL and an optional local disk tier
+UPLOAD_CACHE_MAX_BYTES = int(os.environ.get("UPLOAD_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+UPLOAD_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("UPLOAD_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+UPLOAD_CACHE_TIMEOUT = int(os.environ.get("UPLOAD_CACHE_TIMEOUT", str(7 * 86400)))
+UPLOAD_CACHE_DIR = os.environ.get("UPLOAD_CACHE_DIR", "")
+UPLOAD_CACHE_DISK_MAX_BYTES = int(os.environ.get("UPLOAD_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Background upload pipeline: local spool directory, worker threads, retry
+# limit for the outbox and multipart thresholds for object storage. The
+# spool must be a persistent volume shared with the flush_uploads process
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR", str(BASE_DIR / "data" / "upload_spool"))
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", "4"))
+UPLOAD_MAX_ATTEMPTS = int(os.environ.get("UPLOAD_MAX_ATTEMPTS", "5"))
+UPLOAD_MULTIPART_THRESHOLD = int(os.environ.get("UPLOAD_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+UPLOAD_MULTIPART_CHUNKSIZE = int(os.environ.get("UPLOAD_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024)))
+UPLOAD_MULTIPART_CONCURRENCY = int(os.environ.get("UPLOAD_MULTIPART_CONCURRENCY", "4"))
+
+# Cold chat archive: `manage.py archive_chats` moves the messages of chats
+# idle for ARCHIVE_AFTER_DAYS days into zstd JSONL objects (compression
+# level, rows per batch); opening an archived chat restores them, and
+# ARCHIVE_INDEX_WORKERS threads rebuild their search postings
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_COMPRESSION_LEVEL = int(os.environ.get("ARCHIVE_COMPRESSION_LEVEL", "10"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_INDEX_WORKERS = int(os.environ.get("ARCHIVE_INDEX_WORKERS", "1"))
+
+# Chat export/import as NDJSON: rows per keyset page when exporting,
+# messages per bulk insert (and transaction) when importing
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "2000"))
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "5000"))
+
+# Attachment downloads: chunk size when streamed through Django, or
+# redirects to presigned object storage URLs valid ATTACHMENT_URL_EXPIRE
+# seconds (the storage endpoint must then be reachable by browsers)
+ATTACHMENT_CHUNK_SIZE = int(os.environ.get("ATTACHMENT_CHUNK_SIZE", str(256 * 1024)))
+ATTACHMENT_REDIRECT = os.environ.get("ATTACHMENT_REDIRECT", "False") == "True"
+ATTACHMENT_URL_EXPIRE = int(os.environ.get("ATTACHMENT_URL_EXPIRE", "300"))
+
+# Local embeddings (fastembed model name, or feature hashing when unset/missing)
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "")
+EMBEDDING_HASH_DIM = int(os.environ.get("EMBEDDING_HASH_DIM", "512"))
+
+# Retrieval over uploaded documents: text extracted per file and its
+# extraction timeout (both off the request path, on RAG_INDEX_WORKERS
+# threads; the upload turn itself inlines up to UPLOAD_MAX_CHARS until the
+# chunks are indexed), chunk size and overlap (tokens), and per turn the
+# top-k chunks scoring at least RAG_MIN_SCORE (cosine; hashed embeddings of
+# long chunks score low, so raise it only with a fastembed model), within
+# RAG_CONTEXT_TOKENS. False pastes the extracted text into the prompt of the
+# upload turn instead.
+RAG_ENABLED = os.environ.get("RAG_ENABLED", "True") == "True"
+RAG_MAX_CHARS = int(os.environ.get("RAG_MAX_CHARS", "500000"))
+RAG_EXTRACT_TIMEOUT = float(os.environ.get("RAG_EXTRACT_TIMEOUT", "120"))
+RAG_INDEX_WORKERS = int(os.environ.get("RAG_INDEX_WORKERS", "2"))
+RAG_CHUNK_TOKENS = int(os.environ.get("RAG_CHUNK_TOKENS", "300"))
+RAG_CHUNK_OVERLAP = int(os.environ.get("RAG_CHUNK_OVERLAP", "50"))
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", "6"))
+RAG_CONTEXT_TOKENS = int(os.environ.get("RAG_CONTEXT_TOKENS", "1500"))
+RAG_MIN_SCORE = float(os.environ.get("RAG_MIN_SCORE", "0"))
+
+# Opt-in response cache for repeated prompts (exact + similarity tiers).
+# Keyed by the whole normalized conversation, which is cached only while it
+# holds at most RESPONSE_CACHE_WINDOW user/assistant messages (the default 2
+# covers a new chat's opening question, saved by create_chat and again by the
+# stream). Entries are per user unless RESPONSE_CACHE_SHARED (one FAQ cache
+# for everyone).
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "False") == "True"
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get("RESPONSE_CACHE_TIMEOUT", str(7 * 86400)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.92"))
+RESPONSE_CACHE_WINDOW = int(os.environ.get("RESPONSE_CACHE_WINDOW", "2"))
+RESPONSE_CACHE_SHARED = os.environ.get("RESPONSE_CACHE_SHARED", "False") == "True"
+RESPONSE_CACHE_MAX_PROMPT_CHARS = int(os.environ.get("RESPONSE_CACHE_MAX_PROMPT_CHARS", "2000"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -3,9 +3,13 @@
 from django.urls import path, include
 from django.views.generic import RedirectView
 
+# Local app imports
+from chat.views import metrics_view
+
 urlpatterns = [
     # path("admin/", admin.site.urls),
     path("", RedirectView.as_view(url="chat/", permanent=True), name="chat"),
     path("chat/", include("chat.urls")),
     path("users/", include("users.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]